@@ -1,6 +1,6 @@
 {
     'name': 'AI Assistant for Odoo - Chat Whisperer Integration',
-    'version': '17.0.1.0.0',
+    'version': '17.0.1.5.0',
     'category': 'Productivity',  # Changed from 'Tools'
     'summary': 'AI-powered assistant with built-in credit system',
     'description': """
@@ -54,7 +54,7 @@ Start chatting immediately after installation!
         'static/description/screenshot_3.png',
     ],
     
-    'depends': ['base', 'web'],  # Minimal dependencies
+    'depends': ['base', 'web', 'bus'],  # Minimal dependencies
     'external_dependencies': {
         'python': ['requests'],  # Only essential dependencies
     },
@@ -67,6 +67,9 @@ Start chatting immediately after installation!
         'views/ai_conversation_views.xml',
         'views/ai_user_credit_views.xml',
         'views/menu_views.xml',
+        'views/ai_bulk_job_views.xml',
+        'views/ai_retention_policy_views.xml',
+        'views/ai_usage_event_views.xml',
         'views/ai_chat_template.xml',
     ],
     
@@ -1,19 +1,61 @@
-from odoo import http
-from odoo.http import request
+from odoo import http, api
+from odoo.http import request, Response, content_disposition
+from odoo.exceptions import UserError
+from odoo.tools.profiler import Profiler
+import functools
+import hmac
 import json
 import logging
-from datetime import datetime, timedelta
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from ..tools import health
+from ..tools.metrics import inc, observe, observe_route
+from ..tools.provider_client import ProviderError
+from ..tools.provider_router import get_provider_router
+from ..tools.request_trace import current_trace, phase
+from ..tools.keyset import keyset_search
+from ..tools.report_export import REPORT_FORMATS, csv_error_marker, iter_csv, iter_file, write_xlsx
 
 _logger = logging.getLogger(__name__)
 
+
+def sampled_profile(route):
+    """Run the Odoo profiler on a share of the calls, set in percent by ai_assistant.profile_sample_rate
+
+    Profiles are saved as ir.profile records (Settings > Technical >
+    Profiling): SQL queries and periodic stack samples, viewable as a flame graph.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                rate = float(request.env['ai.assistant.config'].get_config_snapshot().get_param(
+                    'ai_assistant.profile_sample_rate', '0') or 0)
+            except (TypeError, ValueError):
+                rate = 0.0
+            if rate <= 0 or random.random() * 100 >= rate:
+                return method(self, *args, **kwargs)
+            with Profiler(db=request.db, collectors=['sql', 'traces_async'],
+                          description=f"AI Assistant {route} (uid {request.env.uid})"):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class AIChatController(http.Controller):
     
     @http.route('/ai_assistant/chat/send_message', type='json', auth='user', methods=['POST'], csrf=False)
+    @observe_route('send_message')
+    @sampled_profile('send_message')
     def send_message(self, conversation_id, message, **kwargs):
         """API endpoint for sending messages to AI"""
         try:
             # Rate limiting check
             if not self._check_rate_limit():
+                inc('ai_rate_limit_rejections_total', route='send_message')
                 return {
                     'error': True,
                     'message': 'Rate limit exceeded. Please wait before sending another message.',
@@ -35,18 +77,43 @@ class AIChatController(http.Controller):
                     'message': 'Access denied to conversation'
                 }
             
-            # Send message to AI
-            result = request.env['ai.message'].send_message_to_ai(conversation_id, message.strip())
+            # Reject before spending a provider call
+            preflight = self._preflight_check(conversation, message.strip())
+            if not preflight['allowed']:
+                inc('ai_credit_rejections_total', route='send_message')
+                return {
+                    'error': True,
+                    'message': preflight['reason'],
+                    'insufficient_credits': True,
+                    'estimate': preflight['estimate']
+                }
             
-            # Log the interaction
+            # Send message to AI, either inline or through the background dispatcher
+            if self._use_async_send(kwargs.get('async_mode')):
+                result = request.env['ai.message'].send_message_async(conversation_id, message.strip())
+            else:
+                result = request.env['ai.message'].send_message_to_ai(conversation_id, message.strip())
+            
+            # Log the interaction; the async reply is tied to the user message by its dispatch job
             self._log_api_usage('send_message', {
                 'conversation_id': conversation_id,
+                'message_id': (result.get('ai_message') or result.get('user_message') or {}).get('id'),
                 'message_length': len(message),
-                'success': not result.get('error', False)
+                'async': bool(result.get('pending')),
+                'success': not result.get('error', False),
+                'timings': current_trace().timings(),
             })
             
             return result
             
+        except UserError as e:
+            # The balance ran out after the preflight estimate: nothing was stored
+            inc('ai_credit_rejections_total', route='send_message')
+            return {
+                'error': True,
+                'message': str(e),
+                'insufficient_credits': True
+            }
         except Exception as e:
             _logger.error(f"Error in chat controller send_message: {str(e)}")
             return {
@@ -55,41 +122,43 @@ class AIChatController(http.Controller):
             }
 
     @http.route('/ai_assistant/conversations', type='json', auth='user', methods=['GET'], csrf=False)
-    def get_conversations(self, limit=50, offset=0, **kwargs):
-        """Get user's conversations with pagination"""
+    @observe_route('get_conversations')
+    def get_conversations(self, limit=50, cursor=None, with_total=False, **kwargs):
+        """Get user's conversations, most recently active first, one keyset page at a time"""
         try:
             # Validate parameters
-            limit = min(int(limit), 100)  # Max 100 conversations per request
-            offset = max(int(offset), 0)
+            limit = max(min(int(limit), 100), 1)  # Max 100 conversations per request
             
             domain = [('user_id', '=', request.env.user.id)]
             
-            conversations = request.env['ai.conversation'].search(
-                domain,
-                limit=limit,
-                offset=offset,
-                order='last_message_date desc, create_date desc'
+            conversations, next_cursor = keyset_search(
+                request.env['ai.conversation'], domain, 'last_message_date', limit, cursor
             )
             
-            total_count = request.env['ai.conversation'].search_count(domain)
-            
             result = {
                 'conversations': conversations.read([
                     'id', 'title', 'last_message_date', 'message_count', 
                     'total_credits_used', 'is_active', 'create_date'
                 ]),
-                'total_count': total_count,
-                'has_more': (offset + limit) < total_count
+                'next_cursor': next_cursor,
+                'has_more': bool(next_cursor)
             }
+            if with_total:
+                result['total_count'] = request.env['ai.conversation'].search_count(domain)
             
             self._log_api_usage('get_conversations', {
                 'count': len(result['conversations']),
                 'limit': limit,
-                'offset': offset
+                'cursor': bool(cursor)
             })
             
             return result
             
+        except ValueError as e:
+            return {
+                'error': True,
+                'message': str(e)
+            }
         except Exception as e:
             _logger.error(f"Error getting conversations: {str(e)}")
             return {
@@ -99,12 +168,12 @@ class AIChatController(http.Controller):
 
     @http.route('/ai_assistant/conversation/<int:conversation_id>/messages', 
                 type='json', auth='user', methods=['GET'], csrf=False)
-    def get_conversation_messages(self, conversation_id, limit=50, offset=0, **kwargs):
-        """Get messages for a specific conversation with pagination"""
+    @observe_route('get_conversation_messages')
+    def get_conversation_messages(self, conversation_id, limit=50, cursor=None, with_total=False, **kwargs):
+        """Get messages for a specific conversation, oldest first, one keyset page at a time"""
         try:
             # Validate parameters
-            limit = min(int(limit), 100)  # Max 100 messages per request
-            offset = max(int(offset), 0)
+            limit = max(min(int(limit), 100), 1)  # Max 100 messages per request
             
             # Verify access to conversation
             conversation = request.env['ai.conversation'].browse(conversation_id)
@@ -116,24 +185,22 @@ class AIChatController(http.Controller):
             
             # Get messages
             domain = [('conversation_id', '=', conversation_id)]
-            messages = request.env['ai.message'].search(
-                domain,
-                limit=limit,
-                offset=offset,
-                order='create_date asc'
+            messages, next_cursor = keyset_search(
+                request.env['ai.message'], domain, 'create_date', limit, cursor, descending=False
             )
             
-            total_count = request.env['ai.message'].search_count(domain)
-            
             result = {
                 'conversation': conversation.read(['id', 'title', 'is_active'])[0],
                 'messages': messages.read([
                     'id', 'content', 'is_user_message', 'create_date', 
                     'tokens_used', 'response_time', 'credit_cost', 'error_message'
                 ]),
-                'total_count': total_count,
-                'has_more': (offset + limit) < total_count
+                'next_cursor': next_cursor,
+                'has_more': bool(next_cursor)
             }
+            if with_total:
+                # Stored counter, no COUNT over the messages
+                result['total_count'] = conversation.message_count
             
             self._log_api_usage('get_messages', {
                 'conversation_id': conversation_id,
@@ -142,6 +209,11 @@ class AIChatController(http.Controller):
             
             return result
             
+        except ValueError as e:
+            return {
+                'error': True,
+                'message': str(e)
+            }
         except Exception as e:
             _logger.error(f"Error getting messages: {str(e)}")
             return {
@@ -150,6 +222,7 @@ class AIChatController(http.Controller):
             }
 
     @http.route('/ai_assistant/conversation/create', type='json', auth='user', methods=['POST'], csrf=False)
+    @observe_route('create_conversation')
     def create_conversation(self, title=None, **kwargs):
         """Create a new conversation"""
         try:
@@ -159,7 +232,7 @@ class AIChatController(http.Controller):
                 ('is_active', '=', True)
             ])
             
-            max_conversations = int(request.env['ir.config_parameter'].sudo().get_param(
+            max_conversations = int(request.env['ai.assistant.config'].get_config_snapshot().get_param(
                 'ai_assistant.max_conversations_per_user', '50'
             ))
             
@@ -192,6 +265,7 @@ class AIChatController(http.Controller):
 
     @http.route('/ai_assistant/conversation/<int:conversation_id>/archive', 
                 type='json', auth='user', methods=['POST'], csrf=False)
+    @observe_route('archive_conversation')
     def archive_conversation(self, conversation_id, **kwargs):
         """Archive a conversation"""
         try:
@@ -220,6 +294,7 @@ class AIChatController(http.Controller):
             }
 
     @http.route('/ai_assistant/user/credits', type='json', auth='user', methods=['GET'], csrf=False)
+    @observe_route('get_user_credits')
     def get_user_credits(self, **kwargs):
         """Get user's credit information"""
         try:
@@ -245,12 +320,12 @@ class AIChatController(http.Controller):
 
     @http.route('/ai_assistant/user/usage_history', 
                 type='json', auth='user', methods=['GET'], csrf=False)
-    def get_usage_history(self, days=30, limit=50, offset=0, **kwargs):
-        """Get user's usage history"""
+    @observe_route('get_usage_history')
+    def get_usage_history(self, days=30, limit=50, cursor=None, with_total=False, **kwargs):
+        """Get user's usage history, newest first, one keyset page at a time"""
         try:
             days = min(int(days), 365)  # Max 1 year
-            limit = min(int(limit), 100)
-            offset = max(int(offset), 0)
+            limit = max(min(int(limit), 100), 1)
             
             date_from = datetime.now() - timedelta(days=days)
             
@@ -259,26 +334,28 @@ class AIChatController(http.Controller):
                 ('create_date', '>=', date_from)
             ]
             
-            transactions = request.env['ai.credit.transaction'].search(
-                domain,
-                limit=limit,
-                offset=offset,
-                order='create_date desc'
+            transactions, next_cursor = keyset_search(
+                request.env['ai.credit.transaction'], domain, 'create_date', limit, cursor
             )
             
-            total_count = request.env['ai.credit.transaction'].search_count(domain)
-            
             result = {
                 'transactions': transactions.read([
                     'id', 'create_date', 'transaction_type', 'amount',
                     'description', 'balance_after'
                 ]),
-                'total_count': total_count,
-                'has_more': (offset + limit) < total_count
+                'next_cursor': next_cursor,
+                'has_more': bool(next_cursor)
             }
+            if with_total:
+                result['total_count'] = request.env['ai.credit.transaction'].search_count(domain)
             
             return result
             
+        except ValueError as e:
+            return {
+                'error': True,
+                'message': str(e)
+            }
         except Exception as e:
             _logger.error(f"Error getting usage history: {str(e)}")
             return {
@@ -287,18 +364,17 @@ class AIChatController(http.Controller):
             }
 
     @http.route('/ai_assistant/system/status', type='json', auth='user', methods=['GET'], csrf=False)
+    @observe_route('get_system_status')
     def get_system_status(self, **kwargs):
         """Get AI system status"""
         try:
             # Get active configuration
             try:
-                config = request.env['ai.assistant.config'].get_active_config()
+                config = request.env['ai.assistant.config'].get_active_snapshot()
                 system_status = {
                     'status': 'active',
-                    'provider': config.provider,
+                    'provider': config.name,
                     'model': config.model_name,
-                    'api_status': config.api_status,
-                    'last_api_call': config.last_api_call.isoformat() if config.last_api_call else None
                 }
             except Exception:
                 system_status = {
@@ -325,6 +401,7 @@ class AIChatController(http.Controller):
             }
 
     @http.route('/ai_assistant/feedback', type='json', auth='user', methods=['POST'], csrf=False)
+    @observe_route('submit_feedback')
     def submit_feedback(self, message_id=None, rating=None, feedback=None, **kwargs):
         """Submit feedback for AI responses"""
         try:
@@ -343,20 +420,12 @@ class AIChatController(http.Controller):
                         'message': 'Access denied to message'
                     }
             
-            # Create feedback record (you could create a feedback model)
-            feedback_data = {
-                'user_id': request.env.user.id,
+            # Stored as a usage event, queryable next to the other interactions
+            self._log_api_usage('submit_feedback', {
                 'message_id': message_id,
                 'rating': rating,
                 'feedback': feedback,
-                'timestamp': datetime.now(),
-                'ip_address': request.httprequest.environ.get('REMOTE_ADDR')
-            }
-            
-            # Log feedback for analysis
-            _logger.info(f"User feedback received: {json.dumps(feedback_data, default=str)}")
-            
-            self._log_api_usage('submit_feedback', feedback_data)
+            })
             
             return {'success': True, 'message': 'Thank you for your feedback!'}
             
@@ -367,89 +436,459 @@ class AIChatController(http.Controller):
                 'message': 'Failed to submit feedback'
             }
 
-    def _check_rate_limit(self):
-        """Check if user has exceeded rate limits"""
+    @http.route('/ai_assistant/chat/stream', type='http', auth='user', methods=['POST'], csrf=False)
+    @observe_route('stream_message')
+    @sampled_profile('stream_message')
+    def stream_message(self, **kwargs):
+        """Relay the AI reply as server-sent events while the provider generates it"""
         try:
-            user_id = request.env.user.id
-            rate_limit = int(request.env['ir.config_parameter'].sudo().get_param(
-                'ai_assistant.rate_limit_per_minute', '10'
-            ))
-            
-            # Use session to track rate limiting
-            session = request.session
-            current_time = datetime.now()
-            
-            # Initialize rate limit data if not exists
-            if 'ai_rate_limit' not in session:
-                session['ai_rate_limit'] = {
-                    'requests': [],
-                    'user_id': user_id
+            params = request.httprequest.get_json(silent=True) or kwargs
+            conversation_id = int(params.get('conversation_id') or 0)
+            message = (params.get('message') or '').strip()
+
+            if not self._check_rate_limit():
+                inc('ai_rate_limit_rejections_total', route='stream_message')
+                return self._json_response({
+                    'error': True,
+                    'message': 'Rate limit exceeded. Please wait before sending another message.',
+                    'rate_limited': True
+                })
+
+            if not conversation_id or not message:
+                return self._json_response({
+                    'error': True,
+                    'message': 'Invalid conversation ID or empty message'
+                })
+
+            conversation = request.env['ai.conversation'].browse(conversation_id)
+            if not conversation.exists() or conversation.user_id.id != request.env.user.id:
+                return self._json_response({
+                    'error': True,
+                    'message': 'Access denied to conversation'
+                })
+
+            preflight = self._preflight_check(conversation, message)
+            if not preflight['allowed']:
+                inc('ai_credit_rejections_total', route='stream_message')
+                return self._json_response({
+                    'error': True,
+                    'message': preflight['reason'],
+                    'insufficient_credits': True,
+                    'estimate': preflight['estimate']
+                })
+
+            # Async mode: queue it like send_message, the reply is pushed over the bus
+            if self._use_async_send(params.get('async_mode')):
+                result = request.env['ai.message'].send_message_async(conversation_id, message)
+                self._log_api_usage('stream_message', {
+                    'conversation_id': conversation_id,
+                    'message_id': result['user_message']['id'],
+                    'message_length': len(message),
+                    'async': bool(result.get('pending')),
+                    'success': not result.get('error', False),
+                    'timings': current_trace().timings(),
+                })
+                return self._json_response(result)
+
+            # The user message is committed with this request; the reply is
+            # persisted from the stream itself once the provider is done
+            with phase('db_write'):
+                user_message = request.env['ai.message'].create({
+                    'conversation_id': conversation.id,
+                    'role': 'user',
+                    'content': message,
+                })
+            config = request.env['ai.assistant.config'].get_active_snapshot()
+            with phase('context'):
+                context = conversation._build_context(before_message=user_message)
+            payload = {
+                "message": message,
+                "chatbotId": config.chatbot_id,
+                "userId": str(request.env.user.id),
+                "conversationId": str(conversation.id),
+            }
+            if context['text']:
+                payload["context"] = context['text']
+            client = get_provider_router(request.env, hedge=False)
+            cache_key = request.env['ai.message']._reply_cache_key(message, config.chatbot_id, context['fingerprint'])
+            with phase('cache'):
+                cached = request.env['ai.message']._get_cached_reply(cache_key)
+
+            event = {
+                'conversation_id': conversation_id,
+                'message_length': len(message),
+                'cache_hit': cached is not None,
+            }
+            if cached is not None:
+                with phase('db_write'):
+                    ai_message = request.env['ai.message'].create({
+                        'conversation_id': conversation.id,
+                        'role': 'assistant',
+                        'content': cached,
+                    })
+                    ai_message._record_cache_hit()
+                self._log_api_usage('stream_message', dict(
+                    event, message_id=ai_message.id, success=True, timings=current_trace().timings()))
+                stream = self._stream_cached_reply(user_message._prepare_bus_payload(), ai_message._prepare_bus_payload())
+            else:
+                # Logged by the stream once the reply is saved, with the provider phase in the timings
+                stream = self._stream_reply(
+                    request.env.registry, request.env.uid, conversation.id,
+                    user_message._prepare_bus_payload(), client, payload, cache_key,
+                    trace=current_trace(), event=dict(self._client_info(), data=event)
+                )
+            return Response(stream, mimetype='text/event-stream', direct_passthrough=True, headers=[
+                ('Cache-Control', 'no-cache'),
+                ('X-Accel-Buffering', 'no'),
+            ])
+
+        except Exception as e:
+            _logger.error(f"Error in chat controller stream_message: {str(e)}")
+            return self._json_response({
+                'error': True,
+                'message': 'An unexpected error occurred. Please try again.'
+            })
+
+    def _stream_reply(self, registry, uid, conversation_id, user_message, client, payload, cache_key=None,
+                      trace=None, event=None):
+        """Generator behind stream_message; runs after the request cursor is closed
+
+        The request trace is no longer current here: the provider and
+        saving phases are added to ``trace`` directly, and the usage
+        ``event`` (``data`` plus ``log_event`` keywords) is logged with the
+        reply it describes.
+        """
+        yield self._sse('user_message', user_message)
+
+        started = time.perf_counter()
+        chunks = []
+        error = None
+        try:
+            for chunk in client.stream_chat(payload):
+                if chunk:
+                    chunks.append(chunk)
+                    yield self._sse('token', {'text': chunk})
+        except ProviderError as e:
+            error = str(e)
+            _logger.error(f"Error streaming AI reply: {error}")
+
+        if trace is not None:
+            trace.add('provider', time.perf_counter() - started)
+
+        reply = ''.join(chunks)
+        if not reply:
+            reply = f"(Error contacting ChatWhisperer: {error})" if error else "(No reply received)"
+
+        try:
+            with registry.cursor() as cr:
+                saving_started = time.perf_counter()
+                env = api.Environment(cr, uid, {})
+                usage = env['ai.message']._reply_usage(
+                    payload['message'], reply, payload.get('context')) if chunks and not error else {}
+                ai_message = env['ai.message'].create(dict(usage, **{
+                    'conversation_id': conversation_id,
+                    'role': 'assistant',
+                    'content': reply,
+                    'response_time': time.perf_counter() - started,
+                }))
+                ai_message._charge_reply()
+                result = ai_message._prepare_bus_payload()
+                if chunks and not error:
+                    env['ai.message']._store_cached_reply(cache_key, reply)
+                    env['ai.message']._count_tokens_consumed('stream', payload['message'], reply, payload.get('context'))
+                if trace is not None:
+                    trace.add('db_write', time.perf_counter() - saving_started)
+                if event is not None:
+                    event = dict(event)
+                    data = dict(event.pop('data'), message_id=ai_message.id, success=not error,
+                                timings=trace.timings() if trace is not None else None)
+                    env['ai.usage.event'].log_event('stream_message', data, **event)
+        except Exception as e:
+            _logger.error(f"Error saving streamed AI reply: {str(e)}")
+            observe('ai_send_message_duration_seconds', time.perf_counter() - started, mode='stream', outcome='error')
+            yield self._sse('error', {'error': True, 'message': 'Failed to save the AI reply'})
+            return
+
+        observe('ai_send_message_duration_seconds', time.perf_counter() - started,
+                mode='stream', outcome='error' if error else 'ok')
+        yield self._sse('done', {'error': bool(error), 'ai_message': result})
+
+    def _stream_cached_reply(self, user_message, ai_message):
+        """Replay a cached reply through the same event sequence as a live stream"""
+        yield self._sse('user_message', user_message)
+        yield self._sse('token', {'text': ai_message['content']})
+        yield self._sse('done', {'error': False, 'ai_message': ai_message})
+
+    def _sse(self, event, data):
+        """Format one server-sent event"""
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+    def _json_response(self, data, status=200):
+        return request.make_response(json.dumps(data), headers=[('Content-Type', 'application/json')],
+                                     status=status)
+
+    @http.route('/ai_assistant/chat/job/<int:job_id>', type='json', auth='user', methods=['POST'], csrf=False)
+    @observe_route('get_dispatch_job')
+    def get_dispatch_job(self, job_id, **kwargs):
+        """Poll the status of an asynchronous send (fallback when the bus is unavailable)"""
+        try:
+            job = request.env['ai.dispatch.job'].sudo().browse(job_id)
+            if not job.exists() or job.user_id.id != request.env.user.id:
+                return {
+                    'error': True,
+                    'message': 'Access denied to job'
                 }
             
-            rate_data = session['ai_rate_limit']
+            result = {
+                'job_id': job.id,
+                'state': job.state,
+                'pending': job.state in ('queued', 'running'),
+            }
+            if job.reply_message_id:
+                result['ai_message'] = job.reply_message_id._prepare_bus_payload()
+            if job.state == 'failed':
+                result['error'] = True
+                result['message'] = 'The AI reply could not be generated. Please try again.'
             
-            # Clean old requests (older than 1 minute)
-            cutoff_time = current_time - timedelta(minutes=1)
-            rate_data['requests'] = [
-                req_time for req_time in rate_data['requests'] 
-                if datetime.fromisoformat(req_time) > cutoff_time
-            ]
+            return result
             
-            # Check if rate limit exceeded
-            if len(rate_data['requests']) >= rate_limit:
-                return False
+        except Exception as e:
+            _logger.error(f"Error getting dispatch job: {str(e)}")
+            return {
+                'error': True,
+                'message': 'Failed to load job status'
+            }
+
+    def _use_async_send(self, async_mode=None):
+        """Whether send_message should enqueue instead of calling the provider inline"""
+        if async_mode is not None:
+            return bool(async_mode)
+        return request.env['ai.assistant.config'].get_config_snapshot().get_param(
+            'ai_assistant.async_send_mode', 'False'
+        ) == 'True'
+
+    @http.route('/ai_assistant/bulk/create', type='json', auth='user', methods=['POST'], csrf=False)
+    @observe_route('create_bulk_job')
+    def create_bulk_job(self, prompts=None, res_model=None, res_ids=None, template=None,
+                        name=None, concurrency=None, **kwargs):
+        """Queue a bulk prompt job, from explicit prompts or a template over records (managers)"""
+        try:
+            if not request.env.user.has_group('ai_assistant.group_ai_assistant_manager'):
+                return {
+                    'error': True,
+                    'message': 'Access denied'
+                }
+            
+            BulkJob = request.env['ai.bulk.job']
+            if prompts:
+                job = BulkJob.create_job(prompts, name=name, concurrency=concurrency)
+            elif res_model and res_ids and template:
+                job = BulkJob.create_job_from_records(res_model, res_ids, template, name=name, concurrency=concurrency)
+            else:
+                return {
+                    'error': True,
+                    'message': 'Provide prompts, or res_model, res_ids and template'
+                }
             
-            # Add current request
-            rate_data['requests'].append(current_time.isoformat())
-            session['ai_rate_limit'] = rate_data
+            self._log_api_usage('create_bulk_job', {
+                'job_id': job.id,
+                'item_count': job.item_count,
+            })
             
-            return True
+            return {
+                'job_id': job.id,
+                'state': job.state,
+                'item_count': job.item_count
+            }
             
         except Exception as e:
-            _logger.error(f"Error checking rate limit: {str(e)}")
-            return True  # Allow request if rate limiting fails
+            _logger.error(f"Error creating bulk job: {str(e)}")
+            return {
+                'error': True,
+                'message': 'Failed to create bulk job'
+            }
 
-    def _get_rate_limit_info(self):
-        """Get current rate limit information for user"""
+    @http.route('/ai_assistant/bulk/<int:job_id>', type='json', auth='user', methods=['POST'], csrf=False)
+    @observe_route('get_bulk_job')
+    def get_bulk_job(self, job_id, include_items=False, limit=100, cursor=None, **kwargs):
+        """Progress, throughput and optionally per-item results of a bulk job"""
         try:
-            session = request.session
-            rate_limit = int(request.env['ir.config_parameter'].sudo().get_param(
-                'ai_assistant.rate_limit_per_minute', '10'
-            ))
+            if not request.env.user.has_group('ai_assistant.group_ai_assistant_manager'):
+                return {
+                    'error': True,
+                    'message': 'Access denied'
+                }
             
-            if 'ai_rate_limit' not in session:
+            job = request.env['ai.bulk.job'].browse(job_id)
+            if not job.exists():
                 return {
-                    'limit': rate_limit,
-                    'used': 0,
-                    'remaining': rate_limit,
-                    'reset_time': None
+                    'error': True,
+                    'message': 'Bulk job not found'
                 }
             
-            rate_data = session['ai_rate_limit']
-            current_time = datetime.now()
-            cutoff_time = current_time - timedelta(minutes=1)
+            result = {
+                'job': job.read([
+                    'name', 'state', 'item_count', 'done_count', 'failed_count',
+                    'credits_charged', 'run_seconds', 'items_per_minute',
+                    'date_started', 'date_done', 'error_message'
+                ])[0]
+            }
+            if include_items:
+                limit = max(min(int(limit), 500), 1)
+                items = request.env['ai.bulk.job.item'].search(
+                    [('job_id', '=', job.id), ('id', '>', int(cursor or 0))], order='id', limit=limit + 1
+                )
+                result['items'] = items[:limit].read([
+                    'sequence', 'res_model', 'res_id', 'state', 'response',
+                    'error_message', 'tokens_used', 'credit_cost', 'response_time'
+                ])
+                result['next_cursor'] = items[limit - 1].id if len(items) > limit else None
             
-            # Count recent requests
-            recent_requests = [
-                req_time for req_time in rate_data['requests'] 
-                if datetime.fromisoformat(req_time) > cutoff_time
-            ]
+            return result
+            
+        except Exception as e:
+            _logger.error(f"Error getting bulk job: {str(e)}")
+            return {
+                'error': True,
+                'message': 'Failed to load bulk job'
+            }
+
+    @http.route('/ai_assistant/report/export', type='http', auth='user', methods=['GET'], csrf=False)
+    @observe_route('export_report')
+    def export_report(self, days=30, **kwargs):
+        """Stream the business report as CSV or XLSX (managers)"""
+        try:
+            if not request.env.user.has_group('ai_assistant.group_ai_assistant_manager'):
+                return self._json_response({
+                    'error': True,
+                    'message': 'Access denied'
+                })
             
-            used = len(recent_requests)
-            remaining = max(0, rate_limit - used)
+            report_format = kwargs.get('format', 'csv')
+            if report_format not in REPORT_FORMATS:
+                return self._json_response({
+                    'error': True,
+                    'message': f"Unsupported format, use one of: {', '.join(REPORT_FORMATS)}"
+                })
+            days = max(int(days), 1)
+            mimetype, extension = REPORT_FORMATS[report_format]
+            filename = f"ai_business_report_{date.today()}_{days}d.{extension}"
+            
+            self._log_api_usage('export_report', {
+                'days': days,
+                'format': report_format,
+            })
             
-            # Calculate reset time (when oldest request expires)
-            reset_time = None
-            if recent_requests:
-                oldest_request = min(datetime.fromisoformat(req) for req in recent_requests)
-                reset_time = (oldest_request + timedelta(minutes=1)).isoformat()
+            if report_format == 'csv':
+                stream = self._stream_csv_report(request.env.registry, request.env.uid, days)
+            else:
+                # A workbook is a zip archive, complete only once closed: render it before
+                # answering, so a failure is still an error response and not a corrupt file
+                report_file = tempfile.TemporaryFile()
+                try:
+                    write_xlsx(request.env['ai.business.analytics']._iter_report_sections(days), report_file)
+                except Exception:
+                    report_file.close()
+                    raise
+                stream = self._stream_file(report_file)
+            return Response(stream, mimetype=mimetype, direct_passthrough=True, headers=[
+                ('Content-Disposition', content_disposition(filename)),
+                ('X-Accel-Buffering', 'no'),
+            ])
             
+        except Exception as e:
+            _logger.error(f"Error exporting business report: {str(e)}")
+            return self._json_response({
+                'error': True,
+                'message': 'Failed to export the report'
+            }, status=500)
+
+    def _stream_csv_report(self, registry, uid, days):
+        """Generator behind export_report; reads from its own cursor, the request one being closed"""
+        try:
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, {})
+                yield from iter_csv(env['ai.business.analytics']._iter_report_sections(days))
+        except Exception as e:
+            _logger.error(f"Error streaming business report: {str(e)}")
+            # The 200 is already sent: mark the file as incomplete, then abort the connection
+            yield csv_error_marker('Report generation failed, this file is incomplete')
+            raise
+
+    def _stream_file(self, fileobj):
+        """Yield a rendered temporary file, closing it once sent"""
+        try:
+            yield from iter_file(fileobj)
+        finally:
+            fileobj.close()
+
+    @http.route('/ai_assistant/report/shared/<int:attachment_id>', type='http', auth='user', methods=['GET'], csrf=False)
+    @observe_route('download_shared_report')
+    def download_shared_report(self, attachment_id, **kwargs):
+        """Download a report rendered by the weekly cron (managers)"""
+        if not request.env.user.has_group('ai_assistant.group_ai_assistant_manager'):
+            return request.not_found()
+        attachment = request.env['ir.attachment'].sudo().browse(attachment_id)
+        if not attachment.exists() or attachment.res_model != 'ai.business.analytics':
+            return request.not_found()
+        return request.env['ir.binary']._get_stream_from(attachment).get_response(as_attachment=True)
+
+    @http.route('/ai_assistant/chat/preview', type='json', auth='user', methods=['POST'], csrf=False)
+    @observe_route('preview_message')
+    def preview_message(self, message='', conversation_id=None, **kwargs):
+        """Estimate the credit cost of a message before sending it"""
+        try:
+            conversation = request.env['ai.conversation']
+            if conversation_id:
+                conversation = conversation.browse(int(conversation_id))
+                if not conversation.exists() or conversation.user_id.id != request.env.user.id:
+                    return {
+                        'error': True,
+                        'message': 'Access denied to conversation'
+                    }
+            
+            result = self._preflight_check(conversation, (message or '').strip())
+            result['error'] = False
+            return result
+            
+        except Exception as e:
+            _logger.error(f"Error previewing message cost: {str(e)}")
             return {
-                'limit': rate_limit,
-                'used': used,
-                'remaining': remaining,
-                'reset_time': reset_time
+                'error': True,
+                'message': 'Failed to estimate message cost'
             }
+
+    def _preflight_check(self, conversation, message):
+        """Token-count the message offline and check it against the user's credits"""
+        with phase('credit_check'):
+            config = request.env['ai.assistant.config'].get_active_snapshot()
+            context_tokens = conversation._estimate_context_tokens() if conversation else 0
+            estimate = config.estimate_message_cost(message, context_tokens)
+
+            user_credit = request.env['ai.user.credit'].get_or_create_user_credit()
+            allowed, reason = user_credit.check_usage_limit(estimate['total_tokens'])
+        return {
+            'allowed': allowed,
+            'reason': reason,
+            'estimate': estimate,
+            'remaining_credits': user_credit.remaining_credits,
+        }
+
+    def _check_rate_limit(self):
+        """Check if user has exceeded rate limits"""
+        try:
+            # Token buckets shared by all workers: per user, per company and global
+            with phase('rate_limit'):
+                return request.env['ai.rate.limiter'].sudo().check(request.env.user)
+            
+        except Exception as e:
+            _logger.error(f"Error checking rate limit: {str(e)}")
+            return True  # Allow request if rate limiting fails
+
+    def _get_rate_limit_info(self):
+        """Get current rate limit information for user"""
+        try:
+            return request.env['ai.rate.limiter'].sudo().get_info(request.env.user)
             
         except Exception as e:
             _logger.error(f"Error getting rate limit info: {str(e)}")
@@ -461,42 +900,33 @@ class AIChatController(http.Controller):
             }
 
     def _log_api_usage(self, endpoint, data):
-        """Log API usage for analytics"""
+        """Record a usage event; buffered in memory and written in bulk"""
         try:
-            log_data = {
-                'timestamp': datetime.now().isoformat(),
-                'user_id': request.env.user.id,
-                'endpoint': endpoint,
-                'data': data,
-                'ip_address': request.httprequest.environ.get('REMOTE_ADDR'),
-                'user_agent': request.httprequest.environ.get('HTTP_USER_AGENT', '')[:200]
-            }
-            
-            # Log for analytics (you could store this in a separate model)
-            _logger.info(f"API Usage: {json.dumps(log_data, default=str)}")
+            request.env['ai.usage.event'].log_event(endpoint, data, **self._client_info())
             
         except Exception as e:
             _logger.error(f"Error logging API usage: {str(e)}")
 
-    @http.route('/ai_assistant/health', type='http', auth='none', methods=['GET'], csrf=False)
+    def _client_info(self):
+        """Request details stored with usage events"""
+        return {
+            'ip_address': request.httprequest.environ.get('REMOTE_ADDR'),
+            'user_agent': request.httprequest.environ.get('HTTP_USER_AGENT', ''),
+        }
+
+    @http.route('/ai_assistant/health', type='http', auth='none', methods=['GET'], csrf=False, save_session=False)
+    @observe_route('health_check')
     def health_check(self, **kwargs):
-        """Health check endpoint for monitoring"""
+        """Health check endpoint for monitoring, served from the cached readiness probe"""
         try:
-            # Basic health checks
+            status = health.readiness(request.db) if request.db else {'ready': False, 'database': {'ok': False}}
             health_status = {
-                'status': 'healthy',
+                'status': 'healthy' if status['ready'] else 'unhealthy',
                 'timestamp': datetime.now().isoformat(),
-                'database': 'connected',
-                'ai_service': 'unknown'
+                'database': 'connected' if status['database']['ok'] else 'unavailable',
+                'ai_service': 'configured' if status.get('configured') else 'not_configured',
+                'provider': status.get('provider'),
             }
-            
-            # Check AI service if possible
-            try:
-                config = request.env['ai.assistant.config'].sudo().get_active_config()
-                health_status['ai_service'] = config.api_status
-            except Exception:
-                health_status['ai_service'] = 'not_configured'
-            
             return json.dumps(health_status)
             
         except Exception as e:
@@ -506,3 +936,47 @@ class AIChatController(http.Controller):
                 'timestamp': datetime.now().isoformat()
             }
             return json.dumps(error_response)
+
+    @http.route('/ai_assistant/health/live', type='http', auth='none', methods=['GET'], csrf=False, save_session=False)
+    def health_live(self, **kwargs):
+        """Liveness: the worker answers; no database access"""
+        return self._health_response(health.liveness(), 200)
+
+    @http.route('/ai_assistant/health/ready', type='http', auth='none', methods=['GET'], csrf=False, save_session=False)
+    def health_ready(self, **kwargs):
+        """Readiness: last result of the background probe of the database and the provider"""
+        try:
+            if not request.db:
+                return self._health_response({'ready': False, 'status': 'no_database'}, 503)
+            status = health.readiness(request.db)
+            return self._health_response(status, 200 if status['ready'] else 503)
+
+        except Exception as e:
+            _logger.error(f"Error in readiness check: {str(e)}")
+            return self._health_response({'ready': False, 'status': 'error'}, 503)
+
+    def _health_response(self, data, status):
+        return Response(json.dumps(data), status=status, mimetype='application/json',
+                        headers=[('Cache-Control', 'no-store')])
+
+    @http.route('/ai_assistant/metrics', type='http', auth='none', methods=['GET'], csrf=False)
+    def get_metrics(self, **kwargs):
+        """Prometheus metrics of the AI pipeline, summed over all workers"""
+        try:
+            if not request.db:
+                return Response('No database selected\n', status=404, mimetype='text/plain')
+            token = request.env['ir.config_parameter'].sudo().get_param('ai_assistant.metrics_token')
+            if not token:
+                return Response('Metrics are disabled: set ai_assistant.metrics_token\n', status=403,
+                                mimetype='text/plain')
+            # Scrapers authenticate with "Authorization: Bearer <ai_assistant.metrics_token>"
+            authorization = request.httprequest.headers.get('Authorization', '')
+            if not hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+                return Response('Unauthorized\n', status=401, mimetype='text/plain')
+
+            body = request.env['ai.metrics'].sudo().render_metrics()
+            return Response(body, headers=[('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
+
+        except Exception as e:
+            _logger.error(f"Error rendering AI metrics: {str(e)}")
+            return Response('Failed to render metrics\n', status=500, mimetype='text/plain')
@@ -0,0 +1,13 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Point the no-update cleanup cron at the retention engine"""
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env.ref('ai_assistant.cron_cleanup_temp_data').write({
+        'name': 'AI Assistant: Data Retention',
+        'model_id': env.ref('ai_assistant.model_ai_retention_policy').id,
+        'code': 'model._cron_run()',
+    })
@@ -0,0 +1,11 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Give the no-update weekly report cron its implementation"""
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env.ref('ai_assistant.cron_weekly_usage_report').write({
+        'code': 'model._cron_send_weekly_report()',
+    })
@@ -0,0 +1,26 @@
+def migrate(cr, version):
+    """Backfill the billable message counter of the daily usage rollup"""
+    if not version:
+        return
+    # Days whose messages were purged by retention: all or nothing, from the credits
+    cr.execute("""
+        UPDATE ai_usage_daily
+        SET billable_message_count = CASE WHEN credits_used > 0 THEN message_count ELSE 0 END
+    """)
+    cr.execute("""
+        UPDATE ai_usage_daily d
+        SET billable_message_count = s.billable
+        FROM (
+            SELECT DATE(m.create_date) AS usage_date, c.user_id, u.company_id, m.config_id,
+                   COUNT(m.id) FILTER (WHERE m.credit_cost > 0) AS billable
+            FROM ai_message m
+            JOIN ai_conversation c ON m.conversation_id = c.id
+            JOIN res_users u ON c.user_id = u.id
+            WHERE m.is_user_message = False
+            GROUP BY DATE(m.create_date), c.user_id, u.company_id, m.config_id
+        ) s
+        WHERE d.usage_date = s.usage_date
+            AND d.user_id = s.user_id
+            AND COALESCE(d.company_id, 0) = COALESCE(s.company_id, 0)
+            AND COALESCE(d.config_id, 0) = COALESCE(s.config_id, 0)
+    """)
@@ -0,0 +1,32 @@
+RENAMED_COLUMNS = [
+    ('ai_credit_transaction', 'message_id', 'message_ref'),
+    ('ai_dispatch_job', 'user_message_id', 'user_message_ref'),
+    ('ai_dispatch_job', 'reply_message_id', 'reply_message_ref'),
+    ('ai_conversation', 'context_summary_message_id', 'context_summary_message_ref'),
+]
+
+
+def migrate(cr, version):
+    """Turn the Many2one columns towards ai_message into integers without foreign keys
+
+    A partitioned ai_message cannot be the target of a foreign key, and the
+    upgrade would try to add them back for as long as these were Many2one.
+    """
+    if not version:
+        return
+    for table, old_column, new_column in RENAMED_COLUMNS:
+        cr.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+        """, (table, old_column))
+        if not cr.fetchone():
+            continue
+        cr.execute("""
+            SELECT c.conname FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+            WHERE c.conrelid = %s::regclass AND c.contype = 'f' AND a.attname = %s
+        """, (table, old_column))
+        for (constraint,) in cr.fetchall():
+            cr.execute(f'ALTER TABLE "{table}" DROP CONSTRAINT "{constraint}"')
+            cr.execute("DELETE FROM ir_model_constraint WHERE name = %s AND type = 'f'", (constraint,))
+        cr.execute(f'ALTER TABLE "{table}" RENAME COLUMN "{old_column}" TO "{new_column}"')
@@ -3,3 +3,12 @@ from . import ai_message
 from . import ai_assistant_config
 from . import ai_user_credit
 from . import ai_business_analytics
+from . import ai_dispatch_job
+from . import ai_usage_daily
+from . import ai_rate_limiter
+from . import ai_bulk_job
+from . import ai_partition_manager
+from . import ai_retention_policy
+from . import ir_config_parameter
+from . import ai_usage_event
+from . import ai_metrics
@@ -2,6 +2,70 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from collections import namedtuple
+from types import MappingProxyType
+import threading
+import time
+
+from ..tools import invalidation
+from ..tools.provider_client import get_provider_client, ProviderError
+from ..tools.provider_router import circuit_states
+from ..tools.tokenizer import count_tokens
+
+# Fields of the active configuration copied into the snapshot
+SNAPSHOT_FIELDS = [
+    'name', 'chatbot_id', 'model_name', 'max_tokens', 'cost_per_1k_tokens',
+    'markup_percentage', 'credit_rate', 'context_token_budget',
+]
+
+
+class ConfigSnapshot(namedtuple('ConfigSnapshot', ['id'] + SNAPSHOT_FIELDS + ['params', 'routes'])):
+    """Immutable copy of the active configuration and the ai_assistant.* parameters
+
+    ``id`` is False when no configuration is active. ``routes`` lists the
+    provider targets: the active configuration, then its backups. Reads cost nothing:
+    each worker keeps one snapshot per database until a configuration or
+    a parameter is written, in any worker.
+    """
+    __slots__ = ()
+
+    def get_param(self, key, default=False):
+        return self.params.get(key, default)
+
+    def calculate_credit_cost(self, tokens):
+        """Credits charged for ``tokens`` tokens: provider cost plus markup, in credits"""
+        usd = tokens / 1000.0 * self.cost_per_1k_tokens
+        return round(usd * (1 + self.markup_percentage / 100.0) * self.credit_rate, 4)
+
+    def estimate_message_cost(self, prompt, context_tokens=0):
+        """Pre-flight estimate for one message, counting the reply at its maximum length"""
+        prompt_tokens = count_tokens(prompt, self.model_name)
+        total_tokens = prompt_tokens + context_tokens + self.max_tokens
+        return {
+            'model': self.model_name,
+            'prompt_tokens': prompt_tokens,
+            'context_tokens': context_tokens,
+            'reply_tokens': self.max_tokens,
+            'total_tokens': total_tokens,
+            'credits': self.calculate_credit_cost(total_tokens),
+        }
+
+
+# Snapshot per database, dropped on 'config' invalidations
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def _evict_snapshots(dbname, keys):
+    with _snapshots_lock:
+        if dbname is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(dbname, None)
+
+
+invalidation.subscribe('config', _evict_snapshots)
+
 
 class AssistantConfig(models.Model):
     _name = 'ai.assistant.config'
@@ -15,13 +79,154 @@ class AssistantConfig(models.Model):
         default="1754325699224x235880637442555900"
     )
     is_active = fields.Boolean('Use This Configuration', default=False)
+    # Failover: inactive configurations with a weight back up the active one
+    failover_weight = fields.Integer(
+        'Backup Weight', default=0,
+        help="Share of failover traffic this configuration takes when the active one is failing. "
+             "0 never uses it as a backup."
+    )
+    provider_url = fields.Char(
+        'Provider URL',
+        help="Gateway for this configuration; empty uses the ai_assistant.provider_url parameter"
+    )
+    # Pricing, used for pre-flight estimates and credit charges
+    model_name = fields.Char('Model', default='gpt-3.5-turbo',
+                             help="Model family behind the bot, selects the tokenizer used for estimates")
+    max_tokens = fields.Integer('Max Reply Tokens', default=1000)
+    cost_per_1k_tokens = fields.Float('Cost per 1K Tokens (USD)', default=0.002, digits=(10, 5))
+    markup_percentage = fields.Float('Markup (%)', default=300.0)
+    credit_rate = fields.Float('Credits per USD', default=10.0)
+    context_token_budget = fields.Integer(
+        'Context Token Budget',
+        default=2000,
+        help="Upper bound on the conversation history sent with each message "
+             "(recent turns plus a rolling summary). 0 sends no history."
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        configs = super().create(vals_list)
+        invalidation.publish(self.env.cr, 'config')
+        return configs
+
+    def write(self, vals):
+        result = super().write(vals)
+        invalidation.publish(self.env.cr, 'config')
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        invalidation.publish(self.env.cr, 'config')
+        return result
 
     @api.model
     def get_active_config(self):
-        config = self.search([('is_active', '=', True)], limit=1)
-        if not config:
+        return self.browse(self.get_active_snapshot().id)
+
+    @api.model
+    def get_active_snapshot(self):
+        """Snapshot of the active configuration; use it on hot paths instead of the record"""
+        snapshot = self._get_config_snapshot()
+        if not snapshot.id:
             raise UserError(_("No active Chat Whisperer configuration found. Please create and activate one in settings."))
-        return config
+        return snapshot
+
+    @api.model
+    def get_config_snapshot(self):
+        """The cached ConfigSnapshot, whether or not a configuration is active (e.g. for parameters)"""
+        return self._get_config_snapshot()
+
+    def _get_config_snapshot(self):
+        if invalidation.pending(self.env.cr, 'config'):
+            # Changed by this transaction: read it from here, other transactions must not see it yet
+            return self._load_config_snapshot()
+
+        dbname = self.env.cr.dbname
+        snapshot = _snapshots.get(dbname)
+        if snapshot is None:
+            invalidation.ensure_listening()
+            generation = invalidation.generation(dbname, 'config')
+            # A new transaction sees every commit whose invalidation this worker already received
+            with self.env.registry.cursor() as cr:
+                snapshot = self.with_env(self.env(cr=cr, su=True))._load_config_snapshot()
+            with _snapshots_lock:
+                if invalidation.generation(dbname, 'config') == generation:
+                    _snapshots[dbname] = snapshot
+        return snapshot
+
+    def _load_config_snapshot(self):
+        self.env.cr.execute("SELECT key, value FROM ir_config_parameter WHERE key LIKE %s", ['ai\\_assistant.%'])
+        params = MappingProxyType(dict(self.env.cr.fetchall()))
+        config = self.sudo().search([('is_active', '=', True)], limit=1)
+        if not config:
+            return ConfigSnapshot(False, *[False] * len(SNAPSHOT_FIELDS), params, ())
+        backups = self.sudo().search([('is_active', '=', False), ('failover_weight', '>', 0)])
+        routes = tuple(MappingProxyType({
+            'id': route.id,
+            'name': route.name,
+            'chatbot_id': route.chatbot_id,
+            'url': route.provider_url or False,
+            'weight': route.failover_weight,
+            'primary': route == config,
+        }) for route in config + backups)
+        return config._make_snapshot(params, routes)
+
+    def _make_snapshot(self, params=None, routes=()):
+        self.ensure_one()
+        return ConfigSnapshot(self.id, *[self[name] for name in SNAPSHOT_FIELDS],
+                              params or MappingProxyType({}), routes)
+
+    def calculate_credit_cost(self, tokens):
+        """Credits charged for ``tokens`` tokens: provider cost plus markup, in credits"""
+        return self._make_snapshot().calculate_credit_cost(tokens)
+
+    def estimate_message_cost(self, prompt, context_tokens=0):
+        """Pre-flight estimate for one message, counting the reply at its maximum length"""
+        return self._make_snapshot().estimate_message_cost(prompt, context_tokens)
+
+    def action_clear_response_cache(self):
+        """Drop all cached provider replies, in every worker (admin)"""
+        invalidation.publish(self.env.cr, 'response_cache')
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _("AI response cache cleared."),
+                'type': 'success',
+            },
+        }
+
+    @api.model
+    def _probe_health(self):
+        """Database latency, configuration and provider round trip, for the readiness route"""
+        started = time.perf_counter()
+        self.env.cr.execute("SELECT 1")
+        database = {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+        snapshot = self.get_config_snapshot()
+        get_param = snapshot.get_param
+        status = {
+            'database': database,
+            'configured': bool(snapshot.id),
+            'interval': float(get_param('ai_assistant.health_probe_interval', '30')),
+        }
+        if get_param('ai_assistant.health_probe_provider', 'True') == 'True':
+            try:
+                latency = get_provider_client(self.env).probe()
+                status['provider'] = {'ok': True, 'latency_ms': round(latency * 1000, 2)}
+            except ProviderError as e:
+                status['provider'] = {'ok': False, 'error': str(e)}
+        else:
+            status['provider'] = {'ok': True, 'skipped': True}
+        status['circuits'] = circuit_states()
+
+        if not status['configured']:
+            status.update(ready=False, status='not_configured')
+        elif not status['provider']['ok']:
+            status.update(ready=False, status='provider_unreachable')
+        else:
+            status.update(ready=True, status='ready')
+        return status
 
     @api.constrains('is_active')
     def _ensure_only_one_active(self):
@@ -0,0 +1,319 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from concurrent.futures import ThreadPoolExecutor
+from string import Formatter
+import logging
+import time
+
+from ..tools import metrics
+from ..tools.provider_router import get_provider_router
+from ..tools.tokenizer import count_tokens
+
+_logger = logging.getLogger(__name__)
+
+# First key of the advisory lock held while a job runs
+BULK_JOB_LOCK = 0x41494255
+
+class AIBulkJob(models.Model):
+    _name = 'ai.bulk.job'
+    _description = 'AI Bulk Prompt Job'
+    _order = 'id desc'
+
+    name = fields.Char(string='Name', required=True, default='Bulk Prompt Job')
+    user_id = fields.Many2one('res.users', string='Charged User', required=True, default=lambda self: self.env.user)
+    item_ids = fields.One2many('ai.bulk.job.item', 'job_id', string='Items')
+    concurrency = fields.Integer(string='Concurrency', default=lambda self: self._default_concurrency(),
+                                 help='Provider calls in flight at the same time for this job')
+
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ], string='Status', default='queued', required=True, index=True)
+    error_message = fields.Text(string='Error')
+
+    # Progress, written at every checkpoint
+    item_count = fields.Integer(string='Items', readonly=True)
+    done_count = fields.Integer(string='Done', readonly=True)
+    failed_count = fields.Integer(string='Failed', readonly=True)
+    credits_charged = fields.Float(string='Credits Charged', readonly=True)
+    run_seconds = fields.Float(string='Run Time (s)', readonly=True)
+    date_started = fields.Datetime(string='Started On', readonly=True)
+    date_done = fields.Datetime(string='Completed On', readonly=True)
+    items_per_minute = fields.Float(string='Items / Minute', compute='_compute_items_per_minute')
+
+    def _default_concurrency(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('ai_assistant.bulk_max_concurrency', '4'))
+
+    @api.depends('done_count', 'failed_count', 'run_seconds')
+    def _compute_items_per_minute(self):
+        for job in self:
+            processed = job.done_count + job.failed_count
+            job.items_per_minute = round(processed / job.run_seconds * 60, 1) if job.run_seconds else 0.0
+
+    @api.model
+    def create_job(self, prompts, name=None, concurrency=None):
+        """Queue a job for a list of prompts
+
+        Each prompt is a string or a dict with ``prompt`` and optionally
+        ``res_model`` / ``res_id`` linking the item to the record it is about.
+        """
+        if not prompts:
+            raise UserError(_("A bulk job needs at least one prompt."))
+        items = []
+        for sequence, prompt in enumerate(prompts):
+            if isinstance(prompt, str):
+                prompt = {'prompt': prompt}
+            items.append((0, 0, {
+                'sequence': sequence,
+                'prompt': prompt['prompt'],
+                'res_model': prompt.get('res_model'),
+                'res_id': prompt.get('res_id'),
+            }))
+
+        vals = {'item_ids': items, 'item_count': len(items)}
+        if name:
+            vals['name'] = name
+        if concurrency:
+            vals['concurrency'] = min(int(concurrency), self._max_concurrency())
+        job = self.create(vals)
+
+        self.env.ref('ai_assistant.cron_run_bulk_jobs')._trigger()
+        return job
+
+    @api.model
+    def create_job_from_records(self, res_model, res_ids, template, name=None, concurrency=None):
+        """Queue one prompt per record, ``template`` using ``{field_name}`` placeholders"""
+        field_names = [field for _text, field, _spec, _conv in Formatter().parse(template) if field]
+        records = self.env[res_model].browse(res_ids)
+        prompts = []
+        for values in records.read(field_names):
+            values = {
+                key: (value[1] if isinstance(value, tuple) else value or '')
+                for key, value in values.items()
+            }
+            prompts.append({
+                'prompt': template.format(**values),
+                'res_model': res_model,
+                'res_id': values['id'],
+            })
+        return self.create_job(prompts, name=name, concurrency=concurrency)
+
+    def action_cancel(self):
+        self.filtered(lambda job: job.state in ('queued', 'running')).write({'state': 'cancelled'})
+
+    def action_retry_failed(self):
+        """Requeue the failed items of finished jobs"""
+        for job in self:
+            failed = job.item_ids.filtered(lambda item: item.state == 'failed')
+            if not failed:
+                continue
+            failed.write({'state': 'pending', 'error_message': False})
+            job.write({'state': 'queued', 'failed_count': job.failed_count - len(failed), 'date_done': False})
+        self.env.ref('ai_assistant.cron_run_bulk_jobs')._trigger()
+
+    def _max_concurrency(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('ai_assistant.bulk_max_concurrency', '4'))
+
+    @api.model
+    def _cron_run(self):
+        """Run queued jobs, resuming interrupted ones, within the cron time budget"""
+        time_budget = float(self.env['ir.config_parameter'].sudo().get_param(
+            'ai_assistant.bulk_time_budget', '240'
+        ))
+        deadline = time.monotonic() + time_budget
+
+        self.env.cr.execute("""
+            SELECT id FROM ai_bulk_job
+            WHERE state IN ('queued', 'running')
+            ORDER BY id
+        """)
+        for job_id in [row[0] for row in self.env.cr.fetchall()]:
+            if time.monotonic() >= deadline:
+                break
+            # Session-level lock: survives the per-batch commits, and is released if the
+            # worker dies, so a 'running' job nobody holds is an interrupted one and resumes here
+            self.env.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (BULK_JOB_LOCK, job_id))
+            if not self.env.cr.fetchone()[0]:
+                continue
+            try:
+                job = self.browse(job_id)
+                job.invalidate_recordset()
+                if job.state in ('queued', 'running') and not job._run(deadline):
+                    # Out of time: let the next cron run pick it up
+                    self.env.ref('ai_assistant.cron_run_bulk_jobs')._trigger()
+                    break
+            except Exception:
+                # An aborted transaction would make the unlock fail and leak the lock
+                # on this pooled connection
+                self.env.cr.rollback()
+                raise
+            finally:
+                self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", (BULK_JOB_LOCK, job_id))
+
+    def _run(self, deadline):
+        """Process pending items in checkpointed batches; False if the deadline interrupted the job"""
+        self.ensure_one()
+        config = self.env['ai.assistant.config'].get_active_snapshot()
+        user_credit = self.env['ai.user.credit'].sudo().get_or_create_user_credit(self.user_id.id)
+
+        if self.state == 'queued':
+            pending = self.item_ids.filtered(lambda item: item.state == 'pending')
+            estimated_tokens = sum(
+                config.estimate_message_cost(item.prompt)['total_tokens'] for item in pending
+            )
+            allowed, reason = user_credit.check_usage_limit(estimated_tokens)
+            if not allowed:
+                self._finish('failed', reason)
+                return True
+            self.write({'state': 'running', 'date_started': self.date_started or fields.Datetime.now()})
+            self.env.cr.commit()
+
+        # No hedging: the job already keeps several calls in flight
+        client = get_provider_router(self.env, hedge=False)
+        concurrency = max(1, min(self.concurrency or 1, self._max_concurrency()))
+        batch_size = concurrency * 4
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ai_bulk') as pool:
+            while True:
+                if time.monotonic() >= deadline:
+                    return False
+                self.invalidate_recordset(['state'])
+                if self.state == 'cancelled':
+                    return True
+
+                batch = self.env['ai.bulk.job.item'].search([
+                    ('job_id', '=', self.id), ('state', '=', 'pending'),
+                ], order='sequence, id', limit=batch_size)
+                if not batch:
+                    break
+
+                started = time.monotonic()
+                payloads = [{
+                    "message": item.prompt,
+                    "chatbotId": config.chatbot_id,
+                    "userId": str(self.user_id.id),
+                    "conversationId": f"bulk-{self.id}-{item.id}",
+                } for item in batch]
+                # Provider calls only in the threads; all ORM work stays on this cursor
+                results = list(pool.map(self._call_provider, [client] * len(payloads), payloads))
+
+                try:
+                    self._checkpoint(batch, results, config, user_credit, time.monotonic() - started)
+                except UserError as e:
+                    # Out of credits: nothing of this batch is kept, the job stops here
+                    self.env.cr.rollback()
+                    self._finish('failed', str(e))
+                    return True
+
+        self._finish('done' if not self.failed_count else 'failed',
+                     _("%s item(s) failed.", self.failed_count) if self.failed_count else False)
+        return True
+
+    @staticmethod
+    def _call_provider(client, payload):
+        started = time.monotonic()
+        try:
+            data = client.post_chat(payload)
+            text = data.get("response", {}).get("text")
+            if not text:
+                return {'error': 'No reply received', 'response_time': time.monotonic() - started}
+            return {'text': text, 'response_time': time.monotonic() - started}
+        except Exception as e:
+            return {'error': str(e), 'response_time': time.monotonic() - started}
+
+    def _checkpoint(self, batch, results, config, user_credit, elapsed):
+        """Store a batch's results, charge them in one ledger write, and commit
+
+        The batch is stored even if the job was cancelled while its calls
+        ran: they are paid for. The loop stops before the next one.
+        """
+        self._lock_state()
+        entries = []
+        done = failed = 0
+        for item, result in zip(batch, results):
+            if 'error' in result:
+                item.write({
+                    'state': 'failed',
+                    'error_message': result['error'],
+                    'response_time': result['response_time'],
+                })
+                failed += 1
+                continue
+            prompt_tokens = count_tokens(item.prompt, config.model_name)
+            completion_tokens = count_tokens(result['text'], config.model_name)
+            tokens = prompt_tokens + completion_tokens
+            metrics.inc('ai_tokens_consumed_total', prompt_tokens, source='bulk', kind='prompt')
+            metrics.inc('ai_tokens_consumed_total', completion_tokens, source='bulk', kind='completion')
+            cost = config.calculate_credit_cost(tokens)
+            item.write({
+                'state': 'done',
+                'response': result['text'],
+                'tokens_used': tokens,
+                'credit_cost': cost,
+                'response_time': result['response_time'],
+                'error_message': False,
+            })
+            entries.append({'amount': cost, 'description': f"Bulk job {self.name} - item {item.sequence + 1}"})
+            done += 1
+
+        if entries:
+            user_credit.consume_credits_batch(entries)
+        self.write({
+            'done_count': self.done_count + done,
+            'failed_count': self.failed_count + failed,
+            'credits_charged': self.credits_charged + sum(entry['amount'] for entry in entries),
+            'run_seconds': self.run_seconds + elapsed,
+        })
+        self.env.cr.commit()
+        _logger.info(f"AI bulk job {self.id}: {self.done_count + self.failed_count}/{self.item_count} items processed")
+
+    def _lock_state(self):
+        """Commit, then lock the job row in a read-committed transaction; returns its state
+
+        A cancel committed while the provider calls ran is then seen here,
+        instead of failing the job's next write with a serialization error.
+        """
+        self.ensure_one()
+        self.env.cr.commit()
+        self.env.cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+        self.env.cr.execute("SELECT state FROM ai_bulk_job WHERE id = %s FOR UPDATE", (self.id,))
+        state = self.env.cr.fetchone()[0]
+        self.invalidate_recordset()
+        return state
+
+    def _finish(self, state, error_message=False):
+        if self._lock_state() == 'cancelled':
+            # Cancelled while the last batch ran: that is how it ended
+            state, error_message = 'cancelled', False
+        self.write({
+            'state': state,
+            'error_message': error_message,
+            'date_done': fields.Datetime.now(),
+        })
+        self.env.cr.commit()
+
+
+class AIBulkJobItem(models.Model):
+    _name = 'ai.bulk.job.item'
+    _description = 'AI Bulk Prompt Job Item'
+    _order = 'job_id, sequence, id'
+
+    job_id = fields.Many2one('ai.bulk.job', string='Job', required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(string='Sequence', default=0)
+    res_model = fields.Char(string='Related Model')
+    res_id = fields.Integer(string='Related Record')
+    prompt = fields.Text(string='Prompt', required=True)
+
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='pending', required=True, index=True)
+    response = fields.Text(string='Response')
+    error_message = fields.Text(string='Error')
+    tokens_used = fields.Integer(string='Tokens Used', default=0)
+    credit_cost = fields.Float(string='Credit Cost', default=0.0)
+    response_time = fields.Float(string='Response Time (s)', default=0.0)
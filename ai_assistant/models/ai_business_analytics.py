@@ -1,9 +1,25 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
 from datetime import datetime, timedelta
 import logging
+import tempfile
+
+from ..tools.response_cache import get_response_cache
+from ..tools.report_export import REPORT_FORMATS, write_report
 
 _logger = logging.getLogger(__name__)
 
+# Rows fetched per round trip when streaming report sections
+REPORT_FETCH_SIZE = 2000
+
+# Supported series granularities and their bucket label format
+SERIES_GRANULARITIES = {
+    'hour': 'YYYY-MM-DD HH24:00',
+    'day': 'YYYY-MM-DD',
+    'week': 'YYYY-MM-DD',
+    'month': 'YYYY-MM',
+}
+
 class AIBusinessAnalytics(models.Model):
     _name = 'ai.business.analytics'
     _description = 'AI Business Analytics'
@@ -14,36 +30,50 @@ class AIBusinessAnalytics(models.Model):
         
         date_from = datetime.now() - timedelta(days=days)
         
-        # Get AI messages from the period
-        messages = self.env['ai.message'].search([
-            ('create_date', '>=', date_from),
-            ('is_user_message', '=', False),
-            ('credit_cost', '>', 0)
-        ])
+        # Aggregate the daily rollup instead of individual messages; only billed messages count
+        self.env.cr.execute("""
+            SELECT 
+                COALESCE(SUM(billable_message_count), 0) as total_messages,
+                COALESCE(SUM(tokens_used), 0) as total_tokens,
+                COALESCE(SUM(credits_used), 0) as total_credits,
+                COALESCE(SUM(revenue_usd), 0) as total_revenue,
+                COALESCE(SUM(cost_usd), 0) as total_cost,
+                COUNT(DISTINCT user_id) FILTER (WHERE billable_message_count > 0) as active_users
+            FROM ai_usage_daily
+            WHERE usage_date >= %s
+        """, (date_from.date(),))
+        usage = self.env.cr.dictfetchone()
         
         # Revenue metrics
-        total_revenue = sum(msg.revenue_usd or 0 for msg in messages)
-        total_cost = sum(msg.actual_cost_usd or 0 for msg in messages)
+        total_revenue = usage['total_revenue']
+        total_cost = usage['total_cost']
         profit = total_revenue - total_cost
         margin = (profit / total_revenue * 100) if total_revenue > 0 else 0
         
         # Usage metrics
-        total_messages = len(messages)
-        total_tokens = sum(msg.tokens_used or 0 for msg in messages)
-        total_credits_sold = sum(msg.credit_cost or 0 for msg in messages)
+        total_messages = usage['total_messages']
+        total_tokens = usage['total_tokens']
+        total_credits_sold = usage['total_credits']
         avg_tokens_per_message = total_tokens / max(total_messages, 1)
         avg_credits_per_message = total_credits_sold / max(total_messages, 1)
         
         # User metrics
-        active_users = len(set(msg.conversation_id.user_id.id for msg in messages))
-        conversations = len(set(msg.conversation_id.id for msg in messages))
+        active_users = usage['active_users']
+        self.env.cr.execute("""
+            SELECT COUNT(*)
+            FROM ai_conversation
+            WHERE last_message_date >= %s
+        """, (date_from,))
+        conversations = self.env.cr.fetchone()[0]
         
         # Credit transactions in period
-        credit_transactions = self.env['ai.credit.transaction'].search([
-            ('create_date', '>=', date_from),
-            ('transaction_type', '=', 'purchase')
-        ])
-        credits_purchased = sum(t.amount for t in credit_transactions)
+        self.env.cr.execute("""
+            SELECT COALESCE(SUM(amount), 0)
+            FROM ai_credit_transaction
+            WHERE create_date >= %s
+                AND transaction_type = 'purchase'
+        """, (date_from,))
+        credits_purchased = self.env.cr.fetchone()[0]
         purchase_revenue = credits_purchased / 10.0  # Assuming 10 credits = $1
         
         return {
@@ -78,40 +108,31 @@ class AIBusinessAnalytics(models.Model):
     def _calculate_growth_metrics(self, days):
         """Calculate growth metrics comparing current period to previous period"""
         
-        current_end = datetime.now()
+        current_end = datetime.now().date()
         current_start = current_end - timedelta(days=days)
         previous_start = current_start - timedelta(days=days)
-        previous_end = current_start
-        
-        # Current period
-        current_messages = self.env['ai.message'].search_count([
-            ('create_date', '>=', current_start),
-            ('create_date', '<=', current_end),
-            ('is_user_message', '=', False),
-        ])
-        
-        current_users = len(set(
-            self.env['ai.message'].search([
-                ('create_date', '>=', current_start),
-                ('create_date', '<=', current_end),
-                ('is_user_message', '=', False),
-            ]).mapped('conversation_id.user_id.id')
-        ))
-        
-        # Previous period
-        previous_messages = self.env['ai.message'].search_count([
-            ('create_date', '>=', previous_start),
-            ('create_date', '<', previous_end),
-            ('is_user_message', '=', False),
-        ])
-        
-        previous_users = len(set(
-            self.env['ai.message'].search([
-                ('create_date', '>=', previous_start),
-                ('create_date', '<', previous_end),
-                ('is_user_message', '=', False),
-            ]).mapped('conversation_id.user_id.id')
-        ))
+        
+        # Both periods in one pass over the rollup
+        self.env.cr.execute("""
+            SELECT 
+                COALESCE(SUM(message_count) FILTER (WHERE usage_date >= %(current_start)s), 0) as current_messages,
+                COUNT(DISTINCT user_id) FILTER (WHERE usage_date >= %(current_start)s AND message_count > 0) as current_users,
+                COALESCE(SUM(message_count) FILTER (WHERE usage_date < %(current_start)s), 0) as previous_messages,
+                COUNT(DISTINCT user_id) FILTER (WHERE usage_date < %(current_start)s AND message_count > 0) as previous_users
+            FROM ai_usage_daily
+            WHERE usage_date >= %(previous_start)s
+                AND usage_date <= %(current_end)s
+        """, {
+            'current_start': current_start,
+            'current_end': current_end,
+            'previous_start': previous_start,
+        })
+        periods = self.env.cr.dictfetchone()
+        
+        current_messages = periods['current_messages']
+        current_users = periods['current_users']
+        previous_messages = periods['previous_messages']
+        previous_users = periods['previous_users']
         
         # Calculate growth rates
         message_growth = ((current_messages - previous_messages) / max(previous_messages, 1)) * 100
@@ -140,21 +161,21 @@ class AIBusinessAnalytics(models.Model):
         self.env.cr.execute("""
             SELECT 
                 u.id as user_id,
-                u.name as user_name,
-                COUNT(m.id) as message_count,
-                SUM(m.tokens_used) as total_tokens,
-                SUM(m.credit_cost) as total_credits,
-                SUM(m.revenue_usd) as total_revenue,
-                MAX(m.create_date) as last_usage
-            FROM ai_message m
-            JOIN ai_conversation c ON m.conversation_id = c.id
-            JOIN res_users u ON c.user_id = u.id
-            WHERE m.create_date >= %s 
-                AND m.is_user_message = False
-            GROUP BY u.id, u.name
+                p.name as user_name,
+                SUM(d.message_count) as message_count,
+                SUM(d.tokens_used) as total_tokens,
+                SUM(d.credits_used) as total_credits,
+                SUM(d.revenue_usd) as total_revenue,
+                MAX(d.last_message_date) as last_usage
+            FROM ai_usage_daily d
+            JOIN res_users u ON d.user_id = u.id
+            JOIN res_partner p ON u.partner_id = p.id
+            WHERE d.usage_date >= %s
+            GROUP BY u.id, p.name
+            HAVING SUM(d.message_count) > 0
             ORDER BY total_revenue DESC
             LIMIT %s
-        """, (date_from, limit))
+        """, (date_from.date(), limit))
         
         results = self.env.cr.dictfetchall()
         
@@ -171,82 +192,138 @@ class AIBusinessAnalytics(models.Model):
     def get_daily_usage_chart(self, days=30):
         """Get daily usage data for charts"""
         
-        date_from = datetime.now() - timedelta(days=days)
-        
-        self.env.cr.execute("""
-            SELECT 
-                DATE(m.create_date) as usage_date,
-                COUNT(m.id) as message_count,
-                SUM(m.tokens_used) as total_tokens,
-                SUM(m.credit_cost) as total_credits,
-                SUM(m.revenue_usd) as total_revenue,
-                COUNT(DISTINCT c.user_id) as active_users
-            FROM ai_message m
-            JOIN ai_conversation c ON m.conversation_id = c.id
-            WHERE m.create_date >= %s 
-                AND m.is_user_message = False
-            GROUP BY DATE(m.create_date)
-            ORDER BY usage_date
-        """, (date_from,))
-        
-        results = self.env.cr.dictfetchall()
+        series = self.get_usage_series('day', days=days)
         
-        # Fill in missing dates with zeros
-        all_dates = []
-        current_date = date_from.date()
-        end_date = datetime.now().date()
-        
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            existing_data = next((r for r in results if r['usage_date'].strftime('%Y-%m-%d') == date_str), None)
-            
-            if existing_data:
-                all_dates.append({
-                    'date': date_str,
-                    'messages': existing_data['message_count'],
-                    'tokens': existing_data['total_tokens'] or 0,
-                    'credits': round(existing_data['total_credits'] or 0, 2),
-                    'revenue': round(existing_data['total_revenue'] or 0, 2),
-                    'users': existing_data['active_users'],
-                })
-            else:
-                all_dates.append({
-                    'date': date_str,
-                    'messages': 0,
-                    'tokens': 0,
-                    'credits': 0,
-                    'revenue': 0,
-                    'users': 0,
-                })
-            
-            current_date += timedelta(days=1)
+        return [{
+            'date': series['buckets'][i],
+            'messages': series['messages'][i],
+            'tokens': series['tokens'][i],
+            'credits': series['credits'][i],
+            'revenue': series['revenue'][i],
+            'users': series['users'][i],
+        } for i in range(len(series['buckets']))]
+
+    @api.model
+    def get_usage_series(self, granularity='day', days=30, date_from=None, date_to=None,
+                         user_id=None, company_id=None):
+        """Get a gap-filled usage time series as column arrays
+
+        ``granularity`` is one of hour/day/week/month. Buckets are generated
+        and aggregated in the database; the result holds one array per
+        metric, aligned with ``buckets``.
+        """
+        if granularity not in SERIES_GRANULARITIES:
+            raise UserError(_("Unsupported granularity %s. Use one of: %s")
+                            % (granularity, ', '.join(SERIES_GRANULARITIES)))
+        
+        date_to = fields.Datetime.to_datetime(date_to) or datetime.now()
+        date_from = fields.Datetime.to_datetime(date_from) or (date_to - timedelta(days=days))
+        
+        params = {
+            'granularity': granularity,
+            'step': f'1 {granularity}',
+            'date_from': date_from,
+            'date_to': date_to,
+            'label': SERIES_GRANULARITIES[granularity],
+            'user_id': user_id,
+            'company_id': company_id,
+        }
         
-        return all_dates
+        if granularity == 'hour':
+            # The rollup is daily, so hourly buckets come from the messages themselves
+            filters = ""
+            if user_id:
+                filters += " AND c.user_id = %(user_id)s"
+            if company_id:
+                filters += " AND u.company_id = %(company_id)s"
+            usage_query = f"""
+                SELECT 
+                    date_trunc('hour', m.create_date) as bucket,
+                    COUNT(m.id) as messages,
+                    COALESCE(SUM(m.tokens_used), 0) as tokens,
+                    COALESCE(SUM(m.credit_cost), 0) as credits,
+                    COALESCE(SUM(m.revenue_usd), 0) as revenue,
+                    COUNT(DISTINCT c.user_id) as users
+                FROM ai_message m
+                JOIN ai_conversation c ON m.conversation_id = c.id
+                JOIN res_users u ON c.user_id = u.id
+                WHERE m.is_user_message = False
+                    AND m.create_date >= date_trunc('hour', %(date_from)s::timestamp)
+                    AND m.create_date <= %(date_to)s
+                    {filters}
+                GROUP BY 1
+            """
+        else:
+            filters = ""
+            if user_id:
+                filters += " AND d.user_id = %(user_id)s"
+            if company_id:
+                filters += " AND d.company_id = %(company_id)s"
+            usage_query = f"""
+                SELECT 
+                    date_trunc(%(granularity)s, d.usage_date::timestamp) as bucket,
+                    SUM(d.message_count) as messages,
+                    SUM(d.tokens_used) as tokens,
+                    SUM(d.credits_used) as credits,
+                    SUM(d.revenue_usd) as revenue,
+                    COUNT(DISTINCT d.user_id) FILTER (WHERE d.message_count > 0) as users
+                FROM ai_usage_daily d
+                WHERE d.usage_date >= date_trunc(%(granularity)s, %(date_from)s::timestamp)::date
+                    AND d.usage_date <= %(date_to)s::date
+                    {filters}
+                GROUP BY 1
+            """
+        
+        self.env.cr.execute(f"""
+            WITH buckets AS (
+                SELECT generate_series(
+                    date_trunc(%(granularity)s, %(date_from)s::timestamp),
+                    date_trunc(%(granularity)s, %(date_to)s::timestamp),
+                    %(step)s::interval
+                ) as bucket
+            ), usage AS ({usage_query})
+            SELECT 
+                COALESCE(array_agg(to_char(b.bucket, %(label)s) ORDER BY b.bucket), '{{}}') as buckets,
+                COALESCE(array_agg(COALESCE(u.messages, 0) ORDER BY b.bucket), '{{}}') as messages,
+                COALESCE(array_agg(COALESCE(u.tokens, 0) ORDER BY b.bucket), '{{}}') as tokens,
+                COALESCE(array_agg(ROUND(COALESCE(u.credits, 0)::numeric, 2)::float ORDER BY b.bucket), '{{}}') as credits,
+                COALESCE(array_agg(ROUND(COALESCE(u.revenue, 0)::numeric, 2)::float ORDER BY b.bucket), '{{}}') as revenue,
+                COALESCE(array_agg(COALESCE(u.users, 0) ORDER BY b.bucket), '{{}}') as users
+            FROM buckets b
+            LEFT JOIN usage u ON u.bucket = b.bucket
+        """, params)
+        
+        result = self.env.cr.dictfetchone()
+        result.update({
+            'granularity': granularity,
+            'date_from': date_from.strftime('%Y-%m-%d %H:%M:%S'),
+            'date_to': date_to.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        return result
 
     @api.model
     def get_provider_breakdown(self, days=30):
-        """Get usage breakdown by AI provider"""
+        """Get usage breakdown by AI provider configuration"""
         
         date_from = datetime.now() - timedelta(days=days)
         
         self.env.cr.execute("""
             SELECT 
-                ac.provider,
-                ac.model_name,
-                COUNT(m.id) as message_count,
-                SUM(m.tokens_used) as total_tokens,
-                SUM(m.actual_cost_usd) as total_cost,
-                SUM(m.revenue_usd) as total_revenue,
-                AVG(m.response_time) as avg_response_time
-            FROM ai_message m
-            JOIN ai_conversation c ON m.conversation_id = c.id
-            JOIN ai_assistant_config ac ON ac.is_active = True
-            WHERE m.create_date >= %s 
-                AND m.is_user_message = False
-                AND m.tokens_used > 0
-            GROUP BY ac.provider, ac.model_name
+                ac.id as config_id,
+                ac.name as provider,
+                ac.chatbot_id as model_name,
+                SUM(d.message_count) as message_count,
+                SUM(d.tokens_used) as total_tokens,
+                SUM(d.cost_usd) as total_cost,
+                SUM(d.revenue_usd) as total_revenue,
+                SUM(d.response_time_total) / NULLIF(SUM(d.message_count), 0) as avg_response_time
+            FROM ai_usage_daily d
+            LEFT JOIN ai_assistant_config ac ON d.config_id = ac.id
+            WHERE d.usage_date >= %s
+                AND d.tokens_used > 0
+            GROUP BY ac.id, ac.name, ac.chatbot_id
             ORDER BY total_revenue DESC
-        """, (date_from,))
+        """, (date_from.date(),))
         
         results = self.env.cr.dictfetchall()
         
@@ -267,21 +344,26 @@ class AIBusinessAnalytics(models.Model):
         
         date_from = datetime.now() - timedelta(days=days)
         
-        conversations = self.env['ai.conversation'].search([
-            ('create_date', '>=', date_from)
-        ])
-        
-        total_conversations = len(conversations)
-        active_conversations = len(conversations.filtered(lambda c: c.message_count > 0))
-        
-        # Calculate conversation metrics
-        message_counts = conversations.mapped('message_count')
-        avg_messages_per_conversation = sum(message_counts) / max(len(message_counts), 1)
+        # Aggregated from the stored counters, no message rows are read
+        self.env.cr.execute("""
+            SELECT 
+                COUNT(*) as total_conversations,
+                COUNT(*) FILTER (WHERE message_count > 0) as active_conversations,
+                COALESCE(AVG(message_count), 0) as avg_messages,
+                COUNT(*) FILTER (WHERE message_count <= 5) as short_conversations,
+                COUNT(*) FILTER (WHERE message_count BETWEEN 6 AND 20) as medium_conversations,
+                COUNT(*) FILTER (WHERE message_count > 20) as long_conversations
+            FROM ai_conversation
+            WHERE create_date >= %s
+        """, (date_from,))
         
-        # Conversation length distribution
-        short_conversations = len([c for c in message_counts if c <= 5])
-        medium_conversations = len([c for c in message_counts if 6 <= c <= 20])
-        long_conversations = len([c for c in message_counts if c > 20])
+        result = self.env.cr.dictfetchone()
+        total_conversations = result['total_conversations']
+        active_conversations = result['active_conversations']
+        avg_messages_per_conversation = float(result['avg_messages'])
+        short_conversations = result['short_conversations']
+        medium_conversations = result['medium_conversations']
+        long_conversations = result['long_conversations']
         
         return {
             'total_conversations': total_conversations,
@@ -295,6 +377,66 @@ class AIBusinessAnalytics(models.Model):
             'engagement_rate': round((active_conversations / max(total_conversations, 1)) * 100, 1),
         }
 
+    @api.model
+    def get_cache_metrics(self, days=30):
+        """Get response cache effectiveness"""
+        
+        date_from = datetime.now() - timedelta(days=days)
+        
+        self.env.cr.execute("""
+            SELECT 
+                COUNT(*) FILTER (WHERE transaction_type = 'cache_hit') as cache_hits,
+                COUNT(*) FILTER (WHERE transaction_type IN ('usage', 'subscription')) as provider_calls,
+                COALESCE(SUM(-amount) FILTER (WHERE transaction_type = 'cache_hit'), 0) as cache_credits
+            FROM ai_credit_transaction
+            WHERE create_date >= %s
+                AND transaction_type IN ('cache_hit', 'usage', 'subscription')
+        """, (date_from,))
+        
+        result = self.env.cr.dictfetchone()
+        total = result['cache_hits'] + result['provider_calls']
+        
+        cache = get_response_cache(self.env)
+        
+        return {
+            'cache_hits': result['cache_hits'],
+            'provider_calls': result['provider_calls'],
+            'hit_rate_percent': round(result['cache_hits'] / max(total, 1) * 100, 1),
+            'credits_charged_on_hits': round(result['cache_credits'], 2),
+            'worker_cache': cache.stats() if cache is not None else None,
+        }
+
+    @api.model
+    def get_usage_event_metrics(self, days=30):
+        """Per-endpoint activity and feedback from the usage events"""
+        
+        date_from = datetime.now() - timedelta(days=days)
+        
+        # Write out this worker's buffer so the figures include the latest events
+        self.env['ai.usage.event'].flush_events()
+        
+        self.env.cr.execute("""
+            SELECT 
+                event_type,
+                COUNT(*) as events,
+                COUNT(DISTINCT user_id) as users,
+                COUNT(*) FILTER (WHERE success = False) as failures,
+                COUNT(rating) as ratings,
+                AVG(rating) as avg_rating,
+                COUNT(feedback) as feedback_count
+            FROM ai_usage_event
+            WHERE event_date >= %s
+            GROUP BY event_type
+            ORDER BY events DESC
+        """, (date_from,))
+        
+        results = self.env.cr.dictfetchall()
+        for result in results:
+            result['avg_rating'] = round(float(result['avg_rating']), 2) if result['avg_rating'] is not None else None
+            result['failure_rate_percent'] = round(result['failures'] / max(result['events'], 1) * 100, 1)
+        
+        return results
+
     @api.model
     def export_business_report(self, days=30):
         """Export comprehensive business report"""
@@ -304,6 +446,8 @@ class AIBusinessAnalytics(models.Model):
         daily_usage = self.get_daily_usage_chart(days)
         provider_breakdown = self.get_provider_breakdown(days)
         conversation_analytics = self.get_conversation_analytics(days)
+        cache_metrics = self.get_cache_metrics(days)
+        usage_events = self.get_usage_event_metrics(days)
         
         return {
             'report_generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -313,4 +457,138 @@ class AIBusinessAnalytics(models.Model):
             'daily_usage': daily_usage,
             'provider_breakdown': provider_breakdown,
             'conversation_analytics': conversation_analytics,
+            'cache_metrics': cache_metrics,
+            'usage_events': usage_events,
+        }
+
+    @api.model
+    def _iter_report_sections(self, days=30):
+        """The business report as (title, header, rows) sections for the report writers
+
+        Long sections are read through server-side cursors while they are
+        written, so a multi-year report needs no more memory than a weekly one.
+        """
+        date_from = datetime.now() - timedelta(days=days)
+        summary = {
+            'summary': self.get_business_metrics(days),
+            'conversations': self.get_conversation_analytics(days),
+            'cache': self.get_cache_metrics(days),
         }
+        yield 'Summary', ['Metric', 'Value'], self._flatten_metrics(summary)
+
+        yield 'Daily Usage', ['Date', 'Messages', 'Tokens', 'Credits', 'Revenue (USD)', 'Cost (USD)', 'Users'], \
+            self._stream_query('ai_report_daily', """
+                SELECT 
+                    b.day::date,
+                    COALESCE(SUM(d.message_count), 0),
+                    COALESCE(SUM(d.tokens_used), 0),
+                    ROUND(COALESCE(SUM(d.credits_used), 0)::numeric, 2)::float,
+                    ROUND(COALESCE(SUM(d.revenue_usd), 0)::numeric, 2)::float,
+                    ROUND(COALESCE(SUM(d.cost_usd), 0)::numeric, 4)::float,
+                    COUNT(DISTINCT d.user_id) FILTER (WHERE d.message_count > 0)
+                FROM generate_series(%s::date, %s::date, '1 day'::interval) b(day)
+                LEFT JOIN ai_usage_daily d ON d.usage_date = b.day::date
+                GROUP BY b.day
+                ORDER BY b.day
+            """, (date_from.date(), datetime.now().date()))
+
+        yield 'Users', ['User ID', 'User', 'Messages', 'Tokens', 'Credits', 'Revenue (USD)', 'Last Usage'], \
+            self._stream_query('ai_report_users', """
+                SELECT 
+                    u.id,
+                    p.name,
+                    SUM(d.message_count),
+                    SUM(d.tokens_used),
+                    ROUND(SUM(d.credits_used)::numeric, 2)::float,
+                    ROUND(SUM(d.revenue_usd)::numeric, 2)::float,
+                    MAX(d.last_message_date)
+                FROM ai_usage_daily d
+                JOIN res_users u ON d.user_id = u.id
+                JOIN res_partner p ON u.partner_id = p.id
+                WHERE d.usage_date >= %s
+                GROUP BY u.id, p.name
+                HAVING SUM(d.message_count) > 0
+                ORDER BY SUM(d.revenue_usd) DESC, u.id
+            """, (date_from.date(),))
+
+        # One row per configuration: small enough to read at once
+        yield 'Providers', ['Provider', 'Model', 'Messages', 'Tokens', 'Cost (USD)', 'Revenue (USD)',
+                            'Profit (USD)', 'Avg Response Time (s)', 'Cost per 1K Tokens'], (
+            [row['provider'], row['model_name'], row['message_count'], row['total_tokens'], row['total_cost'],
+             row['total_revenue'], row['profit'], row['avg_response_time'], row['cost_per_1k_tokens']]
+            for row in self.get_provider_breakdown(days)
+        )
+
+    def _flatten_metrics(self, metrics, prefix=''):
+        """(dotted key, value) rows from nested metric dicts"""
+        for key, value in metrics.items():
+            if isinstance(value, dict):
+                yield from self._flatten_metrics(value, f"{prefix}{key}.")
+            else:
+                yield [f"{prefix}{key}", value]
+
+    def _stream_query(self, name, query, params=()):
+        """Yield the rows of ``query`` from a server-side cursor, REPORT_FETCH_SIZE at a time"""
+        cr = self.env.cr
+        cr.execute(f"DECLARE {name} NO SCROLL CURSOR FOR {query}", params)
+        try:
+            while True:
+                cr.execute(f"FETCH {REPORT_FETCH_SIZE} FROM {name}")
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            if not cr.closed:
+                cr.execute(f"CLOSE {name}")
+
+    @api.model
+    def render_report_attachment(self, days=7, file_format=None):
+        """Render the report once into an attachment shared by all its recipients"""
+        file_format = file_format or self.env['ir.config_parameter'].sudo().get_param(
+            'ai_assistant.report_format', 'xlsx'
+        )
+        if file_format not in REPORT_FORMATS:
+            raise UserError(_("Unsupported report format %s. Use one of: %s")
+                            % (file_format, ', '.join(REPORT_FORMATS)))
+        mimetype, extension = REPORT_FORMATS[file_format]
+
+        # Rendered to disk as rows stream in; only the finished file is read back to store it
+        with tempfile.TemporaryFile() as report_file:
+            write_report(self._iter_report_sections(days), file_format, report_file)
+            report_file.seek(0)
+            return self.env['ir.attachment'].sudo().create({
+                'name': f"AI Usage Report {fields.Date.today()} ({days}d).{extension}",
+                'raw': report_file.read(),
+                'mimetype': mimetype,
+                'res_model': self._name,
+                'res_id': 0,
+            })
+
+    @api.model
+    def _cron_send_weekly_report(self):
+        """Render the weekly report once and send the same file to every manager"""
+        managers = self.env.ref('ai_assistant.group_ai_assistant_manager').users
+        if not managers:
+            return False
+
+        attachment = self.render_report_attachment(days=7)
+        download_url = f"/ai_assistant/report/shared/{attachment.id}"
+        if 'mail.mail' in self.env:
+            # One mail for all recipients, all pointing at the same attachment
+            self.env['mail.mail'].sudo().create({
+                'subject': _("AI Assistant weekly usage report"),
+                'body_html': _("<p>The AI Assistant usage report for the last 7 days is attached.</p>"),
+                'recipient_ids': [(6, 0, managers.partner_id.ids)],
+                'attachment_ids': [(4, attachment.id)],
+            })
+        else:
+            self.env['bus.bus']._sendmany([
+                (manager.partner_id, 'ai_assistant.report', {
+                    'name': attachment.name,
+                    'url': download_url,
+                })
+                for manager in managers
+            ])
+        _logger.info(f"Weekly AI usage report {attachment.name} shared with {len(managers)} managers")
+        return attachment
@@ -1,8 +1,22 @@
 from odoo import models, fields, api
+import hashlib
 import logging
 
+from ..tools.context_builder import estimate_tokens, summarize_turn, trim_summary, render_context
+
 _logger = logging.getLogger(__name__)
 
+CONVERSATION_COUNTER_FIELDS = [
+    'message_count', 'last_message_date', 'total_tokens_used', 'total_cost_usd', 'total_credits_used',
+]
+
+# Share of the context budget kept for the rolling summary
+CONTEXT_SUMMARY_SHARE = 0.25
+# Most turns sent verbatim in the recent window
+CONTEXT_MAX_TURNS = 50
+# Turns read per query when folding a long backlog into the summary
+CONTEXT_FOLD_BATCH = 500
+
 class AIConversation(models.Model):
     _name = 'ai.conversation'
     _description = 'AI Conversation'
@@ -12,33 +26,198 @@ class AIConversation(models.Model):
     title = fields.Char(string='Title', required=True, default='New Conversation')
     user_id = fields.Many2one('res.users', string='User', required=True, default=lambda self: self.env.user)
     message_ids = fields.One2many('ai.message', 'conversation_id', string='Messages')
-    message_count = fields.Integer(string='Message Count', compute='_compute_message_count')
-    last_message_date = fields.Datetime(string='Last Message', compute='_compute_last_message_date')
+    # Counters maintained by ai.message create/write/unlink, never recomputed from message_ids
+    message_count = fields.Integer(string='Message Count', default=0, readonly=True)
+    last_message_date = fields.Datetime(string='Last Message', readonly=True, default=fields.Datetime.now,
+                                        help='Creation date until the first message, so it is never empty')
     is_active = fields.Boolean(string='Active', default=True)
     context_info = fields.Text(string='Context Information', help='Additional context about user\'s current Odoo session')
+
+    # Rolling summary of the turns that no longer fit in the context window
+    context_summary = fields.Text(string='Context Summary', readonly=True)
+    # Plain integer, ai_message may be partitioned; cleared by ai.message unlink
+    context_summary_message_ref = fields.Integer(string='Summarized Up To ID', readonly=True)
+    context_summary_message_id = fields.Many2one('ai.message', string='Summarized Up To',
+                                                 compute='_compute_context_summary_message_id')
+    context_summary_tokens = fields.Integer(string='Summary Tokens', readonly=True)
     
     # Analytics fields
-    total_tokens_used = fields.Integer(string='Total Tokens Used', compute='_compute_analytics', store=True)
-    total_cost_usd = fields.Float(string='Total Cost (USD)', compute='_compute_analytics', store=True)
-    total_credits_used = fields.Float(string='Total Credits Used', compute='_compute_analytics', store=True)
-
-    @api.depends('message_ids')
-    def _compute_message_count(self):
-        for record in self:
-            record.message_count = len(record.message_ids)
-
-    @api.depends('message_ids.create_date')
-    def _compute_last_message_date(self):
-        for record in self:
-            if record.message_ids:
-                record.last_message_date = max(record.message_ids.mapped('create_date'))
-            else:
-                record.last_message_date = False
-
-    @api.depends('message_ids.tokens_used', 'message_ids.credit_cost', 'message_ids.actual_cost_usd')
-    def _compute_analytics(self):
-        for record in self:
-            ai_messages = record.message_ids.filtered(lambda m: not m.is_user_message)
-            record.total_tokens_used = sum(ai_messages.mapped('tokens_used'))
-            record.total_cost_usd = sum(ai_messages.mapped('actual_cost_usd'))
-            record.total_credits_used = su
+    total_tokens_used = fields.Integer(string='Total Tokens Used', default=0, readonly=True)
+    total_cost_usd = fields.Float(string='Total Cost (USD)', default=0.0, readonly=True)
+    total_credits_used = fields.Float(string='Total Credits Used', default=0.0, readonly=True)
+
+    @api.depends('context_summary_message_ref')
+    def _compute_context_summary_message_id(self):
+        messages = self.env['ai.message']._browse_references(self.mapped('context_summary_message_ref'))
+        for conversation in self:
+            conversation.context_summary_message_id = messages.get(conversation.context_summary_message_ref, False)
+
+    def init(self):
+        # Sidebar listing and keyset pagination in display order, answered from the index alone.
+        # Replaces the older index ordered on create_date, which the id tie-breaker cannot use.
+        self.env.cr.execute("DROP INDEX IF EXISTS ai_conversation_user_last_message_idx")
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ai_conversation_user_last_message_keyset_idx
+            ON ai_conversation (user_id, last_message_date DESC, id DESC)
+            INCLUDE (title, message_count, total_credits_used, is_active)
+        """)
+
+    def _build_context(self, before_message=None):
+        """History to send with the next prompt, within the configured token budget
+
+        Recent turns are sent verbatim, newest first until the budget or
+        CONTEXT_MAX_TURNS is used; every turn older than that window and not
+        summarized yet is folded into the stored rolling summary, so each
+        message only touches the few turns that changed. Returns
+        ``{'text', 'tokens', 'fingerprint'}``.
+        """
+        self.ensure_one()
+        config = self.env['ai.assistant.config'].get_active_snapshot()
+        budget = config.context_token_budget
+        if budget <= 0:
+            return {'text': '', 'tokens': 0, 'fingerprint': None}
+
+        summary_budget = int(budget * CONTEXT_SUMMARY_SHARE)
+        remaining = budget - summary_budget - estimate_tokens(self.context_info, config.model_name)
+        summarized_id = self.context_summary_message_ref or 0
+
+        domain = [('conversation_id', '=', self.id), ('id', '>', summarized_id)]
+        if before_message:
+            domain.append(('id', '<', before_message.id))
+        candidates = self.env['ai.message'].sudo().search(domain, order='id desc', limit=CONTEXT_MAX_TURNS)
+
+        recent = self.env['ai.message']
+        for message in candidates:
+            cost = estimate_tokens(message.content, config.model_name) + 2
+            if cost > remaining:
+                break
+            recent |= message
+            remaining -= cost
+
+        # Everything older than the window and newer than the summary is folded in
+        lines = None
+        for page in self._fold_pages(candidates, recent, summarized_id):
+            if lines is None:
+                lines = (self.context_summary or '').splitlines()
+            lines += [summarize_turn(message.role, message.content) for message in page]
+            lines, tokens = trim_summary(lines, summary_budget)
+            folded_id = page[-1].id
+        if lines is not None:
+            self.sudo().write({
+                'context_summary': '\n'.join(lines),
+                'context_summary_message_ref': folded_id,
+                'context_summary_tokens': tokens,
+            })
+
+        turns = [(message.role, message.content) for message in recent.sorted('id')]
+        text = render_context(self.context_info, self.context_summary, turns)
+        return {
+            'text': text,
+            'tokens': estimate_tokens(text, config.model_name),
+            'fingerprint': hashlib.sha256(text.encode()).hexdigest() if text else None,
+        }
+
+    def _fold_pages(self, candidates, recent, summarized_id):
+        """Messages to fold into the summary, oldest first, in pages
+
+        When fewer than CONTEXT_MAX_TURNS were unsummarized they are all in
+        ``candidates``; otherwise older ones may be left (e.g. the first
+        call on a long conversation) and are read a page at a time.
+        """
+        if len(candidates) < CONTEXT_MAX_TURNS:
+            to_fold = (candidates - recent).sorted('id')
+            if to_fold:
+                yield to_fold
+            return
+
+        domain = [('conversation_id', '=', self.id)]
+        if recent:
+            domain.append(('id', '<', min(recent.ids)))
+        else:
+            # Candidates are newest first
+            domain.append(('id', '<=', candidates[0].id))
+        last_id = summarized_id
+        while True:
+            page = self.env['ai.message'].sudo().search(
+                domain + [('id', '>', last_id)], order='id', limit=CONTEXT_FOLD_BATCH)
+            if page:
+                yield page
+            if len(page) < CONTEXT_FOLD_BATCH:
+                return
+            last_id = page[-1].id
+
+    def _estimate_context_tokens(self):
+        """Upper bound of the context tokens of the next message, without touching the summary"""
+        self.ensure_one()
+        config = self.env['ai.assistant.config'].get_active_snapshot()
+        if config.context_token_budget <= 0:
+            return 0
+        if not self.message_count:
+            return min(config.context_token_budget, estimate_tokens(self.context_info, config.model_name))
+        return config.context_token_budget
+
+    @api.model
+    def _apply_message_deltas(self, deltas):
+        """Apply counter deltas, ``{conversation_id: {field: delta}}``, in one UPDATE per conversation"""
+        for conversation_id, delta in deltas.items():
+            self.env.cr.execute("""
+                UPDATE ai_conversation
+                SET message_count = message_count + %s,
+                    last_message_date = GREATEST(last_message_date, %s),
+                    total_tokens_used = total_tokens_used + %s,
+                    total_cost_usd = total_cost_usd + %s,
+                    total_credits_used = total_credits_used + %s
+                WHERE id = %s
+            """, (
+                int(delta.get('message_count', 0)),
+                delta.get('last_message_date'),
+                int(delta.get('tokens_used', 0)),
+                delta.get('actual_cost_usd', 0.0),
+                delta.get('credit_cost', 0.0),
+                conversation_id,
+            ))
+        self.browse(list(deltas)).invalidate_recordset(CONVERSATION_COUNTER_FIELDS)
+
+    def _refresh_last_message_date(self):
+        """Re-read the latest message date, needed when messages are deleted"""
+        if not self.ids:
+            return
+        self.env.cr.execute("""
+            UPDATE ai_conversation c
+            SET last_message_date = COALESCE(
+                (SELECT MAX(m.create_date) FROM ai_message m WHERE m.conversation_id = c.id),
+                c.create_date
+            )
+            WHERE c.id IN %s
+        """, (tuple(self.ids),))
+        self.invalidate_recordset(['last_message_date'])
+
+    def _recompute_counters(self):
+        """Rebuild the counters of these conversations, or of all when empty, from ai_message"""
+        where, params = ("AND c.id IN %s", (tuple(self.ids),)) if self else ("", ())
+        self.env.cr.execute(f"""
+            UPDATE ai_conversation c
+            SET message_count = COALESCE(s.message_count, 0),
+                last_message_date = COALESCE(s.last_message_date, c2.create_date),
+                total_tokens_used = COALESCE(s.tokens_used, 0),
+                total_cost_usd = COALESCE(s.cost_usd, 0),
+                total_credits_used = COALESCE(s.credits_used, 0)
+            FROM ai_conversation c2
+            LEFT JOIN (
+                SELECT 
+                    conversation_id,
+                    COUNT(*) as message_count,
+                    MAX(create_date) as last_message_date,
+                    SUM(tokens_used) FILTER (WHERE NOT is_user_message) as tokens_used,
+                    SUM(actual_cost_usd) FILTER (WHERE NOT is_user_message) as cost_usd,
+                    SUM(credit_cost) FILTER (WHERE NOT is_user_message) as credits_used
+                FROM ai_message
+                {"WHERE conversation_id IN %s" if self else ""}
+                GROUP BY conversation_id
+            ) s ON s.conversation_id = c2.id
+            WHERE c.id = c2.id {where}
+        """, params * 2)
+        row_count = self.env.cr.rowcount
+        self.env.invalidate_all()
+        _logger.info(f"Recomputed counters for {row_count} AI conversations")
+        return row_count
@@ -0,0 +1,153 @@
+from odoo import models, fields, api, exceptions
+import logging
+import time
+
+from ..tools import metrics
+
+_logger = logging.getLogger(__name__)
+
+class AIDispatchJob(models.Model):
+    _name = 'ai.dispatch.job'
+    _description = 'AI Message Dispatch Job'
+    _order = 'id'
+
+    conversation_id = fields.Many2one('ai.conversation', string='Conversation', required=True, ondelete='cascade')
+    user_id = fields.Many2one('res.users', string='User', required=True, default=lambda self: self.env.user)
+    # Plain integers, ai_message may be partitioned; cleared by ai.message unlink
+    user_message_ref = fields.Integer(string='User Message ID', index='btree_not_null')
+    reply_message_ref = fields.Integer(string='Reply Message ID', index='btree_not_null')
+    user_message_id = fields.Many2one('ai.message', string='User Message', compute='_compute_message_ids',
+                                      search='_search_user_message_id')
+    reply_message_id = fields.Many2one('ai.message', string='Reply Message', compute='_compute_message_ids',
+                                       search='_search_reply_message_id')
+    content = fields.Text(string='Prompt', required=True)
+
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='queued', required=True, index=True)
+    attempts = fields.Integer(string='Attempts', default=0)
+    error_message = fields.Text(string='Error')
+    date_done = fields.Datetime(string='Completed On')
+
+    @api.depends('user_message_ref', 'reply_message_ref')
+    def _compute_message_ids(self):
+        messages = self.env['ai.message']._browse_references(
+            self.mapped('user_message_ref') + self.mapped('reply_message_ref'))
+        for job in self:
+            job.user_message_id = messages.get(job.user_message_ref, False)
+            job.reply_message_id = messages.get(job.reply_message_ref, False)
+
+    def _search_user_message_id(self, operator, value):
+        return self.env['ai.message']._reference_domain('user_message_ref', operator, value)
+
+    def _search_reply_message_id(self, operator, value):
+        return self.env['ai.message']._reference_domain('reply_message_ref', operator, value)
+
+    @api.model
+    def enqueue(self, conversation, user_message, content):
+        """Queue a provider call for a saved user message and wake the dispatcher"""
+        job = self.sudo().create({
+            'conversation_id': conversation.id,
+            'user_id': self.env.user.id,
+            'user_message_ref': user_message.id,
+            'content': content,
+        })
+
+        # Run as soon as this transaction commits instead of waiting for the next cron tick
+        self.env.ref('ai_assistant.cron_dispatch_ai_jobs')._trigger()
+        return job
+
+    @api.model
+    def _cron_dispatch(self, limit=20):
+        """Process queued dispatch jobs, committing after each one"""
+        max_attempts = int(self.env['ir.config_parameter'].sudo().get_param(
+            'ai_assistant.async_max_attempts', '3'
+        ))
+
+        for _i in range(limit):
+            # SKIP LOCKED lets several cron workers drain the queue without stepping on each other
+            self.env.cr.execute("""
+                SELECT id FROM ai_dispatch_job
+                WHERE state = 'queued'
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """)
+            row = self.env.cr.fetchone()
+            if not row:
+                break
+
+            job = self.browse(row[0])
+            job.write({'state': 'running', 'attempts': job.attempts + 1})
+            try:
+                job._dispatch()
+            except exceptions.UserError as e:
+                # The account cannot pay for the reply: retrying would only call the provider again
+                self.env.cr.rollback()
+                job = self.browse(row[0])
+                _logger.info(f"AI dispatch job {job.id} refused: {str(e)}")
+                job.write({
+                    'state': 'failed',
+                    'attempts': job.attempts + 1,
+                    'error_message': str(e),
+                })
+                job._notify_user({'error': True, 'message': str(e), 'insufficient_credits': True})
+            except Exception as e:
+                self.env.cr.rollback()
+                job = self.browse(row[0])
+                state = 'failed' if job.attempts + 1 >= max_attempts else 'queued'
+                _logger.error(f"AI dispatch job {job.id} failed (attempt {job.attempts + 1}): {str(e)}")
+                job.write({
+                    'state': state,
+                    'attempts': job.attempts + 1,
+                    'error_message': str(e),
+                })
+                if state == 'failed':
+                    job._notify_user({'error': True, 'message': 'The AI reply could not be generated. Please try again.'})
+            self.env.cr.commit()
+
+    def _dispatch(self):
+        """Call the provider for this job and store the assistant reply"""
+        self.ensure_one()
+        conversation = self.conversation_id
+        config = self.env['ai.assistant.config'].get_active_snapshot()
+        started = time.perf_counter()
+        with metrics.timer('ai_send_message_duration_seconds', mode='async'):
+            context = conversation._build_context(before_message=self.user_message_id)
+
+            reply = self.env['ai.message']._get_reply(
+                message=self.content,
+                chatbot_id=config.chatbot_id,
+                user_id=str(self.user_id.id),
+                conversation_id=str(conversation.id),
+                context_fingerprint=context['fingerprint'],
+                context=context['text']
+            )
+
+            reply_message = self.env['ai.message'].sudo()._create_reply(
+                conversation, self.content, reply, context['text'], time.perf_counter() - started
+            )
+
+        self.write({
+            'state': 'done',
+            'reply_message_ref': reply_message.id,
+            'error_message': False,
+            'date_done': fields.Datetime.now(),
+        })
+
+        self._notify_user({
+            'error': False,
+            'ai_message': reply_message._prepare_bus_payload(),
+        })
+
+    def _notify_user(self, payload):
+        """Push the job outcome to the user's chat widget"""
+        self.ensure_one()
+        payload.update({
+            'job_id': self.id,
+            'conversation_id': self.conversation_id.id,
+        })
+        self.env['bus.bus']._sendone(self.user_id.partner_id, 'ai_assistant.reply', payload)
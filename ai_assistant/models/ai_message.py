@@ -1,7 +1,19 @@
 # ai_message.py
 
-import requests
 from odoo import models, fields, api
+from collections import defaultdict
+import functools
+import time
+
+from ..tools import metrics
+from ..tools.provider_router import get_provider_router
+from ..tools.request_trace import phase
+from ..tools.tokenizer import count_tokens
+from ..tools.response_cache import get_response_cache, make_cache_key
+from .ai_usage_daily import ROLLUP_MESSAGE_FIELDS
+
+# ai.message fields summed into the ai.conversation totals (assistant messages only)
+CONVERSATION_METRIC_FIELDS = ['tokens_used', 'actual_cost_usd', 'credit_cost']
 
 class AIMessage(models.Model):
     _name = 'ai.message'
@@ -10,43 +22,302 @@ class AIMessage(models.Model):
     conversation_id = fields.Many2one('ai.conversation', string='Conversation', required=True)
     role = fields.Selection([('user', 'User'), ('assistant', 'Assistant')], required=True)
     content = fields.Text('Content', required=True)
+    is_user_message = fields.Boolean('User Message', compute='_compute_is_user_message', store=True)
+    config_id = fields.Many2one('ai.assistant.config', string='Configuration',
+                                default=lambda self: self._default_config_id())
+
+    # Usage metrics, summed into ai.usage.daily
+    tokens_used = fields.Integer('Tokens Used', default=0)
+    credit_cost = fields.Float('Credit Cost', default=0.0)
+    actual_cost_usd = fields.Float('Actual Cost (USD)', default=0.0)
+    revenue_usd = fields.Float('Revenue (USD)', default=0.0)
+    response_time = fields.Float('Response Time (s)', default=0.0)
+    error_message = fields.Text('Error Message')
+
+    def init(self):
+        # Every analytics query filters assistant messages by date
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ai_message_assistant_create_date_idx
+            ON ai_message (create_date) WHERE is_user_message = False
+        """)
+        # Loading a conversation's history in order
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ai_message_conversation_create_date_idx
+            ON ai_message (conversation_id, create_date, id)
+        """)
+
+    @api.depends('role')
+    def _compute_is_user_message(self):
+        for record in self:
+            record.is_user_message = record.role == 'user'
+
+    def _default_config_id(self):
+        return self.env['ai.assistant.config'].get_config_snapshot().id
+
+    @api.model
+    def _browse_references(self, ids):
+        """Existing messages among ``ids``, by id
+
+        Other tables point at ai.message through plain integer columns: once
+        partitioned, it cannot be the target of a foreign key.
+        """
+        return {message.id: message for message in self.browse({ref for ref in ids if ref}).exists()}
+
+    @api.model
+    def _reference_domain(self, column, operator, value):
+        """Domain on the integer ``column`` equivalent to ``(message field, operator, value)``"""
+        if isinstance(value, str):
+            return [(column, 'in', self._search([('display_name', operator, value)]))]
+        if value is False or value is None:
+            # Cleared references are stored as 0 or NULL
+            return [(column, 'in', [0, False])] if operator == '=' else [(column, '>', 0)]
+        return [(column, operator, value)]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        messages = super().create(vals_list)
+        self.env['ai.usage.daily']._queue_message_deltas(messages)
+        self.env['ai.conversation'].sudo()._apply_message_deltas(messages._conversation_deltas())
+        return messages
+
+    def write(self, vals):
+        tracked = [name for name in ROLLUP_MESSAGE_FIELDS if name in vals]
+        old_values = {message.id: {name: message[name] for name in tracked} for message in self} if tracked else {}
+        result = super().write(vals)
+        conversation_deltas = defaultdict(lambda: defaultdict(float))
+        for message in self.filtered(lambda m: m.id in old_values):
+            self.env['ai.usage.daily']._queue_field_deltas(message, old_values[message.id])
+            if not message.is_user_message:
+                delta = conversation_deltas[message.conversation_id.id]
+                for name in CONVERSATION_METRIC_FIELDS:
+                    delta[name] += (message[name] or 0) - (old_values[message.id].get(name, message[name]) or 0)
+        if conversation_deltas:
+            self.env['ai.conversation'].sudo()._apply_message_deltas(conversation_deltas)
+        return result
+
+    def unlink(self):
+        if not self.env.context.get('ai_keep_usage_rollup'):
+            self.env['ai.usage.daily']._queue_message_deltas(self, sign=-1)
+        deltas = self._conversation_deltas(sign=-1)
+        conversations = self.conversation_id
+        if self.ids:
+            # References to messages are plain integers: apply their ondelete by hand
+            self.env['ai.partition.manager']._clear_references(self._table, 'SELECT unnest(%s)', [self.ids])
+        result = super().unlink()
+        conversations = conversations.sudo().exists()
+        conversations._apply_message_deltas({cid: deltas[cid] for cid in conversations.ids})
+        conversations._refresh_last_message_date()
+        return result
+
+    def _conversation_deltas(self, sign=1):
+        """Counter deltas for ai.conversation, grouped by conversation"""
+        deltas = defaultdict(lambda: defaultdict(float))
+        for message in self:
+            delta = deltas[message.conversation_id.id]
+            delta['message_count'] += sign
+            if sign > 0:
+                delta['last_message_date'] = max(
+                    delta.get('last_message_date') or message.create_date, message.create_date
+                )
+            if not message.is_user_message:
+                for name in CONVERSATION_METRIC_FIELDS:
+                    delta[name] += sign * (message[name] or 0)
+        return deltas
+
+    @api.model
+    def send_message_to_ai(self, conversation_id, user_input):
+        """Answer a message inline, returning both messages the way the chat widget renders them"""
+        conversation = self.env['ai.conversation'].browse(conversation_id)
+        with metrics.timer('ai_send_message_duration_seconds', mode='inline'):
+            user_message, ai_message = self._answer_input(conversation, user_input)
+        with phase('serialization'):
+            return {
+                'error': False,
+                'user_message': user_message._prepare_bus_payload(),
+                'ai_message': ai_message._prepare_bus_payload(),
+            }
 
     @api.model
     def create_from_input(self, conversation, user_input):
-        config = self.env['ai.assistant.config'].sudo().get_active_config()
+        return self._answer_input(conversation, user_input)[1]
+
+    @api.model
+    def _answer_input(self, conversation, user_input):
+        """Store the user message and the reply to it; returns both
+
+        Both messages are in a savepoint with the debit: when the account
+        cannot pay for the reply (UserError), neither is kept.
+        """
+        started = time.perf_counter()
+        config = self.env['ai.assistant.config'].get_active_snapshot()
+
+        with self.env.cr.savepoint():
+            with phase('db_write'):
+                user_message = self.create({
+                    'conversation_id': conversation.id,
+                    'role': 'user',
+                    'content': user_input,
+                })
+            with phase('context'):
+                context = conversation._build_context(before_message=user_message)
+
+            reply = self._get_reply(
+                message=user_input,
+                chatbot_id=config.chatbot_id,
+                user_id=str(self.env.user.id),
+                conversation_id=str(conversation.id),
+                context_fingerprint=context['fingerprint'],
+                context=context['text']
+            )
 
-        self.create({
+            with phase('db_write'):
+                ai_message = self._create_reply(conversation, user_input, reply, context['text'],
+                                                time.perf_counter() - started)
+        return user_message, ai_message
+
+    @api.model
+    def _create_reply(self, conversation, prompt, reply, context=None, response_time=0.0):
+        """Store a reply from ``_get_reply`` and debit its owner for it
+
+        Raises UserError when the account cannot pay; the caller rolls the
+        reply back with the rest of its transaction.
+        """
+        usage = self._reply_usage(prompt, reply['text'], context) if reply['billable'] else {}
+        ai_message = self.create(dict(usage, **{
+            'conversation_id': conversation.id,
+            'role': 'assistant',
+            'content': reply['text'],
+            'response_time': response_time,
+        }))
+        if reply['cache_hit']:
+            ai_message._record_cache_hit()
+        else:
+            ai_message._charge_reply()
+            if reply.get('cache_key'):
+                self._store_cached_reply(reply['cache_key'], reply['text'])
+        return ai_message
+
+    @api.model
+    def send_message_async(self, conversation_id, user_input):
+        """Save the user message and queue the provider call, returning a job handle"""
+        conversation = self.env['ai.conversation'].browse(conversation_id)
+
+        user_message = self.create({
             'conversation_id': conversation.id,
             'role': 'user',
             'content': user_input,
         })
 
-        reply = self.send_to_chatwhisperer(
-            message=user_input,
-            chatbot_id=config.chatwhisperer_bot_id,
-            user_id=str(self.env.user.id),
-            conversation_id=str(conversation.id)
-        )
+        job = self.env['ai.dispatch.job'].enqueue(conversation, user_message, user_input)
 
-        return self.create({
-            'conversation_id': conversation.id,
-            'role': 'assistant',
-            'content': reply,
-        })
+        return {
+            'error': False,
+            'pending': True,
+            'job_id': job.id,
+            'user_message': user_message._prepare_bus_payload(),
+        }
+
+    def _prepare_bus_payload(self):
+        """Serialize a message the way the chat widget renders it"""
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'content': self.content,
+            'is_user_message': self.is_user_message,
+            'create_date': fields.Datetime.to_string(self.create_date),
+        }
 
     def send_to_chatwhisperer(self, message, chatbot_id, user_id, conversation_id):
-        url = "https://bot.chatwhisperer.ai/api/1.1/wf/chat"
+        return self._get_reply(message, chatbot_id, user_id, conversation_id)['text']
+
+    def _get_reply(self, message, chatbot_id, user_id, conversation_id, context_fingerprint=None, context=None):
+        """Get the reply for a prompt, from the response cache when possible
+
+        A provider reply is not cached here: ``_create_reply`` caches it
+        once it has been paid for.
+        """
+        cache_key = self._reply_cache_key(message, chatbot_id, context_fingerprint)
+        with phase('cache'):
+            cached = self._get_cached_reply(cache_key)
+        if cached is not None:
+            return {'text': cached, 'cache_hit': True, 'error': False, 'billable': False}
+
         payload = {
             "message": message,
             "chatbotId": chatbot_id,
             "userId": user_id,
             "conversationId": conversation_id
         }
+        if context:
+            payload["context"] = context
         try:
-            response = requests.post(url, json=payload, timeout=15)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("response", {}).get("text", "(No reply received)")
+            with phase('provider'):
+                data = get_provider_router(self.env).post_chat(payload)
         except Exception as e:
-            return f"(Error contacting ChatWhisperer: {str(e)})"
+            return {'text': f"(Error contacting ChatWhisperer: {str(e)})", 'cache_hit': False, 'error': True,
+                    'billable': False}
+
+        text = data.get("response", {}).get("text")
+        if not text:
+            return {'text': "(No reply received)", 'cache_hit': False, 'error': False, 'billable': False}
+
+        self._count_tokens_consumed('chat', message, text, context)
+        return {'text': text, 'cache_hit': False, 'error': False, 'billable': True, 'cache_key': cache_key}
+
+    @api.model
+    def _reply_usage(self, prompt, reply, context=None):
+        """Usage fields of a provider reply: tokens both ways, provider cost and credits to charge"""
+        config = self.env['ai.assistant.config'].get_active_snapshot()
+        tokens = sum(count_tokens(text, config.model_name) for text in (prompt, context, reply))
+        cost_usd = tokens / 1000.0 * config.cost_per_1k_tokens
+        return {
+            'tokens_used': tokens,
+            'actual_cost_usd': cost_usd,
+            'revenue_usd': cost_usd * (1 + config.markup_percentage / 100.0),
+            'credit_cost': config.calculate_credit_cost(tokens),
+        }
+
+    def _charge_reply(self):
+        """Debit the conversation owner for the credit cost of this reply"""
+        self.ensure_one()
+        if not self.credit_cost:
+            return
+        user_credit = self.env['ai.user.credit'].sudo().get_or_create_user_credit(
+            self.conversation_id.user_id.id
+        )
+        user_credit.consume_credits(self.credit_cost, message_id=self.id)
+
+    @api.model
+    def _count_tokens_consumed(self, source, prompt, reply, context=None):
+        """Add a provider exchange to the token counters"""
+        model_name = self.env['ai.assistant.config'].get_config_snapshot().model_name
+        metrics.inc('ai_tokens_consumed_total', count_tokens(prompt, model_name) + count_tokens(context, model_name),
+                    source=source, kind='prompt')
+        metrics.inc('ai_tokens_consumed_total', count_tokens(reply, model_name), source=source, kind='completion')
+
+    @api.model
+    def _reply_cache_key(self, message, chatbot_id, context_fingerprint=None):
+        return make_cache_key(message, chatbot_id, context_fingerprint)
+
+    @api.model
+    def _get_cached_reply(self, cache_key):
+        cache = get_response_cache(self.env)
+        if cache is None:
+            return None
+        return cache.get(cache_key)
+
+    @api.model
+    def _store_cached_reply(self, cache_key, text):
+        """Cache a paid-for reply once the transaction that debited it commits"""
+        cache = get_response_cache(self.env)
+        if cache is not None:
+            self.env.cr.postcommit.add(functools.partial(cache.set, cache_key, text))
+
+    def _record_cache_hit(self):
+        """Log a cached reply against the conversation owner's credits"""
+        self.ensure_one()
+        user_credit = self.env['ai.user.credit'].sudo().get_or_create_user_credit(
+            self.conversation_id.user_id.id
+        )
+        user_credit.record_cache_hit(message_id=self.id)
 
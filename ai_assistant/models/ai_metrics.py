@@ -0,0 +1,84 @@
+from odoo import models, api
+import json
+import logging
+
+from ..tools import metrics
+
+_logger = logging.getLogger(__name__)
+
+# Rows of workers silent for this long are folded into one row, so recycled workers do not pile up
+RETIRE_AFTER_HOURS = 24
+RETIRED_WORKER = 'retired'
+
+class AIMetrics(models.AbstractModel):
+    _name = 'ai.metrics'
+    _description = 'AI Pipeline Metrics'
+
+    def init(self):
+        # Unlogged like the rate limiter: one row of running totals per worker process
+        self.env.cr.execute("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS ai_metrics_worker (
+                worker VARCHAR PRIMARY KEY,
+                samples JSONB NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            )
+        """)
+
+    def _register_hook(self):
+        super()._register_hook()
+        # Workers forked after the registry is loaded inherit this
+        metrics.watch(self.env.cr.dbname)
+
+    @api.model
+    def render_metrics(self):
+        """Prometheus text exposition of the totals of every worker, as last published
+
+        Read-only: each worker publishes from its own thread, and stopped
+        workers are folded away by the cron.
+        """
+        metrics.watch(self.env.cr.dbname)
+        self.env.cr.execute("""
+            SELECT samples, worker <> %s AND updated_at > (now() at time zone 'UTC') - interval '1 second' * %s
+            FROM ai_metrics_worker
+        """, (RETIRED_WORKER, metrics.PUBLISH_INTERVAL * 4))
+        totals = {}
+        live = 0
+        for samples, recent in self.env.cr.fetchall():
+            for key, value in samples.items():
+                totals[key] = totals.get(key, 0) + value
+            live += bool(recent)
+        return metrics.render(totals, extra=[
+            ('ai_metrics_workers', 'gauge', 'Worker processes that published metrics recently', live),
+        ])
+
+    @api.model
+    def _cron_retire_workers(self):
+        self._retire_workers()
+
+    def _retire_workers(self):
+        """Fold the rows of workers gone silent into the retired row, keeping the counters monotonic"""
+        cr = self.env.cr
+        cr.execute("""
+            DELETE FROM ai_metrics_worker
+            WHERE worker IN (
+                SELECT worker FROM ai_metrics_worker
+                WHERE updated_at < (now() at time zone 'UTC') - interval '1 hour' * %s AND worker <> %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING samples
+        """, (RETIRE_AFTER_HOURS, RETIRED_WORKER))
+        rows = cr.fetchall()
+        if not rows:
+            return
+        cr.execute("SELECT samples FROM ai_metrics_worker WHERE worker = %s FOR UPDATE", (RETIRED_WORKER,))
+        row = cr.fetchone()
+        retired = row[0] if row else {}
+        for (samples,) in rows:
+            for key, value in samples.items():
+                retired[key] = retired.get(key, 0) + value
+        cr.execute("""
+            INSERT INTO ai_metrics_worker (worker, samples, updated_at)
+            VALUES (%s, %s, now() at time zone 'UTC')
+            ON CONFLICT (worker) DO UPDATE SET samples = EXCLUDED.samples, updated_at = EXCLUDED.updated_at
+        """, (RETIRED_WORKER, json.dumps(retired)))
+        _logger.info(f"Folded the AI metrics of {len(rows)} stopped workers")
@@ -0,0 +1,208 @@
+from odoo import models, api
+from datetime import date
+from dateutil.relativedelta import relativedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Append-only tables range-partitioned by month on create_date
+PARTITIONED_TABLES = ['ai_message', 'ai_credit_transaction']
+
+# Columns pointing at partitioned tables. Postgres cannot enforce these as
+# foreign keys (the primary key includes create_date), so they are plain
+# Integer fields behind a computed Many2one and ondelete is done here.
+PARTITION_REFERENCES = {
+    'ai_message': [
+        ('ai_credit_transaction', 'message_ref'),
+        ('ai_dispatch_job', 'user_message_ref'),
+        ('ai_dispatch_job', 'reply_message_ref'),
+        ('ai_conversation', 'context_summary_message_ref'),
+    ],
+    'ai_credit_transaction': [],
+}
+
+class AIPartitionManager(models.AbstractModel):
+    _name = 'ai.partition.manager'
+    _description = 'AI Table Partition Manager'
+
+    @api.model
+    def _cron_ensure_partitions(self):
+        """Create the partitions for the coming months, converting the tables on first run"""
+        self.ensure_partitioning()
+
+    @api.model
+    def ensure_partitioning(self):
+        """Partition the tables if enabled and not done yet, and create upcoming partitions
+
+        Not run from ``init``: converting rewrites the whole table under an
+        exclusive lock. Upgrades convert from the migration script, new
+        installs from the cron.
+        """
+        enabled = self.env['ir.config_parameter'].sudo().get_param('ai_assistant.table_partitioning', 'True')
+        for table in PARTITIONED_TABLES:
+            if not self._is_partitioned(table):
+                if enabled != 'True':
+                    continue
+                self._convert_table(table)
+            self._ensure_partitions(table)
+
+    def _is_partitioned(self, table):
+        self.env.cr.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        row = self.env.cr.fetchone()
+        return bool(row) and row[0] == 'p'
+
+    def _months_ahead(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('ai_assistant.partition_months_ahead', '3'))
+
+    def _partition_name(self, table, month):
+        return f"{table}_p{month:%Y%m}"
+
+    def _convert_table(self, table):
+        """Swap a regular table for a monthly range-partitioned one holding the same rows"""
+        cr = self.env.cr
+        legacy = f"{table}_legacy"
+        _logger.info(f"Converting {table} to a partitioned table")
+
+        cr.execute(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE')
+
+        # Secondary indexes and outgoing foreign keys, to recreate on the new table
+        cr.execute("""
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s
+        """, (table, f"{table}_pkey"))
+        indexes = cr.fetchall()
+        cr.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+        """, (table,))
+        foreign_keys = cr.fetchall()
+
+        # Incoming foreign keys cannot target a partitioned table's id alone; the
+        # module's own references are plain integers, this catches any other
+        cr.execute("""
+            SELECT conrelid::regclass::text, conname FROM pg_constraint
+            WHERE confrelid = %s::regclass AND contype = 'f'
+        """, (table,))
+        for referencing_table, constraint in cr.fetchall():
+            cr.execute(f'ALTER TABLE {referencing_table} DROP CONSTRAINT "{constraint}"')
+
+        cr.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cr.execute(f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "{table}_pkey" TO "{legacy}_pkey"')
+        for name, _definition in indexes:
+            cr.execute(f'DROP INDEX "{name}"')
+        for name, _definition in foreign_keys:
+            cr.execute(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{name}"')
+
+        cr.execute(f"""
+            CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS)
+            PARTITION BY RANGE (create_date)
+        """)
+        cr.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, create_date)')
+        # The id sequence must survive dropping the old table
+        cr.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+
+        cr.execute(f'SELECT MIN(create_date) FROM "{legacy}"')
+        oldest = cr.fetchone()[0]
+        self._ensure_partitions(table, start=oldest.date() if oldest else None)
+
+        cr.execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+        row_count = cr.rowcount
+
+        for name, definition in indexes:
+            if definition.startswith('CREATE UNIQUE'):
+                _logger.warning(f"Skipping unique index {name}: it would have to include create_date")
+                continue
+            cr.execute(definition)
+        for name, definition in foreign_keys:
+            cr.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+        cr.execute(f'DROP TABLE "{legacy}"')
+        cr.execute(f'ANALYZE "{table}"')
+        _logger.info(f"Partitioned {table}: {row_count} rows moved")
+
+    def _ensure_partitions(self, table, start=None):
+        """Monthly partitions from ``start`` (default: this month) to the months ahead, plus a default"""
+        cr = self.env.cr
+        month = (start or date.today()).replace(day=1)
+        last = date.today().replace(day=1) + relativedelta(months=self._months_ahead())
+        default = f"{table}_default"
+
+        while month <= last:
+            name = self._partition_name(table, month)
+            cr.execute("SELECT to_regclass(%s)", (name,))
+            if cr.fetchone()[0] is None:
+                upper = month + relativedelta(months=1)
+                cr.execute("SELECT to_regclass(%s)", (default,))
+                if cr.fetchone()[0] is None:
+                    cr.execute(f"""
+                        CREATE TABLE "{name}" PARTITION OF "{table}"
+                        FOR VALUES FROM (%s) TO (%s)
+                    """, (month, upper))
+                else:
+                    # Rows of this month may already sit in the default partition: move them in
+                    cr.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)')
+                    cr.execute(f"""
+                        WITH moved AS (
+                            DELETE FROM "{default}" WHERE create_date >= %s AND create_date < %s RETURNING *
+                        )
+                        INSERT INTO "{name}" SELECT * FROM moved
+                    """, (month, upper))
+                    cr.execute(f"""
+                        ALTER TABLE "{table}" ATTACH PARTITION "{name}"
+                        FOR VALUES FROM (%s) TO (%s)
+                    """, (month, upper))
+                _logger.info(f"Created partition {name}")
+            month += relativedelta(months=1)
+
+        # Catches rows outside the monthly ranges, e.g. back-dated imports
+        cr.execute(f'CREATE TABLE IF NOT EXISTS "{default}" PARTITION OF "{table}" DEFAULT')
+
+    @api.model
+    def get_partitions(self, table):
+        """(name, lower bound, upper bound) of the monthly partitions of ``table``, oldest first"""
+        self.env.cr.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            ORDER BY c.relname
+        """, (table,))
+        partitions = []
+        for name, bound in self.env.cr.fetchall():
+            if bound == 'DEFAULT':
+                continue
+            # FOR VALUES FROM ('2024-01-01 00:00:00') TO ('2024-02-01 00:00:00')
+            lower, upper = [part.split("'")[1] for part in bound.split(' TO ')]
+            partitions.append((name, lower[:10], upper[:10]))
+        return partitions
+
+    @api.model
+    def drop_partitions_before(self, table, cutoff):
+        """Drop the whole-month partitions of ``table`` that end on or before ``cutoff``
+
+        Returns the number of rows removed. Much cheaper than deleting the
+        rows, and leaves no bloat behind.
+        """
+        if not self._is_partitioned(table):
+            return 0
+        cr = self.env.cr
+        removed = 0
+        for name, _lower, upper in self.get_partitions(table):
+            if upper > str(cutoff):
+                continue
+            cr.execute(f'SELECT COUNT(*) FROM "{name}"')
+            removed += cr.fetchone()[0]
+            self._clear_references(table, f'SELECT id FROM "{name}"')
+            cr.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+            cr.execute(f'DROP TABLE "{name}"')
+            _logger.info(f"Dropped partition {name}")
+        return removed
+
+    @api.model
+    def _clear_references(self, table, id_query, params=()):
+        """Null out columns pointing at rows of ``table`` about to disappear"""
+        for referencing_table, column in PARTITION_REFERENCES.get(table, []):
+            self.env.cr.execute(f"""
+                UPDATE "{referencing_table}" SET "{column}" = NULL
+                WHERE "{column}" IN ({id_query})
+            """, params)
@@ -0,0 +1,121 @@
+from odoo import models, api
+from datetime import datetime, timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Bucket scopes and the parameter holding their per-minute allowance (0 disables the scope)
+RATE_LIMIT_SCOPES = [
+    ('user', 'ai_assistant.rate_limit_per_minute', '10'),
+    ('company', 'ai_assistant.rate_limit_per_company_minute', '0'),
+    ('global', 'ai_assistant.rate_limit_global_minute', '0'),
+]
+
+class AIRateLimiter(models.AbstractModel):
+    _name = 'ai.rate.limiter'
+    _description = 'AI Rate Limiter'
+
+    def init(self):
+        # Unlogged: shared by every worker, cheap to write, and fine to lose on a crash
+        self.env.cr.execute("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS ai_rate_limit_bucket (
+                key VARCHAR PRIMARY KEY,
+                tokens DOUBLE PRECISION NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            )
+        """)
+
+    @api.model
+    def check(self, user=None):
+        """Take one token from each of the user's buckets; False if any is empty"""
+        taken = []
+        for key, capacity in self._get_buckets(user):
+            if not self._take(key, capacity):
+                # All or nothing: hand back what was already taken
+                for taken_key, taken_capacity in taken:
+                    self._give_back(taken_key, taken_capacity)
+                return False
+            taken.append((key, capacity))
+        return True
+
+    @api.model
+    def get_info(self, user=None):
+        """Current state of the user's own bucket, in the shape the chat API returns"""
+        key, capacity = self._get_buckets(user)[0]
+        rate_limit = int(capacity)
+        if not capacity:
+            return {'limit': 0, 'used': 0, 'remaining': 0, 'reset_time': None}
+
+        row = self._execute("""
+            SELECT
+                LEAST(%(capacity)s, tokens + EXTRACT(EPOCH FROM (now() at time zone 'UTC') - updated_at) * %(rate)s) AS available
+            FROM ai_rate_limit_bucket
+            WHERE key = %(key)s
+        """, {'key': key, 'capacity': capacity, 'rate': capacity / 60.0})
+
+        if row is None:
+            return {
+                'limit': rate_limit,
+                'used': 0,
+                'remaining': rate_limit,
+                'reset_time': None
+            }
+
+        available = row['available']
+        remaining = max(0, int(available))
+        reset_time = None
+        if available < capacity:
+            reset_time = (datetime.utcnow() + timedelta(seconds=(capacity - available) / (capacity / 60.0))).isoformat()
+
+        return {
+            'limit': rate_limit,
+            'used': rate_limit - remaining,
+            'remaining': remaining,
+            'reset_time': reset_time
+        }
+
+    def _get_buckets(self, user=None):
+        """(key, capacity) for every enabled scope, user scope first"""
+        user = user or self.env.user
+        get_param = self.env['ai.assistant.config'].get_config_snapshot().get_param
+        scope_ids = {
+            'user': user.id,
+            'company': user.company_id.id,
+            'global': 0,
+        }
+
+        buckets = []
+        for scope, param, default in RATE_LIMIT_SCOPES:
+            capacity = float(get_param(param, default))
+            if capacity > 0 or scope == 'user':
+                buckets.append((f"{scope}:{scope_ids[scope]}", capacity))
+        return buckets
+
+    def _take(self, key, capacity):
+        """Refill the bucket for the elapsed time and take one token, in one statement"""
+        if capacity <= 0:
+            return True
+        row = self._execute("""
+            INSERT INTO ai_rate_limit_bucket AS b (key, tokens, updated_at)
+            VALUES (%(key)s, %(capacity)s - 1, (now() at time zone 'UTC'))
+            ON CONFLICT (key) DO UPDATE
+            SET tokens = LEAST(%(capacity)s, b.tokens + EXTRACT(EPOCH FROM EXCLUDED.updated_at - b.updated_at) * %(rate)s) - 1,
+                updated_at = EXCLUDED.updated_at
+            WHERE LEAST(%(capacity)s, b.tokens + EXTRACT(EPOCH FROM EXCLUDED.updated_at - b.updated_at) * %(rate)s) >= 1
+            RETURNING tokens
+        """, {'key': key, 'capacity': capacity, 'rate': capacity / 60.0})
+        return row is not None
+
+    def _give_back(self, key, capacity):
+        self._execute("""
+            UPDATE ai_rate_limit_bucket
+            SET tokens = LEAST(%(capacity)s, tokens + 1)
+            WHERE key = %(key)s
+        """, {'key': key, 'capacity': capacity})
+
+    def _execute(self, query, params):
+        """Run one bucket statement in its own short READ COMMITTED transaction"""
+        with self.pool.cursor() as cr:
+            cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            cr.execute(query, params)
+            return cr.dictfetchone() if cr.description else None
@@ -0,0 +1,193 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+from odoo.tools.safe_eval import safe_eval
+from datetime import timedelta
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+class AIRetentionPolicy(models.Model):
+    _name = 'ai.retention.policy'
+    _description = 'AI Data Retention Policy'
+    _order = 'sequence, id'
+
+    name = fields.Char(string='Name', required=True)
+    sequence = fields.Integer(string='Sequence', default=10)
+    active = fields.Boolean(string='Active', default=True)
+    model_id = fields.Many2one('ir.model', string='Model', required=True, ondelete='cascade',
+                               domain=[('model', '=like', 'ai.%')])
+    model_name = fields.Char(related='model_id.model', string='Model Name')
+    domain = fields.Char(string='Domain', default='[]', help='Only records matching this domain are purged')
+    date_field = fields.Char(string='Date Field', required=True, default='create_date')
+    retention_days = fields.Integer(string='Keep (days)', required=True, default=90)
+    batch_size = fields.Integer(string='Batch Size', required=True, default=1000,
+                                help='Records deleted per transaction')
+
+    # Current pass: the cutoff is fixed when a pass starts so an interrupted pass resumes where it stopped
+    pass_cutoff = fields.Datetime(string='Pass Cutoff', readonly=True)
+    pass_last_id = fields.Integer(string='Pass Position', readonly=True)
+    pass_rows = fields.Integer(string='Pass Rows', readonly=True)
+
+    # Reporting
+    last_run_date = fields.Datetime(string='Last Run', readonly=True)
+    last_run_rows = fields.Integer(string='Rows Last Run', readonly=True)
+    last_run_seconds = fields.Float(string='Last Run Time (s)', readonly=True)
+    last_pass_date = fields.Datetime(string='Last Completed Pass', readonly=True)
+    total_rows = fields.Integer(string='Rows Purged', readonly=True)
+    last_error = fields.Text(string='Last Error', readonly=True)
+
+    @api.constrains('model_id', 'date_field', 'domain', 'retention_days', 'batch_size')
+    def _check_policy(self):
+        for policy in self:
+            field = self.env[policy.model_name]._fields.get(policy.date_field)
+            if not field or field.type not in ('date', 'datetime') or not field.store:
+                raise ValidationError(_("%s is not a stored date field of %s.", policy.date_field, policy.model_name))
+            if policy.retention_days <= 0 or policy.batch_size <= 0:
+                raise ValidationError(_("Retention days and batch size must be positive."))
+            policy._get_domain()
+
+    def _get_domain(self):
+        try:
+            return list(safe_eval(self.domain or '[]'))
+        except Exception as e:
+            raise ValidationError(_("Invalid domain on retention policy %s: %s", self.name, e))
+
+    @api.model
+    def _cron_run(self):
+        """Run the active policies within the time budget; returns rows purged per policy"""
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        deadline = time.monotonic() + float(get_param('ai_assistant.retention_time_budget', '240'))
+        pause = float(get_param('ai_assistant.retention_batch_pause', '0.1'))
+
+        # Interrupted passes first, so a backlog is worked off before new passes start
+        policies = self.search([]).sorted(lambda policy: (not policy.pass_cutoff, policy.sequence, policy.id))
+        report = {}
+        finished = True
+        for policy in policies:
+            if time.monotonic() >= deadline:
+                finished = False
+                break
+            rows, finished = policy._run(deadline, pause)
+            report[policy.name] = rows
+            if not finished:
+                break
+
+        if not finished:
+            # Out of time: continue shortly instead of waiting a day
+            self.env.ref('ai_assistant.cron_cleanup_temp_data')._trigger()
+        _logger.info(f"AI retention run: {sum(report.values())} rows purged {report}"
+                     f"{'' if finished else ', resuming later'}")
+        return report
+
+    def _run(self, deadline, pause=0.0):
+        """Purge one policy in committed batches; returns (rows, False if the deadline interrupted it)"""
+        self.ensure_one()
+        started = time.monotonic()
+        rows = 0
+        if not self.pass_cutoff:
+            self.write({
+                'pass_cutoff': fields.Datetime.now() - timedelta(days=self.retention_days),
+                'pass_last_id': 0,
+                'pass_rows': 0,
+                'last_error': False,
+            })
+            self.env.cr.commit()
+            rows += self._drop_partitions()
+
+        # Retention keeps the daily usage rollup: it is the long-term record of purged messages
+        model = self.env[self.model_name].sudo().with_context(active_test=False, ai_keep_usage_rollup=True)
+        base_domain = self._get_domain() + [(self.date_field, '<', self.pass_cutoff)]
+        while True:
+            if time.monotonic() >= deadline:
+                self._record_run(rows, started)
+                return rows, False
+
+            # Keyset on id: each batch starts where the previous one stopped, so rows that
+            # could not be deleted are left behind instead of being retried forever
+            batch = model.search(base_domain + [('id', '>', self.pass_last_id)], order='id', limit=self.batch_size)
+            if not batch:
+                break
+            last_id = batch[-1].id
+            skipped = []
+            try:
+                batch.unlink()
+                deleted = len(batch)
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.warning(f"AI retention policy {self.name} failed on a batch after id {self.pass_last_id}, "
+                                f"retrying row by row: {str(e)}")
+                deleted, skipped = self._unlink_rows(model.browse(batch.ids))
+
+            rows += deleted
+            vals = {
+                'pass_last_id': last_id,
+                'pass_rows': self.pass_rows + deleted,
+                'total_rows': self.total_rows + deleted,
+            }
+            if skipped:
+                # Kept for the whole pass, which starts with an empty last_error
+                message = _("%s record(s) could not be deleted and were skipped, ids: %s",
+                            len(skipped), ', '.join(map(str, skipped[:100])))
+                vals['last_error'] = f"{self.last_error}\n{message}" if self.last_error else message
+            self.write(vals)
+            self.env.cr.commit()
+            if pause:
+                # Leave room for live traffic between chunks
+                time.sleep(pause)
+
+        self.write({'pass_cutoff': False, 'last_pass_date': fields.Datetime.now()})
+        self._record_run(rows, started)
+        return rows, True
+
+    def _unlink_rows(self, records):
+        """Delete records one at a time; returns (rows deleted, ids that could not be deleted)"""
+        deleted = 0
+        skipped = []
+        for record in records:
+            try:
+                with self.env.cr.savepoint():
+                    record.unlink()
+                deleted += 1
+            except Exception as e:
+                skipped.append(record.id)
+                _logger.error(f"AI retention policy {self.name} skipped {record._name} {record.id}: {str(e)}")
+        return deleted, skipped
+
+    def _drop_partitions(self):
+        """Drop whole monthly partitions past the cutoff, when the policy covers every row of the table"""
+        model = self.env[self.model_name]
+        manager = self.env['ai.partition.manager']
+        if self._get_domain() or self.date_field != 'create_date' or not manager._is_partitioned(model._table):
+            return 0
+
+        conversations = self.env['ai.conversation']
+        if model._name == 'ai.message':
+            # Dropping a partition bypasses unlink: recount the conversations it touches afterwards
+            self.env.cr.execute("""
+                SELECT DISTINCT conversation_id FROM ai_message WHERE create_date < %s
+            """, (self.pass_cutoff.replace(day=1, hour=0, minute=0, second=0, microsecond=0),))
+            conversations = conversations.browse([row[0] for row in self.env.cr.fetchall()])
+
+        rows = manager.drop_partitions_before(model._table, self.pass_cutoff)
+        if rows:
+            if conversations:
+                conversations.sudo()._recompute_counters()
+            self.write({'pass_rows': rows, 'total_rows': self.total_rows + rows})
+        self.env.cr.commit()
+        return rows
+
+    def _record_run(self, rows, started):
+        self.write({
+            'last_run_date': fields.Datetime.now(),
+            'last_run_rows': rows,
+            'last_run_seconds': round(time.monotonic() - started, 2),
+        })
+        self.env.cr.commit()
+
+    def action_run_now(self):
+        deadline = time.monotonic() + float(self.env['ir.config_parameter'].sudo().get_param(
+            'ai_assistant.retention_time_budget', '240'
+        ))
+        for policy in self:
+            policy._run(deadline)
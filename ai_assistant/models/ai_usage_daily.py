@@ -0,0 +1,169 @@
+from odoo import models, fields, api
+from collections import defaultdict
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# ai.message fields summed into the rollup
+ROLLUP_MESSAGE_FIELDS = ['tokens_used', 'credit_cost', 'revenue_usd', 'actual_cost_usd', 'response_time']
+
+class AIUsageDaily(models.Model):
+    _name = 'ai.usage.daily'
+    _description = 'AI Daily Usage Rollup'
+    _order = 'usage_date desc'
+    _rec_name = 'usage_date'
+
+    usage_date = fields.Date(string='Date', required=True, index=True)
+    user_id = fields.Many2one('res.users', string='User', required=True, ondelete='cascade', index=True)
+    company_id = fields.Many2one('res.company', string='Company', ondelete='cascade')
+    config_id = fields.Many2one('ai.assistant.config', string='Configuration', ondelete='set null')
+
+    message_count = fields.Integer(string='AI Messages', default=0)
+    billable_message_count = fields.Integer(string='Billable Messages', default=0,
+                                            help='AI messages with a credit cost')
+    tokens_used = fields.Integer(string='Tokens', default=0)
+    credits_used = fields.Float(string='Credits', default=0.0)
+    revenue_usd = fields.Float(string='Revenue (USD)', default=0.0)
+    cost_usd = fields.Float(string='Cost (USD)', default=0.0)
+    response_time_total = fields.Float(string='Total Response Time', default=0.0,
+                                       help='Sum of response times, divide by message count for the average')
+    last_message_date = fields.Datetime(string='Last Message')
+
+    def init(self):
+        # One row per day x user x company x configuration; NULLs folded so ON CONFLICT can match
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ai_usage_daily_key_uniq
+            ON ai_usage_daily (usage_date, user_id, COALESCE(company_id, 0), COALESCE(config_id, 0))
+        """)
+
+    @api.model
+    def _queue_message_deltas(self, messages, sign=1):
+        """Accumulate rollup deltas for assistant messages; applied after commit"""
+        deltas = None
+        for message in messages:
+            if message.is_user_message or not message.conversation_id:
+                continue
+            if deltas is None:
+                deltas = self._pending_deltas()
+            user = message.conversation_id.user_id
+            key = (
+                fields.Date.to_date(message.create_date or fields.Datetime.now()),
+                user.id,
+                user.company_id.id or None,
+                message.config_id.id or None,
+            )
+            delta = deltas[key]
+            delta['message_count'] += sign
+            delta['billable_message_count'] += sign * ((message.credit_cost or 0) > 0)
+            for field_name in ROLLUP_MESSAGE_FIELDS:
+                delta[field_name] += sign * (message[field_name] or 0)
+            if sign > 0:
+                delta['last_message_date'] = max(
+                    delta.get('last_message_date') or message.create_date, message.create_date
+                )
+
+    @api.model
+    def _queue_field_deltas(self, message, old_values):
+        """Accumulate the difference between old and new metric values of one message"""
+        if message.is_user_message or not message.conversation_id:
+            return
+        user = message.conversation_id.user_id
+        key = (
+            fields.Date.to_date(message.create_date),
+            user.id,
+            user.company_id.id or None,
+            message.config_id.id or None,
+        )
+        delta = self._pending_deltas()[key]
+        for field_name in ROLLUP_MESSAGE_FIELDS:
+            delta[field_name] += (message[field_name] or 0) - (old_values.get(field_name) or 0)
+        delta['billable_message_count'] += ((message.credit_cost or 0) > 0) - ((old_values.get('credit_cost') or 0) > 0)
+
+    def _pending_deltas(self):
+        """Per-transaction delta buffer, flushed once on commit"""
+        data = self.env.cr.postcommit.data
+        if 'ai.usage.daily' not in data:
+            data['ai.usage.daily'] = defaultdict(lambda: defaultdict(float))
+            dbname = self.env.cr.dbname
+            registry = self.env.registry
+
+            @self.env.cr.postcommit.add
+            def flush():
+                pending = data.pop('ai.usage.daily', {})
+                if pending:
+                    with registry.cursor() as cr:
+                        # Short READ COMMITTED upserts: concurrent messages queue on the row lock
+                        cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+                        self.with_env(self.env(cr=cr))._apply_deltas(pending)
+                    _logger.debug(f"Applied {len(pending)} usage rollup deltas on {dbname}")
+        return data['ai.usage.daily']
+
+    def _apply_deltas(self, deltas):
+        for (usage_date, user_id, company_id, config_id), delta in deltas.items():
+            self.env.cr.execute("""
+                INSERT INTO ai_usage_daily (
+                    usage_date, user_id, company_id, config_id,
+                    message_count, billable_message_count, tokens_used, credits_used, revenue_usd, cost_usd,
+                    response_time_total, last_message_date,
+                    create_uid, create_date, write_uid, write_date
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                        %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC'))
+                ON CONFLICT (usage_date, user_id, COALESCE(company_id, 0), COALESCE(config_id, 0))
+                DO UPDATE SET
+                    message_count = ai_usage_daily.message_count + EXCLUDED.message_count,
+                    billable_message_count = ai_usage_daily.billable_message_count + EXCLUDED.billable_message_count,
+                    tokens_used = ai_usage_daily.tokens_used + EXCLUDED.tokens_used,
+                    credits_used = ai_usage_daily.credits_used + EXCLUDED.credits_used,
+                    revenue_usd = ai_usage_daily.revenue_usd + EXCLUDED.revenue_usd,
+                    cost_usd = ai_usage_daily.cost_usd + EXCLUDED.cost_usd,
+                    response_time_total = ai_usage_daily.response_time_total + EXCLUDED.response_time_total,
+                    last_message_date = GREATEST(ai_usage_daily.last_message_date, EXCLUDED.last_message_date),
+                    write_date = EXCLUDED.write_date
+            """, (
+                usage_date, user_id, company_id, config_id,
+                int(delta['message_count']), int(delta['billable_message_count']),
+                int(delta['tokens_used']), delta['credit_cost'],
+                delta['revenue_usd'], delta['actual_cost_usd'], delta['response_time'],
+                delta.get('last_message_date') or None,
+                self.env.uid, self.env.uid,
+            ))
+
+    @api.model
+    def rebuild(self, date_from=None):
+        """Recompute the rollup from ai_message (backfill), optionally from a date onwards"""
+        where = "WHERE usage_date >= %s" if date_from else ""
+        params = (date_from,) if date_from else ()
+        self.env.cr.execute(f"DELETE FROM ai_usage_daily {where}", params)
+
+        message_where = "AND m.create_date >= %s" if date_from else ""
+        self.env.cr.execute(f"""
+            INSERT INTO ai_usage_daily (
+                usage_date, user_id, company_id, config_id,
+                message_count, billable_message_count, tokens_used, credits_used, revenue_usd, cost_usd,
+                response_time_total, last_message_date,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                DATE(m.create_date), c.user_id, u.company_id, m.config_id,
+                COUNT(m.id),
+                COUNT(m.id) FILTER (WHERE m.credit_cost > 0),
+                COALESCE(SUM(m.tokens_used), 0),
+                COALESCE(SUM(m.credit_cost), 0),
+                COALESCE(SUM(m.revenue_usd), 0),
+                COALESCE(SUM(m.actual_cost_usd), 0),
+                COALESCE(SUM(m.response_time), 0),
+                MAX(m.create_date),
+                %s, (now() at time zone 'UTC'), %s, (now() at time zone 'UTC')
+            FROM ai_message m
+            JOIN ai_conversation c ON m.conversation_id = c.id
+            JOIN res_users u ON c.user_id = u.id
+            WHERE m.is_user_message = False
+                {message_where}
+            GROUP BY DATE(m.create_date), c.user_id, u.company_id, m.config_id
+        """, (self.env.uid, self.env.uid) + params)
+
+        row_count = self.env.cr.rowcount
+        self.env.invalidate_all()
+        _logger.info(f"Rebuilt AI usage rollup ({row_count} rows) from {date_from or 'the beginning'}")
+        return row_count
@@ -0,0 +1,125 @@
+from odoo import models, fields, api, SUPERUSER_ID
+import functools
+import json
+import logging
+import psycopg2
+
+from ..tools.event_buffer import get_event_buffer
+
+_logger = logging.getLogger(__name__)
+
+# Columns written by the bulk insert, in order
+EVENT_COLUMNS = [
+    'event_date', 'event_type', 'user_id', 'company_id', 'conversation_id', 'message_id',
+    'success', 'rating', 'feedback', 'ip_address', 'user_agent', 'payload',
+]
+
+# Rows per INSERT statement when flushing
+INSERT_BATCH_SIZE = 1000
+
+
+def _write_events(registry, rows):
+    """Buffer writer: insert the rows from a cursor of their own"""
+    with registry.cursor() as cr:
+        api.Environment(cr, SUPERUSER_ID, {})['ai.usage.event']._insert_events(rows)
+
+
+class AIUsageEvent(models.Model):
+    _name = 'ai.usage.event'
+    _description = 'AI Usage Event'
+    _order = 'event_date desc, id desc'
+    _log_access = False
+
+    event_date = fields.Datetime(string='Date', required=True, index=True)
+    event_type = fields.Char(string='Event', required=True, index=True)
+    user_id = fields.Many2one('res.users', string='User', ondelete='set null', index=True)
+    company_id = fields.Many2one('res.company', string='Company', ondelete='set null')
+    # Plain ids: events outlive the records they mention
+    conversation_id = fields.Integer(string='Conversation ID')
+    message_id = fields.Integer(string='Message ID', index='btree_not_null')
+    success = fields.Boolean(string='Success')
+    rating = fields.Integer(string='Rating')
+    feedback = fields.Text(string='Feedback')
+    ip_address = fields.Char(string='IP Address')
+    user_agent = fields.Char(string='User Agent')
+    payload = fields.Json(string='Details')
+
+    @api.model
+    def log_event(self, event_type, data=None, **values):
+        """Queue an event for the next bulk insert; no database access on this path
+
+        ``data`` is kept as the event details. ``conversation_id``,
+        ``message_id``, ``success``, ``rating`` and ``feedback`` found in
+        it (or passed as keywords) get their own columns.
+        """
+        data = dict(data or {})
+        user = self.env.user
+        row = {
+            'event_date': fields.Datetime.now(),
+            'event_type': event_type,
+            'user_id': user.id or None,
+            'company_id': user.company_id.id or None,
+        }
+        for name in ('conversation_id', 'message_id', 'success', 'rating', 'feedback'):
+            value = values.pop(name, data.get(name))
+            row[name] = value if value not in (False, '') else None
+        row['ip_address'] = values.pop('ip_address', None)
+        row['user_agent'] = (values.pop('user_agent', None) or '')[:200] or None
+        row['payload'] = json.dumps(data, default=str) if data else None
+        row['rating'] = self._parse_rating(row['rating'])
+
+        buffer = self._get_buffer()
+        if buffer.add(row):
+            self._flush_after_commit()
+            return True
+        return False
+
+    def _parse_rating(self, rating):
+        try:
+            return int(rating) if rating is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    @api.model
+    def _get_buffer(self):
+        get_param = self.env['ai.assistant.config'].get_config_snapshot().get_param
+        return get_event_buffer(
+            self.env.cr.dbname,
+            functools.partial(_write_events, self.env.registry),
+            flush_size=int(get_param('ai_assistant.usage_event_flush_size', '500')),
+            flush_interval=float(get_param('ai_assistant.usage_event_flush_interval', '5')),
+            max_size=int(get_param('ai_assistant.usage_event_buffer_size', '10000')),
+            # Raised by rows that would fail on every retry, e.g. a user deleted meanwhile
+            row_errors=(psycopg2.IntegrityError, psycopg2.DataError),
+        )
+
+    def _flush_after_commit(self):
+        """Check the thresholds once the request is done, not in the middle of it"""
+        data = self.env.cr.postcommit.data
+        if 'ai.usage.event' in data:
+            return
+        data['ai.usage.event'] = True
+        buffer = self._get_buffer()
+
+        @self.env.cr.postcommit.add
+        def flush():
+            data.pop('ai.usage.event', None)
+            if buffer.due():
+                buffer.flush()
+
+    @api.model
+    def flush_events(self):
+        """Write this worker's buffered events now; returns the number of rows written"""
+        return self._get_buffer().flush()
+
+    def _insert_events(self, rows):
+        """Multi-row INSERT of buffered event rows"""
+        placeholders = '(' + ', '.join(['%s'] * len(EVENT_COLUMNS)) + ')'
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            batch = rows[start:start + INSERT_BATCH_SIZE]
+            params = [row.get(column) for row in batch for column in EVENT_COLUMNS]
+            self.env.cr.execute(f"""
+                INSERT INTO ai_usage_event ({', '.join(EVENT_COLUMNS)})
+                VALUES {', '.join([placeholders] * len(batch))}
+            """, params)
+        _logger.debug(f"Inserted {len(rows)} AI usage events")
@@ -1,8 +1,17 @@
 from odoo import models, fields, api, exceptions
 import logging
 
+from ..tools import metrics
+
 _logger = logging.getLogger(__name__)
 
+# Fields written by raw SQL in the ledger path
+LEDGER_FIELDS = [
+    'total_credits', 'used_credits', 'remaining_credits',
+    'total_messages_sent', 'total_spent_usd', 'last_usage_date',
+    'low_credit_warning_sent',
+]
+
 class AIUserCredit(models.Model):
     _name = 'ai.user.credit'
     _description = 'AI User Credits'
@@ -59,7 +68,7 @@ class AIUserCredit(models.Model):
         credit = self.search([('user_id', '=', user_id)], limit=1)
         if not credit:
             # Create new user with free credits
-            free_credits = self.env['ir.config_parameter'].sudo().get_param('ai_assistant.free_credits', '10.0')
+            free_credits = self.env['ai.assistant.config'].get_config_snapshot().get_param('ai_assistant.free_credits', '10.0')
             credit = self.create({
                 'user_id': user_id,
                 'total_credits': float(free_credits),
@@ -83,58 +92,135 @@ class AIUserCredit(models.Model):
     def consume_credits(self, amount, message_id=None, description=None):
         """Consume credits for AI usage"""
         self.ensure_one()
+        self.consume_credits_batch([{
+            'amount': amount,
+            'message_id': message_id,
+            'description': description,
+        }])
+
+    def consume_credits_batch(self, entries):
+        """Consume credits for several usages with one ledger update
+        
+        ``entries`` is a list of dicts with ``amount`` and optional
+        ``message_id`` / ``description``. The balance check and the debit are
+        a single conditional UPDATE, so concurrent requests for the same user
+        cannot overdraw the account, and the transaction rows are created in
+        one batch.
+        """
+        self.ensure_one()
+        if not entries:
+            return
+        
+        total = sum(entry['amount'] for entry in entries)
         
         # Check if subscription is active (unlimited usage)
         if self.is_subscription_active:
             # Don't deduct credits for subscription users, just track usage
-            self.total_messages_sent += 1
-            self.last_usage_date = fields.Datetime.now()
-            
-            # Still create transaction for tracking
-            self.env['ai.credit.transaction'].create({
+            row = self._ledger_debit(0.0, len(entries))
+            balance = row['balance_after']
+        
+            # Still create transactions for tracking
+            self.env['ai.credit.transaction'].create([{
                 'user_credit_id': self.id,
                 'transaction_type': 'subscription',
                 'amount': 0,  # No charge for subscription users
-                'description': description or f'Subscription usage - {amount} credits worth',
-                'message_id': message_id,
-                'balance_before': self.remaining_credits,
-                'balance_after': self.remaining_credits,
-            })
+                'description': entry.get('description') or f"Subscription usage - {entry['amount']} credits worth",
+                'message_ref': entry.get('message_id'),
+                'balance_before': balance,
+                'balance_after': balance,
+            } for entry in entries])
             return
         
-        # Check credit balance
-        if self.remaining_credits < amount:
+        row = self._ledger_debit(total, len(entries))
+        if row is None:
             raise exceptions.UserError(
                 f"Insufficient credits. You have {self.remaining_credits:.2f} credits remaining. "
-                f"This action requires {amount:.2f} credits. Please purchase more credits to continue."
+                f"This action requires {total:.2f} credits. Please purchase more credits to continue."
             )
         
-        # Record balance before transaction
-        balance_before = self.remaining_credits
+        metrics.inc('ai_credits_consumed_total', total)
+
+        # Create transaction records with running balances
+        balance = row['balance_before']
+        vals_list = []
+        for entry in entries:
+            vals_list.append({
+                'user_credit_id': self.id,
+                'transaction_type': 'usage',
+                'amount': -entry['amount'],
+                'description': entry.get('description') or 'AI message usage',
+                'message_ref': entry.get('message_id'),
+                'balance_before': balance,
+                'balance_after': balance - entry['amount'],
+            })
+            balance -= entry['amount']
+        self.env['ai.credit.transaction'].create(vals_list)
         
-        # Consume credits
-        self.used_credits += amount
-        self.total_messages_sent += 1
-        self.last_usage_date = fields.Datetime.now()
+        # Check for low credit warning
+        if row['balance_after'] < 5.0:
+            self._send_low_credit_warning(row['balance_after'])
+        
+        # Reset warning flag if credits are topped up
+        if row['balance_after'] >= 10.0:
+            self._set_low_credit_warning_flag(False)
+
+    def _ledger_debit(self, amount, messages=1):
+        """Atomically check the balance and debit it; returns None if it is too low
+
+        A zero amount (subscription usage, free cache hits) only tracks the
+        message and always goes through, even on an overdrawn account.
+        """
+        self.ensure_one()
+        return self._ledger_execute("""
+            UPDATE ai_user_credit
+            SET used_credits = used_credits + %(amount)s,
+                remaining_credits = total_credits - used_credits - %(amount)s,
+                total_messages_sent = total_messages_sent + %(count)s,
+                last_usage_date = (now() at time zone 'UTC')
+            WHERE id = %(id)s
+                AND (%(amount)s <= 0 OR total_credits - used_credits >= %(amount)s)
+            RETURNING remaining_credits + %(amount)s AS balance_before,
+                      remaining_credits AS balance_after
+        """, {'id': self.id, 'amount': amount, 'count': messages})
+
+    def _ledger_execute(self, query, params):
+        """Run one ledger statement on the request cursor
+        
+        The conditional UPDATE takes the row lock until the request commits,
+        so concurrent debits of the same account queue on it, and the debit
+        commits or rolls back together with the rest of the request.
+        """
+        self.flush_recordset(LEDGER_FIELDS)
+        self.env.cr.execute(query, params)
+        row = self.env.cr.dictfetchone() if self.env.cr.description else None
+        self.invalidate_recordset(LEDGER_FIELDS)
+        return row
+
+    def record_cache_hit(self, message_id=None):
+        """Record a reply served from the response cache at a discounted rate"""
+        self.ensure_one()
+        
+        config = self.env['ai.assistant.config'].get_active_snapshot()
+        ratio = float(config.get_param('ai_assistant.response_cache_credit_ratio', '0.0'))
+        # Discount applies to the same default per-message estimate as check_usage_limit
+        default_cost = config.calculate_credit_cost(config.max_tokens)
+        amount = 0.0 if self.is_subscription_active else round(default_cost * ratio, 4)
+        
+        row = self._ledger_debit(amount)
+        if row is None:
+            # Not enough left for the discounted price: serve it for free
+            amount = 0.0
+            row = self._ledger_debit(amount)
         
-        # Create transaction record
         self.env['ai.credit.transaction'].create({
             'user_credit_id': self.id,
-            'transaction_type': 'usage',
+            'transaction_type': 'cache_hit',
             'amount': -amount,
-            'description': description or f'AI message usage',
-            'message_id': message_id,
-            'balance_before': balance_before,
-            'balance_after': self.remaining_credits,
+            'description': 'Cached AI reply',
+            'message_ref': message_id,
+            'balance_before': row['balance_before'],
+            'balance_after': row['balance_after'],
         })
-        
-        # Check for low credit warning
-        if self.remaining_credits < 5.0 and not self.low_credit_warning_sent:
-            self._send_low_credit_warning()
-        
-        # Reset warning flag if credits are topped up
-        if self.remaining_credits >= 10.0:
-            self.low_credit_warning_sent = False
 
     def add_credits(self, amount, description=None, invoice_id=None, transaction_type='purchase'):
         """Add credits to user account"""
@@ -143,24 +229,26 @@ class AIUserCredit(models.Model):
         if amount <= 0:
             raise exceptions.ValidationError("Credit amount must be positive")
         
-        # Check credit limit
-        if self.total_credits + amount > self.credit_limit:
+        # Convert credits to USD for tracking
+        config = self.env['ai.assistant.config'].get_active_snapshot()
+        usd_amount = amount / config.credit_rate
+        
+        # Add credits, checking the credit limit in the same statement
+        row = self._ledger_execute("""
+            UPDATE ai_user_credit
+            SET total_credits = total_credits + %(amount)s,
+                remaining_credits = total_credits + %(amount)s - used_credits,
+                total_spent_usd = total_spent_usd + %(usd)s
+            WHERE id = %(id)s
+                AND total_credits + %(amount)s <= credit_limit
+            RETURNING remaining_credits - %(amount)s AS balance_before,
+                      remaining_credits AS balance_after
+        """, {'id': self.id, 'amount': amount, 'usd': usd_amount})
+        if row is None:
             raise exceptions.UserError(
                 f"Adding {amount} credits would exceed your credit limit of {self.credit_limit}. "
                 f"Please contact support for higher limits."
             )
-        
-        # Record balance before transaction
-        balance_before = self.remaining_credits
-        
-        # Add credits
-        self.total_credits += amount
-        
-        # Convert credits to USD for tracking
-        config = self.env['ai.assistant.config'].get_active_config()
-        usd_amount = amount / config.credit_rate
-        self.total_spent_usd += usd_amount
-        
         # Create transaction record
         self.env['ai.credit.transaction'].create({
             'user_credit_id': self.id,
@@ -168,12 +256,12 @@ class AIUserCredit(models.Model):
             'amount': amount,
             'description': description or f'Credit {transaction_type}',
             'invoice_id': invoice_id,
-            'balance_before': balance_before,
-            'balance_after': self.remaining_credits,
+            'balance_before': row['balance_before'],
+            'balance_after': row['balance_after'],
         })
         
         # Reset low credit warning
-        self.low_credit_warning_sent = False
+        self._set_low_credit_warning_flag(False)
         
         _logger.info(f"Added {amount} credits to user {self.user_id.name} (ID: {self.user_id.id})")
 
@@ -185,11 +273,11 @@ class AIUserCredit(models.Model):
             return False, "Account is inactive. Please contact support."
         
         # Calculate estimated credit cost
+        config = self.env['ai.assistant.config'].get_active_snapshot()
         if tokens_to_use > 0:
-            config = self.env['ai.assistant.config'].get_active_config()
             estimated_cost = config.calculate_credit_cost(tokens_to_use)
         else:
-            estimated_cost = 0.1  # Default minimum cost
+            estimated_cost = config.calculate_credit_cost(config.max_tokens)  # A full-length reply
         
         # Subscription users have unlimited usage
         if self.is_subscription_active:
@@ -232,28 +320,44 @@ class AIUserCredit(models.Model):
             'subscription_active': self.is_subscription_active,
         }
 
-    def _send_low_credit_warning(self):
+    def _send_low_credit_warning(self, remaining_credits=None):
         """Send low credit warning to user"""
         self.ensure_one()
         
-        # Mark warning as sent
-        self.low_credit_warning_sent = True
+        if remaining_credits is None:
+            remaining_credits = self.remaining_credits
+        
+        # Mark warning as sent; only the request that flips the flag notifies
+        if not self._set_low_credit_warning_flag(True):
+            return
         
         # You can implement email notification here
         # For now, just log the warning
-        _logger.info(f"Low credit warning for user {self.user_id.name} (ID: {self.user_id.id}) - {self.remaining_credits:.2f} credits remaining")
+        _logger.info(f"Low credit warning for user {self.user_id.name} (ID: {self.user_id.id}) - {remaining_credits:.2f} credits remaining")
         
         # Could send notification to user interface
         self.env['bus.bus']._sendone(
             self.user_id.partner_id,
             'ai_assistant.low_credits',
             {
-                'message': f'Low credits: {self.remaining_credits:.2f} remaining',
-                'remaining_credits': self.remaining_credits,
+                'message': f'Low credits: {remaining_credits:.2f} remaining',
+                'remaining_credits': remaining_credits,
                 'user_id': self.user_id.id,
             }
         )
 
+    def _set_low_credit_warning_flag(self, value):
+        """Flip low_credit_warning_sent through the ledger; returns True if it changed"""
+        self.ensure_one()
+        row = self._ledger_execute("""
+            UPDATE ai_user_credit
+            SET low_credit_warning_sent = %(value)s
+            WHERE id = %(id)s
+                AND low_credit_warning_sent IS DISTINCT FROM %(value)s
+            RETURNING id
+        """, {'id': self.id, 'value': value})
+        return row is not None
+
     def reset_account(self):
         """Reset account (admin only)"""
         self.ensure_one()
@@ -296,15 +400,38 @@ class AICreditTransaction(models.Model):
         ('refund', 'Refund'),
         ('bonus', 'Bonus Credits'),
         ('subscription', 'Subscription Usage'),
+        ('cache_hit', 'Cached Reply'),
     ], string='Type', required=True)
     
     amount = fields.Float(string='Amount', required=True, help='Positive for additions, negative for usage')
     description = fields.Text(string='Description')
     
     # Related records
-    message_id = fields.Many2one('ai.message', string='Related Message')
+    message_ref = fields.Integer(string='Related Message ID', index='btree_not_null')
+    message_id = fields.Many2one('ai.message', string='Related Message', compute='_compute_message_id',
+                                 inverse='_inverse_message_id', search='_search_message_id')
     invoice_id = fields.Many2one('account.move', string='Related Invoice')
     
     # Balance tracking
     balance_before = fields.Float(string='Balance Before')
     balance_after = fields.Float(string='Balance After')
+
+    @api.depends('message_ref')
+    def _compute_message_id(self):
+        messages = self.env['ai.message']._browse_references(self.mapped('message_ref'))
+        for transaction in self:
+            transaction.message_id = messages.get(transaction.message_ref, False)
+
+    def _inverse_message_id(self):
+        for transaction in self:
+            transaction.message_ref = transaction.message_id.id
+
+    def _search_message_id(self, operator, value):
+        return self.env['ai.message']._reference_domain('message_ref', operator, value)
+
+    def init(self):
+        # Usage history pages walk a user's transactions newest first by (create_date, id)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ai_credit_transaction_user_create_date_idx
+            ON ai_credit_transaction (user_id, create_date DESC, id DESC)
+        """)
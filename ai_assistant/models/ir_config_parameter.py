@@ -0,0 +1,27 @@
+from odoo import models, api
+
+from ..tools import invalidation
+
+class IrConfigParameter(models.Model):
+    _inherit = 'ir.config_parameter'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        params = super().create(vals_list)
+        params._invalidate_ai_config()
+        return params
+
+    def write(self, vals):
+        self._invalidate_ai_config()
+        result = super().write(vals)
+        self._invalidate_ai_config()
+        return result
+
+    def unlink(self):
+        self._invalidate_ai_config()
+        return super().unlink()
+
+    def _invalidate_ai_config(self):
+        """Drop the cached AI configuration snapshot in every worker when one of its parameters changes"""
+        if any(key and key.startswith('ai_assistant.') for key in self.mapped('key')):
+            invalidation.publish(self.env.cr, 'config')
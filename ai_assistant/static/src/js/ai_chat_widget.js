@@ -9,9 +9,15 @@ class AIChatWidget extends Component {
         this.orm = useService("orm");
         this.notification = useService("notification");
         this.action = useService("action");
+        this.rpc = useService("rpc");
+        this.busService = useService("bus_service");
         this.chatContainerRef = useRef("chatContainer");
         this.messageInputRef = useRef("messageInput");
         
+        // Async sends waiting for their reply over the bus, keyed by job id
+        this.pendingJobs = new Map();
+        this.onAIReply = this.onAIReply.bind(this);
+        
         this.state = useState({
             conversations: [],
             currentConversation: null,
@@ -20,11 +26,13 @@ class AIChatWidget extends Component {
             newMessage: "",
             isTyping: false,
             userCredits: null,
+            estimatedMessageCost: null,
             showCreditWarning: false,
             connectionStatus: 'connected',
         });
 
         onMounted(() => {
+            this.busService.subscribe("ai_assistant.reply", this.onAIReply);
             this.loadConversations();
             this.loadUserCredits();
             this.checkAIService();
@@ -37,6 +45,11 @@ class AIChatWidget extends Component {
 
         onWillUnmount(() => {
             // Cleanup any pending requests
+            this.busService.unsubscribe("ai_assistant.reply", this.onAIReply);
+            for (const timer of this.pendingJobs.values()) {
+                clearTimeout(timer);
+            }
+            this.pendingJobs.clear();
         });
     }
 
@@ -60,6 +73,12 @@ class AIChatWidget extends Component {
             const userCredit = await this.orm.call("ai.user.credit", "get_or_create_user_credit", []);
             this.state.userCredits = userCredit;
             
+            // Server-side token estimate of a typical message, for the "messages left" hint
+            const preview = await this.rpc("/ai_assistant/chat/preview", {});
+            if (!preview.error) {
+                this.state.estimatedMessageCost = preview.estimate.credits;
+            }
+            
             // Show warning if credits are low
             if (userCredit.remaining_credits < 2 && !userCredit.is_subscription_active) {
                 this.state.showCreditWarning = true;
@@ -172,16 +191,37 @@ class AIChatWidget extends Component {
         this.state.messages.push(tempUserMessage);
         this.scrollToBottom();
 
+        let waitingForReply = false;
         try {
-            const result = await this.orm.call(
-                "ai.message",
-                "send_message_to_ai",
-                [this.state.currentConversation.id, message]
-            );
+            // Stream tokens as they arrive so the first words show up right away
+            if (window.ReadableStream && window.TextDecoder) {
+                waitingForReply = await this.streamMessage(message, tempUserMessage);
+                return;
+            }
+
+            const result = await this.rpc("/ai_assistant/chat/send_message", {
+                conversation_id: this.state.currentConversation.id,
+                message: message,
+            });
 
             // Remove temporary message
             this.state.messages = this.state.messages.filter(m => m.id !== tempUserMessage.id);
 
+            // Async mode: the reply is pushed over the bus once the dispatcher is done
+            if (result.pending) {
+                if (result.user_message) {
+                    this.state.messages.push(result.user_message);
+                }
+                this.watchJob(result.job_id);
+                waitingForReply = true;
+                return;
+            }
+
+            if (result.error && !result.ai_message) {
+                this.notification.add(result.message, { type: "warning" });
+                return;
+            }
+
             if (result.insufficient_credits) {
                 this.notification.add(result.message, { 
                     type: "warning",
@@ -230,8 +270,147 @@ class AIChatWidget extends Component {
             console.error("Failed to send message:", error);
             this.notification.add("Failed to send message. Please try again.", { type: "danger" });
         } finally {
-            this.state.isTyping = false;
+            if (!waitingForReply) {
+                this.state.isTyping = false;
+            }
+        }
+    }
+
+    async streamMessage(message, tempUserMessage) {
+        const conversationId = this.state.currentConversation.id;
+        const response = await fetch("/ai_assistant/chat/stream", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ conversation_id: conversationId, message: message }),
+        });
+        if (!response.ok) {
+            throw new Error(`Stream request failed with status ${response.status}`);
+        }
+
+        // Validation errors and async mode come back as plain JSON
+        if (!(response.headers.get("Content-Type") || "").includes("text/event-stream")) {
+            const result = await response.json();
+            this.state.messages = this.state.messages.filter(m => m.id !== tempUserMessage.id);
+            // Async mode: the reply is pushed over the bus once the dispatcher is done
+            if (result.pending) {
+                if (result.user_message) {
+                    this.state.messages.push(result.user_message);
+                }
+                this.watchJob(result.job_id);
+                return true;
+            }
+            this.notification.add(result.message || "Failed to send message", { type: "warning" });
+            return false;
         }
+
+        let streamingMessage = null;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const event = this.parseStreamEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                if (!event) continue;
+
+                if (event.type === "user_message") {
+                    const index = this.state.messages.findIndex(m => m.id === tempUserMessage.id);
+                    if (index !== -1) {
+                        this.state.messages[index] = event.data;
+                    }
+                } else if (event.type === "token") {
+                    if (!streamingMessage) {
+                        this.state.messages.push({
+                            id: 'stream-' + Date.now(),
+                            content: "",
+                            is_user_message: false,
+                            create_date: new Date().toISOString(),
+                            temp: true,
+                        });
+                        // Keep the reactive proxy so appends re-render
+                        streamingMessage = this.state.messages[this.state.messages.length - 1];
+                        this.state.isTyping = false;
+                    }
+                    streamingMessage.content += event.data.text;
+                    this.scrollToBottom();
+                } else if (event.type === "done") {
+                    if (streamingMessage) {
+                        this.state.messages = this.state.messages.filter(m => m.id !== streamingMessage.id);
+                    }
+                    if (event.data.ai_message) {
+                        this.state.messages.push(event.data.ai_message);
+                    }
+                    if (event.data.error) {
+                        this.notification.add("AI response had an error", { type: "warning" });
+                    }
+                } else if (event.type === "error") {
+                    this.notification.add(event.data.message, { type: "danger" });
+                }
+            }
+        }
+
+        await this.loadConversations();
+        await this.loadUserCredits();
+        setTimeout(() => this.scrollToBottom(), 100);
+        return false;
+    }
+
+    parseStreamEvent(raw) {
+        let type = "message";
+        const data = [];
+        for (const line of raw.split("\n")) {
+            if (line.startsWith("event:")) {
+                type = line.slice(6).trim();
+            } else if (line.startsWith("data:")) {
+                data.push(line.slice(5).trim());
+            }
+        }
+        if (!data.length) return null;
+        return { type, data: JSON.parse(data.join("\n")) };
+    }
+
+    watchJob(jobId) {
+        // Poll as a fallback in case the bus notification is missed
+        const timer = setTimeout(async () => {
+            if (!this.pendingJobs.has(jobId)) return;
+            try {
+                const status = await this.rpc(`/ai_assistant/chat/job/${jobId}`, {});
+                if (status.pending) {
+                    this.watchJob(jobId);
+                } else {
+                    this.onAIReply(status);
+                }
+            } catch (error) {
+                console.error("Failed to poll message job:", error);
+                this.watchJob(jobId);
+            }
+        }, 5000);
+        this.pendingJobs.set(jobId, timer);
+    }
+
+    async onAIReply(payload) {
+        if (!this.pendingJobs.has(payload.job_id)) return;
+        clearTimeout(this.pendingJobs.get(payload.job_id));
+        this.pendingJobs.delete(payload.job_id);
+        this.state.isTyping = this.pendingJobs.size > 0;
+
+        if (payload.error) {
+            this.notification.add(payload.message, { type: "warning" });
+            return;
+        }
+
+        if (payload.ai_message && this.state.currentConversation?.id === payload.conversation_id) {
+            this.state.messages.push(payload.ai_message);
+            setTimeout(() => this.scrollToBottom(), 100);
+        }
+        await this.loadConversations();
+        await this.loadUserCredits();
     }
 
     scrollToBottom() {
@@ -337,7 +516,7 @@ class AIChatWidget extends Component {
         }
         
         const remaining = this.state.userCredits.remaining_credits;
-        const avgCostPerMessage = 0.1; // Rough estimate
+        const avgCostPerMessage = this.state.estimatedMessageCost || 0.1; // Until the preview arrives
         return Math.floor(remaining / avgCostPerMessage);
     }
 
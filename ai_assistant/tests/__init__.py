@@ -0,0 +1,10 @@
+from . import test_partitioning
+from . import test_response_cache
+from . import test_keyset
+from . import test_tokenizer
+from . import test_invalidation
+from . import test_event_buffer
+from . import test_metrics
+from . import test_provider_router
+from . import test_credit_ledger
+from . import test_context
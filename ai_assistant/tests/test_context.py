@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from ..models import ai_conversation
+from ..models.ai_conversation import CONTEXT_MAX_TURNS
+
+
+@tagged('post_install', '-at_install')
+class TestConversationContext(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env['ai.assistant.config'].get_active_config().context_token_budget = 100000
+        cls.conversation = cls.env['ai.conversation'].create({'title': 'Context'})
+
+    def _add_turns(self, count, start=0):
+        return self.env['ai.message'].create([{
+            'conversation_id': self.conversation.id,
+            'role': 'user' if index % 2 == 0 else 'assistant',
+            'content': f"Turn {index}.",
+        } for index in range(start, start + count)])
+
+    def test_window_and_summary(self):
+        messages = self._add_turns(CONTEXT_MAX_TURNS + 20)
+        context = self.conversation._build_context()
+        recent = messages[-CONTEXT_MAX_TURNS:]
+        # The budget fits every candidate, yet the turns beyond the window are summarized
+        self.assertEqual(self.conversation.context_summary_message_id, messages[-CONTEXT_MAX_TURNS - 1])
+        self.assertIn('User: Turn 0.', self.conversation.context_summary)
+        self.assertIn('Assistant: Turn 19.', self.conversation.context_summary)
+        self.assertNotIn('Turn 20.', self.conversation.context_summary)
+        self.assertIn(f"Assistant: Turn {CONTEXT_MAX_TURNS + 19}.", context['text'])
+        self.assertIn(recent[0].content, context['text'])
+
+        # Later calls only fold the turns that left the window
+        messages |= self._add_turns(2, start=CONTEXT_MAX_TURNS + 20)
+        self.conversation._build_context()
+        self.assertEqual(self.conversation.context_summary_message_id, messages[-CONTEXT_MAX_TURNS - 1])
+        self.assertEqual(self.conversation.context_summary.count('Turn 0.'), 1)
+        self.assertIn('Assistant: Turn 21.', self.conversation.context_summary)
+
+    def test_long_backlog_paged(self):
+        # A long conversation seen for the first time: more unsummarized turns than one fold page
+        messages = self._add_turns(CONTEXT_MAX_TURNS + 7)
+        with patch.object(ai_conversation, 'CONTEXT_FOLD_BATCH', 2):
+            self.conversation._build_context()
+        self.assertEqual(self.conversation.context_summary_message_id, messages[6])
+        self.assertEqual(len(self.conversation.context_summary.splitlines()), 7)
+
+    def test_before_message(self):
+        messages = self._add_turns(CONTEXT_MAX_TURNS + 3)
+        context = self.conversation._build_context(before_message=messages[-1])
+        self.assertNotIn(messages[-1].content, context['text'])
+        self.assertEqual(self.conversation.context_summary_message_id, messages[1])
+
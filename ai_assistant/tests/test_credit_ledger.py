@@ -0,0 +1,151 @@
+from unittest.mock import patch
+
+from odoo import exceptions
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCreditLedger(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = cls.env['res.users'].create({'name': 'Ledger User', 'login': 'ai_ledger_user'})
+        cls.Transaction = cls.env['ai.credit.transaction']
+
+    def _new_account(self, credits=20.0):
+        """Credit account created in this transaction, like on a user's first message"""
+        credit = self.env['ai.user.credit'].get_or_create_user_credit(self.user.id)
+        credit.write({'total_credits': credits})
+        return credit
+
+    def _usage(self, credit):
+        return self.Transaction.search([
+            ('user_credit_id', '=', credit.id), ('transaction_type', '=', 'usage'),
+        ], order='id')
+
+    def test_new_account_debited(self):
+        # The account row is not committed yet: the debit must run on the same cursor to see it
+        credit = self._new_account()
+        credit.consume_credits(2.5)
+        self.assertEqual(credit.used_credits, 2.5)
+        self.assertEqual(credit.remaining_credits, 17.5)
+        self.assertEqual(credit.total_messages_sent, 1)
+        self.env.cr.execute("SELECT used_credits, remaining_credits FROM ai_user_credit WHERE id = %s", [credit.id])
+        self.assertEqual(self.env.cr.fetchone(), (2.5, 17.5))
+        usage = self._usage(credit)
+        self.assertEqual((usage.amount, usage.balance_before, usage.balance_after), (-2.5, 20.0, 17.5))
+
+    def test_pending_writes_flushed(self):
+        credit = self._new_account(credits=1.0)
+        # Not flushed yet when the ledger statement runs
+        credit.total_credits = 50.0
+        credit.consume_credits(45.0)
+        self.assertEqual(credit.remaining_credits, 5.0)
+
+    def test_insufficient_credits(self):
+        credit = self._new_account(credits=3.0)
+        with self.assertRaises(exceptions.UserError):
+            credit.consume_credits(3.5)
+        self.assertEqual(credit.used_credits, 0.0)
+        self.assertEqual(credit.total_messages_sent, 0)
+        self.assertFalse(self._usage(credit))
+        # The exact balance can still be spent
+        credit.consume_credits(3.0)
+        self.assertEqual(credit.remaining_credits, 0.0)
+
+    def test_batch(self):
+        credit = self._new_account()
+        conversation = self.env['ai.conversation'].create({'title': 'Ledger', 'user_id': self.user.id})
+        message = self.env['ai.message'].create({
+            'conversation_id': conversation.id,
+            'role': 'assistant',
+            'content': 'Hello',
+        })
+        credit.consume_credits_batch([
+            {'amount': 1.0, 'message_id': message.id},
+            {'amount': 2.0},
+            {'amount': 3.0, 'description': 'Third'},
+        ])
+        self.assertEqual(credit.remaining_credits, 14.0)
+        self.assertEqual(credit.total_messages_sent, 3)
+        usage = self._usage(credit)
+        self.assertEqual([(line.balance_before, line.balance_after) for line in usage], [
+            (20.0, 19.0), (19.0, 17.0), (17.0, 14.0),
+        ])
+        self.assertEqual(usage[0].message_id, message)
+        self.assertEqual(usage[2].description, 'Third')
+
+    def test_cache_hit(self):
+        credit = self._new_account()
+        credit.record_cache_hit()
+        hit = self.Transaction.search([('user_credit_id', '=', credit.id), ('transaction_type', '=', 'cache_hit')])
+        self.assertEqual(len(hit), 1)
+        self.assertEqual(hit.balance_before, 20.0)
+        self.assertEqual(hit.balance_after, 20.0 + hit.amount)
+        self.assertEqual(credit.remaining_credits, hit.balance_after)
+
+    def test_cache_hit_without_credits(self):
+        # Served for free rather than refused or overdrawn
+        credit = self._new_account(credits=0.0)
+        credit.record_cache_hit()
+        self.assertEqual(credit.remaining_credits, 0.0)
+
+    def test_overdrawn_account(self):
+        # An admin lowered the total below what was already used
+        credit = self._new_account()
+        credit.consume_credits(5.0)
+        credit.total_credits = 2.0
+        credit.record_cache_hit()
+        hit = self.Transaction.search([('user_credit_id', '=', credit.id), ('transaction_type', '=', 'cache_hit')])
+        self.assertEqual((hit.amount, hit.balance_before, hit.balance_after), (0.0, -3.0, -3.0))
+        with self.assertRaises(exceptions.UserError):
+            credit.consume_credits(1.0)
+
+    def test_add_credits(self):
+        credit = self._new_account()
+        credit.credit_limit = 100.0
+        credit.add_credits(30.0)
+        self.assertEqual(credit.total_credits, 50.0)
+        self.assertEqual(credit.remaining_credits, 50.0)
+        purchase = self.Transaction.search([('user_credit_id', '=', credit.id), ('transaction_type', '=', 'purchase')])
+        self.assertEqual((purchase.balance_before, purchase.balance_after), (20.0, 50.0))
+
+        with self.assertRaises(exceptions.UserError):
+            credit.add_credits(60.0)
+        self.assertEqual(credit.total_credits, 50.0)
+        with self.assertRaises(exceptions.ValidationError):
+            credit.add_credits(0)
+
+    def _answer(self, conversation, text):
+        reply = {'text': text, 'cache_hit': False, 'error': False, 'billable': True, 'cache_key': 'key'}
+        Message = self.env['ai.message']
+        with patch.object(type(Message), '_get_reply', return_value=reply), \
+                patch.object(type(Message), '_store_cached_reply') as store:
+            try:
+                return Message._answer_input(conversation, 'What is Odoo?')
+            finally:
+                self.cached = [call.args for call in store.call_args_list]
+
+    def test_reply_charged(self):
+        credit = self._new_account()
+        conversation = self.env['ai.conversation'].create({'title': 'Ledger', 'user_id': self.user.id})
+        user_message, ai_message = self._answer(conversation, 'An open source ERP.')
+        self.assertGreater(ai_message.credit_cost, 0)
+        usage = self._usage(credit)
+        self.assertEqual(usage.message_id, ai_message)
+        self.assertAlmostEqual(usage.amount, -ai_message.credit_cost)
+        self.assertEqual(conversation.message_ids, user_message | ai_message)
+        self.assertEqual(self.cached, [('key', 'An open source ERP.')])
+
+    def test_unpaid_reply_not_kept(self):
+        # The balance ran out after the preflight: neither message is stored without a debit
+        credit = self._new_account(credits=0.0)
+        conversation = self.env['ai.conversation'].create({'title': 'Ledger', 'user_id': self.user.id})
+        with self.assertRaises(exceptions.UserError):
+            self._answer(conversation, 'An open source ERP.')
+        self.assertFalse(self.env['ai.message'].search([('conversation_id', '=', conversation.id)]))
+        self.assertEqual(conversation.message_count, 0)
+        self.assertFalse(self._usage(credit))
+        # Nor cached, or resending the prompt would get it for the cache hit price
+        self.assertEqual(self.cached, [])
@@ -0,0 +1,95 @@
+from odoo.tests import BaseCase, tagged
+
+from ..tools import event_buffer
+from ..tools.event_buffer import EventBuffer
+
+
+class BadRow(Exception):
+    pass
+
+
+@tagged('post_install', '-at_install')
+class TestEventBuffer(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.batches = []
+        self.bad_rows = set()
+        self.down = False
+
+    def _writer(self, rows):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        if self.bad_rows.intersection(rows):
+            raise BadRow("row cannot be written")
+        self.batches.append(list(rows))
+
+    def _buffer(self, **settings):
+        return EventBuffer(self._writer, row_errors=(BadRow,), **settings)
+
+    def _written(self):
+        return sorted(row for batch in self.batches for row in batch)
+
+    def test_flush(self):
+        buffer = self._buffer(flush_size=3, flush_interval=3600)
+        self.assertEqual(buffer.flush(), 0)
+        buffer.add(1)
+        buffer.add(2)
+        self.assertFalse(buffer.due())
+        buffer.add(3)
+        self.assertTrue(buffer.due())
+        self.assertEqual(buffer.flush(), 3)
+        # One multi-row write
+        self.assertEqual(self.batches, [[1, 2, 3]])
+        self.assertFalse(buffer.due())
+        self.assertEqual(buffer.stats()['flushed'], 3)
+
+    def test_due_by_age(self):
+        buffer = self._buffer(flush_size=100, flush_interval=0)
+        self.assertFalse(buffer.due())
+        buffer.add(1)
+        self.assertTrue(buffer.due())
+
+    def test_bad_rows_rejected(self):
+        buffer = self._buffer()
+        self.bad_rows = {3, 6}
+        for row in range(8):
+            buffer.add(row)
+        with self.assertLogs(event_buffer.__name__, 'WARNING'):
+            self.assertEqual(buffer.flush(), 6)
+        # The good rows of the batch get through, the bad ones are dropped for good
+        self.assertEqual(self._written(), [0, 1, 2, 4, 5, 7])
+        stats = buffer.stats()
+        self.assertEqual((stats['rejected'], stats['buffered'], stats['failed_flushes']), (2, 0, 0))
+
+    def test_failed_flush_requeued(self):
+        buffer = self._buffer()
+        for row in range(5):
+            buffer.add(row)
+        self.down = True
+        with self.assertLogs(event_buffer.__name__, 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.stats()['buffered'], 5)
+        self.assertEqual(buffer.stats()['failed_flushes'], 1)
+
+        # Retried in their original order ahead of newer rows
+        buffer.add(5)
+        self.down = False
+        self.assertEqual(buffer.flush(), 6)
+        self.assertEqual(self.batches, [[0, 1, 2, 3, 4, 5]])
+
+    def test_backpressure(self):
+        buffer = self._buffer(max_size=3)
+        for row in range(3):
+            self.assertTrue(buffer.add(row))
+        # A full buffer is flushed by the producer before taking the row
+        self.assertTrue(buffer.add(3))
+        self.assertEqual(self.batches, [[0, 1, 2]])
+
+        self.down = True
+        buffer.add(4)
+        buffer.add(5)
+        with self.assertLogs(event_buffer.__name__, 'ERROR'):
+            self.assertFalse(buffer.add(6))
+        self.assertEqual(buffer.stats()['dropped'], 1)
+        self.assertEqual(buffer.stats()['buffered'], 3)
@@ -0,0 +1,98 @@
+import json
+from unittest.mock import patch
+
+from odoo.tests import BaseCase, tagged
+from odoo.tools.misc import Callbacks
+
+from ..tools import invalidation
+
+
+class FakeCursor:
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+        self.postcommit = Callbacks()
+
+
+@tagged('post_install', '-at_install')
+class TestInvalidation(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.scope = f'test_scope_{id(self)}'
+        invalidation.subscribe(self.scope, self._handler)
+        self.addCleanup(invalidation._handlers.pop, self.scope, None)
+        # Capture the NOTIFY sent to the other workers instead of connecting to the database
+        db_connect = patch('odoo.sql_db.db_connect').start()
+        self.addCleanup(patch.stopall)
+        self.notify_execute = db_connect.return_value.cursor.return_value.__enter__.return_value.execute
+
+    def _handler(self, dbname, keys):
+        self.calls.append((dbname, keys))
+
+    def _notified(self):
+        return [json.loads(call.args[1][1]) for call in self.notify_execute.call_args_list]
+
+    def test_publish_after_commit(self):
+        cr = FakeCursor('db1')
+        generation = invalidation.generation('db1', self.scope)
+        invalidation.publish(cr, self.scope, ['b', 'a'])
+        invalidation.publish(cr, self.scope, ['a', 'c'])
+        self.assertTrue(invalidation.pending(cr, self.scope))
+        self.assertFalse(invalidation.pending(cr, 'other_scope'))
+        # Nothing happens before the commit
+        self.assertEqual(self.calls, [])
+        self.assertEqual(invalidation.generation('db1', self.scope), generation)
+
+        cr.postcommit.run()
+        # One call with the merged keys, locally and to the other workers
+        self.assertEqual(self.calls, [('db1', ['a', 'b', 'c'])])
+        self.assertEqual(invalidation.generation('db1', self.scope), generation + 1)
+        self.assertEqual(self._notified(), [{'db': 'db1', 'scope': self.scope, 'keys': ['a', 'b', 'c']}])
+        self.assertFalse(invalidation.pending(cr, self.scope))
+
+    def test_whole_scope(self):
+        cr = FakeCursor('db1')
+        invalidation.publish(cr, self.scope, ['a'])
+        invalidation.publish(cr, self.scope)
+        # Keys published after the whole scope do not narrow it again
+        invalidation.publish(cr, self.scope, ['b'])
+        cr.postcommit.run()
+        self.assertEqual(self.calls, [('db1', None)])
+
+    def test_too_many_keys(self):
+        cr = FakeCursor('db1')
+        invalidation.publish(cr, self.scope, range(invalidation.MAX_KEYS))
+        invalidation.publish(cr, self.scope, [invalidation.MAX_KEYS])
+        cr.postcommit.run()
+        self.assertEqual(self.calls, [('db1', None)])
+
+    def test_notify_failure(self):
+        # The local caches are invalidated even when the other workers cannot be notified
+        self.notify_execute.side_effect = Exception("connection lost")
+        cr = FakeCursor('db1')
+        invalidation.publish(cr, self.scope, ['a'])
+        with self.assertLogs(invalidation.__name__, 'ERROR'):
+            cr.postcommit.run()
+        self.assertEqual(self.calls, [('db1', ['a'])])
+
+    def test_dispatch(self):
+        generation = invalidation.generation('db2', self.scope)
+        invalidation._dispatch({'db': 'db2', 'scope': self.scope, 'keys': ['a']})
+        self.assertEqual(self.calls, [('db2', ['a'])])
+        self.assertEqual(invalidation.generation('db2', self.scope), generation + 1)
+
+        # A reconnecting listener invalidates every scope of every database
+        invalidation._dispatch({'db': None, 'scope': None, 'keys': None})
+        self.assertEqual(self.calls[-1], (None, None))
+        self.assertEqual(invalidation.generation('db2', self.scope), generation + 2)
+
+    def test_handler_error(self):
+        def failing(dbname, keys):
+            raise ValueError("broken handler")
+        invalidation.subscribe(self.scope, failing)
+        with self.assertLogs(invalidation.__name__, 'ERROR'):
+            invalidation._dispatch({'db': 'db1', 'scope': self.scope, 'keys': None})
+        # The other handlers still run
+        self.assertEqual(self.calls, [('db1', None)])
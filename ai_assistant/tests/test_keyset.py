@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from odoo.tests import BaseCase, TransactionCase, tagged
+
+from ..tools.keyset import decode_cursor, encode_cursor, keyset_search
+
+
+class FakeRecord(dict):
+
+    def __init__(self, record_id, **values):
+        super().__init__(values)
+        self.id = record_id
+
+
+@tagged('post_install', '-at_install')
+class TestKeysetCursor(BaseCase):
+
+    def test_round_trip(self):
+        value = datetime(2024, 5, 17, 10, 30, 15, 123456)
+        token = encode_cursor(FakeRecord(42, create_date=value), 'create_date')
+        self.assertNotIn('=', token)
+        # Microseconds are kept, or rows created within the same second would be skipped
+        self.assertEqual(decode_cursor(token), (value, 42))
+
+    def test_invalid_tokens(self):
+        for token in ['', 'not a cursor', 'W10', encode_cursor(FakeRecord('7', date=datetime(2024, 1, 1)), 'date')]:
+            with self.assertRaises(ValueError):
+                decode_cursor(token)
+
+
+@tagged('post_install', '-at_install')
+class TestKeysetSearch(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Conversation = cls.env['ai.conversation']
+        base = datetime(2024, 5, 17, 10, 0, 0)
+        # Ties on the date and sub-second differences, the cases an offset-free cursor gets wrong
+        dates = [base, base, base, base + timedelta(microseconds=1), base + timedelta(seconds=1), base - timedelta(days=1)]
+        cls.conversations = cls.Conversation.create([
+            {'title': f'Keyset {index}', 'last_message_date': date}
+            for index, date in enumerate(dates)
+        ])
+        cls.domain = [('id', 'in', cls.conversations.ids)]
+
+    def _pages(self, limit, descending=True):
+        pages, cursor = [], None
+        while True:
+            records, cursor = keyset_search(
+                self.Conversation, self.domain, 'last_message_date', limit, cursor, descending=descending)
+            pages.append(records)
+            if not cursor:
+                return pages
+
+    def test_pages_cover_every_record_once(self):
+        expected = self.Conversation.search(self.domain, order='last_message_date desc, id desc')
+        for limit in (1, 2, 4, 6, 10):
+            pages = self._pages(limit)
+            self.assertEqual([record.id for page in pages for record in page], expected.ids)
+            self.assertTrue(all(len(page) <= limit for page in pages))
+            # One extra row is fetched per page, so there is never a trailing empty page
+            self.assertEqual(len(pages), max(-(-len(expected) // limit), 1))
+
+    def test_ascending(self):
+        expected = self.Conversation.search(self.domain, order='last_message_date asc, id asc')
+        pages = self._pages(4, descending=False)
+        self.assertEqual([record.id for page in pages for record in page], expected.ids)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            keyset_search(self.Conversation, self.domain, 'last_message_date', 2, 'bogus')
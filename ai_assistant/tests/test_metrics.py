@@ -0,0 +1,116 @@
+import json
+
+from odoo.tests import BaseCase, TransactionCase, tagged
+
+from ..tools import metrics
+
+
+@tagged('post_install', '-at_install')
+class TestMetrics(BaseCase):
+
+    def _delta(self, before, key):
+        return metrics.collect().get(key, 0) - before.get(key, 0)
+
+    def test_counter(self):
+        before = metrics.collect()
+        metrics.inc('ai_credit_rejections_total')
+        metrics.inc('ai_tokens_consumed_total', 120, direction='in')
+        metrics.inc('ai_tokens_consumed_total', 30, direction='in')
+        self.assertEqual(self._delta(before, 'ai_credit_rejections_total'), 1)
+        self.assertEqual(self._delta(before, 'ai_tokens_consumed_total{direction="in"}'), 150)
+
+    def test_histogram(self):
+        before = metrics.collect()
+        metrics.observe('ai_send_message_duration_seconds', 0.3, test='histogram')
+        metrics.observe('ai_send_message_duration_seconds', 2.0, test='histogram')
+        metrics.observe('ai_send_message_duration_seconds', 100.0, test='histogram')
+        name = 'ai_send_message_duration_seconds'
+        # Buckets are cumulative
+        self.assertEqual(self._delta(before, f'{name}_bucket{{test="histogram",le="0.25"}}'), 0)
+        self.assertEqual(self._delta(before, f'{name}_bucket{{test="histogram",le="0.5"}}'), 1)
+        self.assertEqual(self._delta(before, f'{name}_bucket{{test="histogram",le="2.5"}}'), 2)
+        self.assertEqual(self._delta(before, f'{name}_bucket{{test="histogram",le="60.0"}}'), 2)
+        self.assertEqual(self._delta(before, f'{name}_bucket{{test="histogram",le="+Inf"}}'), 3)
+        self.assertEqual(self._delta(before, f'{name}_count{{test="histogram"}}'), 3)
+        self.assertAlmostEqual(self._delta(before, f'{name}_sum{{test="histogram"}}'), 102.3)
+
+    def test_timer_outcome(self):
+        before = metrics.collect()
+        with metrics.timer('ai_provider_request_duration_seconds', test='timer'):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.timer('ai_provider_request_duration_seconds', test='timer'):
+                raise ValueError("provider failed")
+        name = 'ai_provider_request_duration_seconds_count'
+        self.assertEqual(self._delta(before, f'{name}{{outcome="ok",test="timer"}}'), 1)
+        self.assertEqual(self._delta(before, f'{name}{{outcome="error",test="timer"}}'), 1)
+
+    def test_label_escaping(self):
+        before = metrics.collect()
+        metrics.inc('ai_provider_failovers_total', source='a"b\\c\nd', target='x')
+        self.assertEqual(self._delta(before, 'ai_provider_failovers_total{source="a\\"b\\\\c\\nd",target="x"}'), 1)
+
+    def test_render(self):
+        samples = {
+            'ai_credit_rejections_total': 4,
+            'ai_route_duration_seconds_bucket{route="send",le="+Inf"}': 2,
+            'ai_route_duration_seconds_bucket{route="send",le="10.0"}': 2,
+            'ai_route_duration_seconds_bucket{route="send",le="0.5"}': 1,
+            'ai_route_duration_seconds_sum{route="send"}': 0.75,
+            'ai_route_duration_seconds_count{route="send"}': 2,
+            'unknown_metric_total': 1,
+        }
+        text = metrics.render(samples, extra=[('ai_metrics_workers', 'gauge', 'Workers', 3)])
+        lines = text.splitlines()
+        self.assertTrue(text.endswith('\n'))
+        # Every known family is declared, even without samples
+        for name, (metric_type, _help, _buckets) in metrics.METRICS.items():
+            self.assertIn(f'# TYPE {name} {metric_type}', lines)
+        self.assertIn('ai_credit_rejections_total 4', lines)
+        self.assertIn('ai_route_duration_seconds_sum{route="send"} 0.75', lines)
+        self.assertNotIn('unknown_metric_total 1', lines)
+        self.assertEqual(lines[-3:], ['# HELP ai_metrics_workers Workers', '# TYPE ai_metrics_workers gauge', 'ai_metrics_workers 3'])
+        # Buckets in numeric order of their bound, not in string order
+        buckets = [line for line in lines if line.startswith('ai_route_duration_seconds_bucket')]
+        self.assertEqual(buckets, [
+            'ai_route_duration_seconds_bucket{route="send",le="0.5"} 1',
+            'ai_route_duration_seconds_bucket{route="send",le="10.0"} 2',
+            'ai_route_duration_seconds_bucket{route="send",le="+Inf"} 2',
+        ])
+
+
+@tagged('post_install', '-at_install')
+class TestMetricsWorkers(TransactionCase):
+
+    def _insert(self, worker, samples, hours_ago=0):
+        self.env.cr.execute("""
+            INSERT INTO ai_metrics_worker (worker, samples, updated_at)
+            VALUES (%s, %s, (now() at time zone 'UTC') - interval '1 hour' * %s)
+        """, (worker, json.dumps(samples), hours_ago))
+
+    def setUp(self):
+        super().setUp()
+        self.env.cr.execute("DELETE FROM ai_metrics_worker")
+
+    def test_render_sums_workers(self):
+        self._insert('host:1', {'ai_credit_rejections_total': 2})
+        self._insert('host:2', {'ai_credit_rejections_total': 3}, hours_ago=1)
+        lines = self.env['ai.metrics'].render_metrics().splitlines()
+        self.assertIn('ai_credit_rejections_total 5', lines)
+        # Only the worker that published recently counts as live
+        self.assertIn('ai_metrics_workers 1', lines)
+
+    def test_retire_workers(self):
+        self._insert('host:1', {'ai_credit_rejections_total': 2})
+        self._insert('host:2', {'ai_credit_rejections_total': 3}, hours_ago=48)
+        self._insert('host:3', {'ai_credit_rejections_total': 4}, hours_ago=72)
+        Metrics = self.env['ai.metrics']
+        before = Metrics.render_metrics()
+        Metrics._retire_workers()
+        self.env.cr.execute("SELECT worker, samples FROM ai_metrics_worker ORDER BY worker")
+        self.assertEqual(self.env.cr.fetchall(), [
+            ('host:1', {'ai_credit_rejections_total': 2}),
+            ('retired', {'ai_credit_rejections_total': 7}),
+        ])
+        # Totals do not move when stopped workers are folded away
+        self.assertEqual(Metrics.render_metrics(), before)
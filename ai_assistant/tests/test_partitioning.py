@@ -0,0 +1,78 @@
+from odoo.tests import TransactionCase, tagged
+
+from ..models.ai_partition_manager import PARTITIONED_TABLES
+
+# Models whose tables are partitioned or point at a partitioned table
+PARTITION_MODELS = ['ai.message', 'ai.credit.transaction', 'ai.dispatch.job', 'ai.conversation']
+
+
+@tagged('post_install', '-at_install')
+class TestPartitioning(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.manager = cls.env['ai.partition.manager']
+        cls.conversation = cls.env['ai.conversation'].create({'title': 'Partitioning'})
+        cls.message = cls.env['ai.message'].create({
+            'conversation_id': cls.conversation.id,
+            'role': 'assistant',
+            'content': 'Hello',
+        })
+        cls.credit = cls.env['ai.user.credit'].get_or_create_user_credit(cls.env.user.id)
+        cls.transaction = cls.env['ai.credit.transaction'].create({
+            'user_credit_id': cls.credit.id,
+            'transaction_type': 'usage',
+            'amount': -1.0,
+            'message_id': cls.message.id,
+        })
+
+    def _partition(self):
+        for table in PARTITIONED_TABLES:
+            if not self.manager._is_partitioned(table):
+                self.manager._convert_table(table)
+            self.manager._ensure_partitions(table)
+
+    def test_convert_keeps_rows(self):
+        self._partition()
+        for table in PARTITIONED_TABLES:
+            self.assertTrue(self.manager._is_partitioned(table))
+        self.env.invalidate_all()
+        self.assertEqual(self.message.content, 'Hello')
+        self.assertEqual(self.transaction.message_id, self.message)
+        self.assertEqual(self.transaction.message_ref, self.message.id)
+
+    def test_upgrade_after_partitioning(self):
+        """What ``-u ai_assistant`` does to the schema must work on partitioned tables"""
+        self._partition()
+        self.registry.init_models(self.cr, PARTITION_MODELS, {'module': 'ai_assistant'}, install=False)
+        self.cr.execute("""
+            SELECT conname FROM pg_constraint
+            WHERE confrelid = ANY(%s::regclass[]) AND contype = 'f'
+        """, (PARTITIONED_TABLES,))
+        self.assertEqual(self.cr.fetchall(), [])
+
+        message = self.env['ai.message'].create({
+            'conversation_id': self.conversation.id,
+            'role': 'assistant',
+            'content': 'After the upgrade',
+        })
+        self.assertTrue(self.manager._is_partitioned('ai_message'))
+        self.assertEqual(message.conversation_id, self.conversation)
+
+    def test_unlink_clears_references(self):
+        self._partition()
+        job = self.env['ai.dispatch.job'].create({
+            'conversation_id': self.conversation.id,
+            'user_message_ref': self.message.id,
+            'content': 'Hello',
+        })
+        self.assertEqual(job.user_message_id, self.message)
+        self.assertEqual(self.env['ai.credit.transaction'].search([('message_id', '=', self.message.id)]),
+                         self.transaction)
+
+        self.message.unlink()
+        self.env.invalidate_all()
+        self.assertFalse(self.transaction.message_ref)
+        self.assertFalse(self.transaction.message_id)
+        self.assertFalse(job.user_message_id)
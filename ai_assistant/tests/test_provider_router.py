@@ -0,0 +1,258 @@
+import threading
+import time
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from odoo.tests import BaseCase, tagged
+
+from ..tools import provider_router
+from ..tools.provider_client import ProviderError
+from ..tools.provider_router import (
+    CLOSED, HALF_OPEN, MIN_HEDGE_SAMPLES, OPEN, CircuitBreaker, ProviderRouter, Target, _weighted_order,
+)
+
+
+class FakeClient:
+
+    def __init__(self, name, fail=False, delay=0.0):
+        self.name = name
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    def post_chat(self, payload):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ProviderError(f"{self.name} is down")
+        return {'answer': self.name, 'chatbotId': payload['chatbotId']}
+
+    def stream_chat(self, payload):
+        self.calls += 1
+        if self.fail:
+            raise ProviderError(f"{self.name} is down")
+        yield self.name
+
+
+@tagged('post_install', '-at_install')
+class TestCircuitBreaker(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        clock = SimpleNamespace(monotonic=lambda: self.now, perf_counter=time.perf_counter)
+        patcher = patch.object(provider_router, 'time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _breaker(self, **settings):
+        return CircuitBreaker(**dict({'window': 4, 'min_calls': 4, 'open_seconds': 30.0}, **settings))
+
+    def test_opens_on_failures(self):
+        breaker = self._breaker()
+        for ok in (True, False, True):
+            self.assertIsNone(breaker.record(ok, 0.1))
+        # Not judged before min_calls, then half of the window failed
+        self.assertEqual(breaker.record(False, 0.1), OPEN)
+        self.assertFalse(breaker.available())
+        self.assertFalse(breaker.allow())
+
+    def test_opens_on_slow_calls(self):
+        breaker = self._breaker(slow_call_seconds=1.0)
+        for _index in range(3):
+            breaker.record(True, 0.1)
+        breaker.record(True, 5.0)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.record(True, 5.0), OPEN)
+
+    def test_half_open_probes(self):
+        breaker = self._breaker(half_open_calls=2)
+        for _index in range(4):
+            breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, OPEN)
+
+        self.now += 29
+        self.assertFalse(breaker.allow())
+        self.now += 1
+        # Two probe slots, and checking availability does not take one
+        self.assertTrue(breaker.available())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        self.assertFalse(breaker.available())
+
+        self.assertIsNone(breaker.record(True, 0.1))
+        self.assertEqual(breaker.record(True, 0.1), CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = self._breaker()
+        for _index in range(4):
+            breaker.record(False, 0.1)
+        self.now += 30
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.record(False, 0.1), OPEN)
+        self.assertFalse(breaker.allow())
+        self.now += 30
+        self.assertTrue(breaker.allow())
+
+    def test_lost_probe_slot_freed(self):
+        breaker = self._breaker()
+        for _index in range(4):
+            breaker.record(False, 0.1)
+        self.now += 30
+        self.assertTrue(breaker.allow())
+        # The probe never reports back
+        self.assertFalse(breaker.allow())
+        self.now += 30
+        self.assertTrue(breaker.allow())
+
+    def test_closed_window_resets(self):
+        breaker = self._breaker()
+        for _index in range(4):
+            breaker.record(False, 0.1)
+        self.now += 30
+        breaker.allow()
+        breaker.record(True, 0.1)
+        # Failures from before the circuit opened do not count any more
+        for _index in range(3):
+            self.assertIsNone(breaker.record(False, 0.1))
+        self.assertEqual(breaker.info(), {'state': CLOSED, 'calls': 3})
+
+    def test_p95(self):
+        breaker = self._breaker(window=1000, min_calls=1000)
+        for duration in range(1, MIN_HEDGE_SAMPLES):
+            breaker.record(True, duration)
+        self.assertIsNone(breaker.p95())
+        for duration in range(MIN_HEDGE_SAMPLES, 101):
+            breaker.record(True, duration)
+        # Failed calls carry no latency information
+        breaker.record(False, 1000)
+        self.assertEqual(breaker.p95(), 95)
+
+
+@tagged('post_install', '-at_install')
+class TestWeightedOrder(BaseCase):
+
+    def test_contents(self):
+        targets = [Target(str(index), str(index), 'bot', 'url', index, False) for index in range(5)]
+        for _index in range(20):
+            self.assertCountEqual(_weighted_order(targets), targets)
+        self.assertEqual(_weighted_order([]), [])
+
+    def test_distribution(self):
+        heavy = Target('heavy', 'heavy', 'bot', 'url', 3, False)
+        light = Target('light', 'light', 'bot', 'url', 1, False)
+        # Zero and negative weights count as 1 rather than failing
+        zero = Target('zero', 'zero', 'bot', 'url', 0, False)
+        first = Counter(_weighted_order([heavy, light, zero])[0].key for _index in range(6000))
+        # P(first) is proportional to the weight: 3/5, 1/5, 1/5
+        self.assertAlmostEqual(first['heavy'] / 6000, 0.6, delta=0.05)
+        self.assertAlmostEqual(first['light'] / 6000, 0.2, delta=0.05)
+        self.assertAlmostEqual(first['zero'] / 6000, 0.2, delta=0.05)
+
+
+@tagged('post_install', '-at_install')
+class TestProviderRouter(BaseCase):
+
+    def _router(self, clients, **settings):
+        """Router over ``clients``, the first one primary; breakers are fresh for each test"""
+        run = uuid.uuid4().hex
+        targets = [
+            Target(f'{run}:{client.name}', client.name, f'bot-{client.name}', client.name, 1, index == 0)
+            for index, client in enumerate(clients)
+        ]
+        by_url = {client.name: client for client in clients}
+        with patch.object(provider_router, 'get_provider_client', lambda env, url: by_url[url]):
+            router = ProviderRouter(None, targets, **settings)
+        self.addCleanup(self._drop_breakers, targets)
+        return router
+
+    def _drop_breakers(self, targets):
+        for target in targets:
+            provider_router._breakers.pop(target.key, None)
+
+    def _warm(self, router, target, duration=0.01):
+        # Enough fast successes for the p95 to be trusted
+        breaker = router._breaker(target)
+        for _index in range(MIN_HEDGE_SAMPLES):
+            breaker.record(True, duration)
+
+    def test_primary_first(self):
+        primary, backup = FakeClient('primary'), FakeClient('backup')
+        router = self._router([primary, backup])
+        self.assertEqual(router.post_chat({'message': 'Hi'}), {'answer': 'primary', 'chatbotId': 'bot-primary'})
+        self.assertEqual(backup.calls, 0)
+
+    def test_failover(self):
+        primary, backup = FakeClient('primary', fail=True), FakeClient('backup')
+        router = self._router([primary, backup])
+        with self.assertLogs(provider_router.__name__, 'WARNING'):
+            self.assertEqual(router.post_chat({})['answer'], 'backup')
+        self.assertEqual((primary.calls, backup.calls), (1, 1))
+
+    def test_all_failing(self):
+        clients = [FakeClient(name, fail=True) for name in ('a', 'b', 'c', 'd')]
+        router = self._router(clients, max_attempts=3)
+        with self.assertLogs(provider_router.__name__, 'WARNING'):
+            with self.assertRaisesRegex(ProviderError, 'is down.*is down.*is down'):
+                router.post_chat({})
+        self.assertEqual(sum(client.calls for client in clients), 3)
+
+    def test_open_circuit_skipped(self):
+        primary, backup = FakeClient('primary'), FakeClient('backup')
+        router = self._router([primary, backup], breaker_settings={'min_calls': 2, 'window': 2})
+        breaker = router._breaker(router.targets[0])
+        breaker.record(False, 0.1)
+        breaker.record(False, 0.1)
+        self.assertEqual(router.post_chat({})['answer'], 'backup')
+        self.assertEqual(primary.calls, 0)
+
+        router._breaker(router.targets[1])._open()
+        with self.assertRaisesRegex(ProviderError, 'circuits open'):
+            router.post_chat({})
+
+    def test_stream_failover(self):
+        primary, backup = FakeClient('primary', fail=True), FakeClient('backup')
+        router = self._router([primary, backup])
+        self.assertEqual(list(router.stream_chat({})), ['backup'])
+
+    def test_hedged_backup_wins(self):
+        primary, backup = FakeClient('primary', delay=1.0), FakeClient('backup')
+        router = self._router([primary, backup], hedge=True, hedge_min_delay=0.05)
+        self._warm(router, router.targets[0])
+        started = time.perf_counter()
+        self.assertEqual(router.post_chat({})['answer'], 'backup')
+        self.assertLess(time.perf_counter() - started, 0.9)
+
+    def test_hedge_needs_samples(self):
+        primary, backup = FakeClient('primary', delay=0.2), FakeClient('backup')
+        router = self._router([primary, backup], hedge=True, hedge_min_delay=0.05)
+        self.assertEqual(router.post_chat({})['answer'], 'primary')
+        self.assertEqual(backup.calls, 0)
+
+    def test_hedge_without_free_slot(self):
+        primary, backup = FakeClient('primary', delay=0.3), FakeClient('backup')
+        router = self._router([primary, backup], hedge=True, hedge_min_delay=0.05, hedge_max_calls=1)
+        self._warm(router, router.targets[0])
+        # The primary holds the only slot: no backup call rather than queueing it
+        self.assertEqual(router.post_chat({})['answer'], 'primary')
+        self.assertEqual(backup.calls, 0)
+
+    def test_pool_full_calls_inline(self):
+        primary, backup = FakeClient('primary'), FakeClient('backup')
+        router = self._router([primary, backup], hedge=True, hedge_max_calls=1)
+        self._warm(router, router.targets[0])
+        _executor, slots = provider_router._get_executor(1)
+        self.assertTrue(slots.acquire(blocking=False))
+        try:
+            thread_names = []
+            primary.post_chat = lambda payload: thread_names.append(threading.current_thread().name) or {'answer': 'primary'}
+            self.assertEqual(router.post_chat({})['answer'], 'primary')
+        finally:
+            slots.release()
+        # Every slot taken: the primary ran on the calling thread instead of waiting for one
+        self.assertEqual(thread_names, [threading.current_thread().name])
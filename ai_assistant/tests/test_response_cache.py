@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from odoo.tests import BaseCase, tagged
+
+from ..tools import response_cache
+from ..tools.response_cache import ResponseCache, get_response_cache, make_cache_key, normalize_prompt
+
+
+class FakeEnv(dict):
+
+    def __init__(self, dbname, models):
+        super().__init__(models)
+        self.cr = SimpleNamespace(dbname=dbname)
+
+
+@tagged('post_install', '-at_install')
+class TestResponseCache(BaseCase):
+
+    def test_normalize_prompt(self):
+        self.assertEqual(normalize_prompt("  What is   Odoo?\n"), "what is odoo")
+        self.assertEqual(normalize_prompt(None), "")
+        self.assertEqual(
+            make_cache_key("What is Odoo?", 'bot'),
+            make_cache_key("what is  odoo", 'bot'),
+        )
+
+    def test_cache_key_scope(self):
+        key = make_cache_key("Hello", 'bot', 'context')
+        self.assertNotEqual(key, make_cache_key("Hello", 'other-bot', 'context'))
+        self.assertNotEqual(key, make_cache_key("Hello", 'bot', 'other-context'))
+        self.assertNotEqual(key, make_cache_key("Hello", 'bot'))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # Reading 'a' makes 'b' the least recently used entry
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl=60)
+        cache.set('fresh', 1)
+        cache.set('expired', 2, ttl=-1)
+        self.assertEqual(cache.get('fresh'), 1)
+        self.assertIsNone(cache.get('expired'))
+        # The expired entry is dropped on read
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_stats(self):
+        cache = ResponseCache()
+        self.assertEqual(cache.stats()['hit_rate_percent'], 0.0)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+        self.assertEqual(stats['hit_rate_percent'], 75.0)
+
+    def test_invalidate_and_clear(self):
+        cache = ResponseCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertTrue(cache.invalidate('a'))
+        self.assertFalse(cache.invalidate('a'))
+        self.assertIsNone(cache.get('a'))
+        cache.clear()
+        self.assertIsNone(cache.get('b'))
+
+    def test_on_invalidation(self):
+        cache, other = ResponseCache(), ResponseCache()
+        with patch.dict(response_cache._caches, {'db1': cache, 'db2': other}):
+            for entry in (cache, other):
+                entry.set('a', 1)
+                entry.set('b', 2)
+            response_cache._on_invalidation('db1', ['a', 'missing'])
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('b'), 2)
+            # Other databases keep their entries
+            self.assertEqual(other.get('a'), 1)
+            response_cache._on_invalidation('db1', None)
+            self.assertEqual(cache.stats()['size'], 0)
+            self.assertEqual(other.stats()['size'], 2)
+            # No database: every cache goes
+            response_cache._on_invalidation(None, None)
+            self.assertEqual(other.stats()['size'], 0)
+            response_cache._on_invalidation('unknown', None)
+
+    def test_cache_per_database(self):
+        params = {'ai_assistant.response_cache_size': '5'}
+        snapshot = SimpleNamespace(get_param=lambda key, default=None: params.get(key, default))
+        config = SimpleNamespace(get_config_snapshot=lambda: snapshot)
+
+        def env(dbname):
+            return FakeEnv(dbname, {'ai.assistant.config': config})
+
+        with patch.dict(response_cache._caches, clear=True), \
+                patch.object(response_cache.invalidation, 'ensure_listening'):
+            cache = get_response_cache(env('db1'))
+            self.assertIs(get_response_cache(env('db1')), cache)
+            # The same prompt to the default chatbot must not be shared between tenants
+            self.assertIsNot(get_response_cache(env('db2')), cache)
+            self.assertEqual(cache.max_size, 5)
+            params['ai_assistant.response_cache_enabled'] = 'False'
+            self.assertIsNone(get_response_cache(env('db1')))
@@ -0,0 +1,54 @@
+from unittest.mock import patch
+
+from odoo.tests import BaseCase, tagged
+
+from ..tools import tokenizer
+from ..tools.tokenizer import CHUNK_SIZE, DEFAULT_FAMILY, MODEL_FAMILIES, count_tokens, get_family
+
+
+@tagged('post_install', '-at_install')
+class TestTokenizer(BaseCase):
+
+    def test_empty(self):
+        self.assertEqual(count_tokens(''), 0)
+        self.assertEqual(count_tokens(None, 'gpt-4'), 0)
+
+    def test_model_family(self):
+        # Longest prefix wins, case-insensitively
+        self.assertEqual(get_family('GPT-4o-mini'), MODEL_FAMILIES['gpt-4o'])
+        self.assertEqual(get_family('gpt-4-turbo'), MODEL_FAMILIES['gpt-4'])
+        self.assertEqual(get_family('claude-3-haiku'), MODEL_FAMILIES['claude'])
+        self.assertEqual(get_family('unknown-model'), DEFAULT_FAMILY)
+        self.assertEqual(get_family(None), DEFAULT_FAMILY)
+
+    def test_ratio_fallback(self):
+        tokenizer._count_chunk.cache_clear()
+        with patch.object(tokenizer, '_get_encoding', return_value=None):
+            self.assertEqual(count_tokens('x' * 35, 'claude'), 10)
+            self.assertEqual(count_tokens('x' * 36, 'claude'), 11)
+            self.assertEqual(count_tokens('x', 'unknown-model'), 1)
+        tokenizer._count_chunk.cache_clear()
+
+    def test_counts_grow_with_text(self):
+        sentence = "The quick brown fox jumps over the lazy dog. "
+        for model_name in (None, 'gpt-4', 'gpt-4o', 'claude'):
+            short = count_tokens(sentence, model_name)
+            self.assertGreater(short, 0)
+            self.assertGreater(count_tokens(sentence * 10, model_name), short)
+
+    def test_chunks(self):
+        text = "A sentence that repeats.\n" * 200 + "x" * (3 * CHUNK_SIZE)
+        chunks = list(tokenizer._chunks(text))
+        self.assertEqual(''.join(chunks), text)
+        self.assertTrue(all(len(chunk) < 2 * CHUNK_SIZE for chunk in chunks))
+        self.assertEqual(
+            count_tokens(text, 'gpt-4'),
+            sum(tokenizer._count_chunk(chunk, *get_family('gpt-4')) for chunk in chunks),
+        )
+
+    def test_memoized(self):
+        text = "Shared conversation prefix. " * 100
+        first = count_tokens(text, 'gpt-4')
+        hits = tokenizer.cache_info()['hits']
+        self.assertEqual(count_tokens(text, 'gpt-4'), first)
+        self.assertGreater(tokenizer.cache_info()['hits'], hits)
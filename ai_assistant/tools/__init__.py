@@ -0,0 +1 @@
+from . import provider_client
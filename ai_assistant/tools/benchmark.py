@@ -0,0 +1,367 @@
+# benchmark.py
+#
+# Seed synthetic chat/credit data and time the module's hot paths against
+# the local provider stub. Run it against a throwaway database:
+#
+#   python -m odoo.addons.ai_assistant.tools.benchmark -c odoo.conf -d bench \
+#       --conversations 100000 --messages-per-conversation 20 --latency 0.2 \
+#       --server-url http://localhost:8069 --output bench-17.0.1.1.0.json
+#
+# Seeded rows are tagged (users log in as ai_bench_<n>, conversation titles
+# start with "bench:") and are reused by later runs unless --reseed is given.
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+from datetime import datetime
+
+import requests
+
+from .provider_stub import StubProvider
+
+_logger = logging.getLogger(__name__)
+
+BENCH_LOGIN = 'ai_bench_%d'
+BENCH_TITLE = 'bench:'
+
+# Controller routes timed over HTTP: (name, method, path, params)
+ROUTES = [
+    ('route.conversations', 'GET', '/ai_assistant/conversations', {'limit': 50}),
+    ('route.conversation_messages', 'GET', '/ai_assistant/conversation/{conversation_id}/messages', {'limit': 50}),
+    ('route.user_credits', 'GET', '/ai_assistant/user/credits', {}),
+    ('route.usage_history', 'GET', '/ai_assistant/user/usage_history', {'days': 30}),
+    ('route.system_status', 'GET', '/ai_assistant/system/status', {}),
+    ('route.send_message', 'POST', '/ai_assistant/chat/send_message', {'message': 'How do I confirm a sale order?'}),
+]
+
+
+def summarize(samples):
+    """Latency statistics in milliseconds for a list of durations in seconds"""
+    if not samples:
+        return {'runs': 0}
+    ms = sorted(s * 1000.0 for s in samples)
+
+    def pct(p):
+        return ms[min(len(ms) - 1, int(round(p / 100.0 * (len(ms) - 1))))]
+
+    return {
+        'runs': len(ms),
+        'min_ms': round(ms[0], 3),
+        'mean_ms': round(statistics.fmean(ms), 3),
+        'p50_ms': round(pct(50), 3),
+        'p95_ms': round(pct(95), 3),
+        'p99_ms': round(pct(99), 3),
+        'max_ms': round(ms[-1], 3),
+    }
+
+
+class JsonRpcClient:
+    """Authenticated JSON-RPC session against a running Odoo server"""
+
+    def __init__(self, url, db, login, password):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        result = self.call('POST', '/web/session/authenticate', {
+            'db': db, 'login': login, 'password': password,
+        })
+        self.uid = result['uid']
+
+    def call(self, method, path, params=None):
+        response = self.session.request(method, self.url + path, json={
+            'jsonrpc': '2.0', 'method': 'call', 'params': params or {},
+        }, timeout=120)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('error'):
+            raise RuntimeError(f"{path}: {data['error'].get('message')}")
+        return data.get('result')
+
+
+class Benchmark:
+
+    def __init__(self, env, args):
+        self.env = env
+        self.cr = env.cr
+        self.args = args
+        self.results = {}
+
+    # Seeding
+
+    def bench_users(self):
+        return self.env['res.users'].with_context(active_test=False).search(
+            [('login', '=like', BENCH_LOGIN.replace('%d', '%'))], order='id'
+        )
+
+    def seed(self):
+        args = self.args
+        users = self.bench_users()
+        self.cr.execute("SELECT 1 FROM ai_conversation WHERE title LIKE %s LIMIT 1", (BENCH_TITLE + '%',))
+        if self.cr.fetchone():
+            if not args.reseed:
+                _logger.info(f"Reusing seeded data for {len(users)} benchmark users")
+                return users
+            self.clear()
+
+        started = time.perf_counter()
+        group = self.env.ref('ai_assistant.group_ai_assistant_user')
+        users |= self.env['res.users'].with_context(no_reset_password=True).create([{
+            'name': f"AI Bench {i}",
+            'login': BENCH_LOGIN % i,
+            'password': args.password,
+            'groups_id': [(6, 0, [self.env.ref('base.group_user').id, group.id])],
+        } for i in range(len(users), args.users)])
+
+        credit_model = self.env['ai.user.credit'].sudo()
+        for user in users:
+            credit_model.get_or_create_user_credit(user.id)
+        # Large balances so timed debits never hit the insufficient-credit path
+        self.cr.execute("""
+            UPDATE ai_user_credit
+            SET total_credits = 1e9, credit_limit = 1e10, remaining_credits = 1e9 - used_credits
+            WHERE user_id IN %s
+        """, (tuple(users.ids),))
+
+        config = self.env['ai.assistant.config'].sudo().get_active_config()
+        self.cr.execute("""
+            INSERT INTO ai_conversation (
+                title, user_id, is_active, message_count,
+                total_tokens_used, total_cost_usd, total_credits_used,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                %(title)s || g, (%(users)s::int[])[1 + g %% %(user_count)s], true, 0, 0, 0, 0,
+                1, ts, 1, ts
+            FROM (
+                SELECT g, (now() at time zone 'UTC') - random() * (%(days)s || ' days')::interval AS ts
+                FROM generate_series(1, %(count)s) g
+            ) s
+        """, {
+            'title': BENCH_TITLE, 'users': users.ids, 'user_count': len(users),
+            'count': args.conversations, 'days': args.days,
+        })
+
+        # Alternating user/assistant messages, one minute apart
+        self.cr.execute("""
+            INSERT INTO ai_message (
+                conversation_id, role, content, is_user_message, config_id,
+                tokens_used, credit_cost, actual_cost_usd, revenue_usd, response_time,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                c.id,
+                CASE WHEN g %% 2 = 1 THEN 'user' ELSE 'assistant' END,
+                'Synthetic benchmark message ' || g,
+                g %% 2 = 1,
+                %(config_id)s,
+                CASE WHEN g %% 2 = 1 THEN 0 ELSE 100 + (random() * 900)::int END,
+                CASE WHEN g %% 2 = 1 THEN 0 ELSE round((random() * 2)::numeric, 2) END,
+                CASE WHEN g %% 2 = 1 THEN 0 ELSE round((random() * 0.02)::numeric, 4) END,
+                CASE WHEN g %% 2 = 1 THEN 0 ELSE round((random() * 0.05)::numeric, 4) END,
+                CASE WHEN g %% 2 = 1 THEN 0 ELSE random() * 3 END,
+                c.user_id, c.create_date + g * interval '1 minute',
+                c.user_id, c.create_date + g * interval '1 minute'
+            FROM ai_conversation c, generate_series(1, %(per_conversation)s) g
+            WHERE c.title LIKE %(title)s
+        """, {
+            'config_id': config.id or None,
+            'per_conversation': args.messages_per_conversation,
+            'title': BENCH_TITLE + '%',
+        })
+
+        self.cr.execute("""
+            INSERT INTO ai_credit_transaction (
+                user_credit_id, user_id, transaction_type, amount, description,
+                balance_before, balance_after,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                uc.id, uc.user_id, 'usage', -1, 'Synthetic benchmark usage',
+                1e9 - g + 1, 1e9 - g,
+                1, ts, 1, ts
+            FROM ai_user_credit uc,
+                (
+                    SELECT g, (now() at time zone 'UTC') - random() * (%(days)s || ' days')::interval AS ts
+                    FROM generate_series(1, %(per_user)s) g
+                ) s
+            WHERE uc.user_id IN %(users)s
+        """, {
+            'per_user': max(1, args.transactions // len(users)),
+            'days': args.days,
+            'users': tuple(users.ids),
+        })
+
+        self.env['ai.conversation']._recompute_counters()
+        self.env['ai.usage.daily'].rebuild()
+        self.cr.execute("ANALYZE ai_conversation, ai_message, ai_credit_transaction, ai_usage_daily")
+        self.cr.commit()
+        self.results['seed'] = {'seconds': round(time.perf_counter() - started, 2)}
+        _logger.info(f"Seeded benchmark data in {self.results['seed']['seconds']}s")
+        return users
+
+    def clear(self):
+        """Remove seeded conversations, messages and transactions; users are kept for reuse"""
+        users = self.bench_users()
+        if not users:
+            return
+        user_ids = tuple(users.ids)
+        self.cr.execute("""
+            DELETE FROM ai_message WHERE conversation_id IN (
+                SELECT id FROM ai_conversation WHERE user_id IN %s
+            )
+        """, (user_ids,))
+        self.cr.execute("DELETE FROM ai_conversation WHERE user_id IN %s", (user_ids,))
+        self.cr.execute("DELETE FROM ai_credit_transaction WHERE user_id IN %s", (user_ids,))
+        self.env['ai.usage.daily'].rebuild()
+        self.env.invalidate_all()
+        self.cr.commit()
+
+    # Timing
+
+    def measure(self, name, func, rollback=False):
+        samples = []
+        for i in range(self.args.warmup + self.args.repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            if rollback:
+                # Undoes the ORM writes and the ledger debit alike
+                self.cr.rollback()
+            if i >= self.args.warmup:
+                samples.append(elapsed)
+        self.results[name] = summarize(samples)
+        _logger.info(f"{name}: {self.results[name]}")
+
+    def run_models(self, users):
+        user = users[0]
+        env = self.env(user=user.id)
+        conversation = env['ai.conversation'].search([('user_id', '=', user.id)], limit=1)
+        credit = env['ai.user.credit'].sudo().get_or_create_user_credit(user.id)
+        prompts = iter(range(10 ** 9))
+
+        # Unique prompts so every call reaches the stub instead of the response cache
+        self.measure('model.create_from_input', lambda: env['ai.message'].create_from_input(
+            conversation, f"Benchmark question {next(prompts)}"
+        ), rollback=True)
+        self.measure('model.consume_credits', lambda: credit.consume_credits(
+            0.5, description='Benchmark debit'
+        ), rollback=True)
+
+        analytics = self.env['ai.business.analytics']
+        for method in ['get_business_metrics', 'get_top_users', 'get_daily_usage_chart',
+                       'get_provider_breakdown', 'get_conversation_analytics', 'get_cache_metrics',
+                       'export_business_report']:
+            self.measure(f"analytics.{method}", lambda m=method: getattr(analytics, m)(days=self.args.days))
+        for granularity in ['hour', 'day', 'week', 'month']:
+            self.measure(f"analytics.get_usage_series.{granularity}",
+                         lambda g=granularity: analytics.get_usage_series(g, days=self.args.days))
+
+    def run_routes(self, users):
+        client = JsonRpcClient(self.args.server_url, self.cr.dbname, users[0].login, self.args.password)
+        self.measure('route.conversation_create', lambda: client.call(
+            'POST', '/ai_assistant/conversation/create', {'title': 'bench: route'}
+        ))
+        self.cr.execute("SELECT id FROM ai_conversation WHERE user_id = %s ORDER BY id DESC LIMIT 1",
+                        (users[0].id,))
+        conversation_id = self.cr.fetchone()[0]
+        prompts = iter(range(10 ** 9))
+        for name, method, path, params in ROUTES:
+            params = dict(params, conversation_id=conversation_id)
+            if 'message' in params:
+                self.measure(name, lambda p=path, m=method, params=params: client.call(
+                    m, p.format(**params), dict(params, message=f"{params['message']} {next(prompts)}")
+                ))
+            else:
+                self.measure(name, lambda p=path, m=method, params=params: client.call(
+                    m, p.format(**params), params
+                ))
+
+    def report(self, stub):
+        self.cr.execute("SELECT latest_version FROM ir_module_module WHERE name = 'ai_assistant'")
+        row = self.cr.fetchone()
+        self.cr.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM ai_conversation),
+                (SELECT COUNT(*) FROM ai_message),
+                (SELECT COUNT(*) FROM ai_credit_transaction)
+        """)
+        conversations, messages, transactions = self.cr.fetchone()
+        return {
+            'meta': {
+                'date': datetime.utcnow().isoformat(),
+                'module_version': row[0] if row else None,
+                'database': self.cr.dbname,
+                'python': platform.python_version(),
+                'host': platform.node(),
+                'provider_latency': self.args.latency,
+                'provider_requests': stub.request_count,
+                'repeat': self.args.repeat,
+                'rows': {
+                    'ai_conversation': conversations,
+                    'ai_message': messages,
+                    'ai_credit_transaction': transactions,
+                },
+            },
+            'results': self.results,
+        }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='AI Assistant benchmark suite')
+    parser.add_argument('-c', '--config', help='Odoo configuration file')
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--conversations', type=int, default=10000)
+    parser.add_argument('--messages-per-conversation', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=90, help='Spread seeded data over this many days')
+    parser.add_argument('--reseed', action='store_true', help='Drop previously seeded data first')
+    parser.add_argument('--clear', action='store_true', help='Only remove seeded data')
+    parser.add_argument('--latency', type=float, default=0.2, help='Stub provider latency in seconds')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--server-url', help='Running Odoo server, enables the controller route timings')
+    parser.add_argument('--password', default='bench')
+    parser.add_argument('--output', default='ai_assistant_benchmark.json')
+    args = parser.parse_args()
+
+    import odoo
+    from odoo import api, SUPERUSER_ID
+
+    odoo.tools.config.parse_config(['-c', args.config] if args.config else [])
+    registry = odoo.registry(args.database)
+
+    with StubProvider(latency=args.latency) as stub, registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        bench = Benchmark(env, args)
+        if args.clear:
+            bench.clear()
+            return
+
+        get_param = env['ir.config_parameter'].sudo().get_param
+        set_param = env['ir.config_parameter'].sudo().set_param
+        previous_url = get_param('ai_assistant.provider_url')
+        set_param('ai_assistant.provider_url', stub.url)
+        cr.commit()
+        try:
+            users = bench.seed()
+            bench.run_models(users)
+            if args.server_url:
+                bench.run_routes(users)
+            report = bench.report(stub)
+        finally:
+            cr.rollback()
+            set_param('ai_assistant.provider_url', previous_url or False)
+            cr.commit()
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark report written to {os.path.abspath(args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# context_builder.py
+
+import re
+
+from .tokenizer import count_tokens
+
+_WHITESPACE = re.compile(r'\s+')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+ROLE_LABELS = {'user': 'User', 'assistant': 'Assistant'}
+
+
+def estimate_tokens(text, model_name=None):
+    """Token count of ``text`` with the offline tokenizer"""
+    return count_tokens(text, model_name)
+
+
+def summarize_turn(role, content, max_chars=160):
+    """One summary line for a turn: its first sentence, clipped"""
+    text = _WHITESPACE.sub(' ', content or '').strip()
+    text = _SENTENCE_END.split(text, 1)[0]
+    if len(text) > max_chars:
+        text = text[:max_chars - 1].rstrip() + '…'
+    return f"{ROLE_LABELS.get(role, role)}: {text}"
+
+
+def trim_summary(lines, token_budget):
+    """Drop the oldest lines until the summary fits the budget"""
+    tokens = sum(estimate_tokens(line) + 1 for line in lines)
+    start = 0
+    while start < len(lines) and tokens > token_budget:
+        tokens -= estimate_tokens(lines[start]) + 1
+        start += 1
+    return lines[start:], tokens
+
+
+def render_context(context_info, summary, turns):
+    """Prompt context sent along with the user's message"""
+    sections = []
+    if context_info:
+        sections.append(f"[Session]\n{context_info.strip()}")
+    if summary:
+        sections.append(f"[Earlier in this conversation]\n{summary}")
+    if turns:
+        sections.append("[Recent messages]\n" + '\n'.join(
+            f"{ROLE_LABELS.get(role, role)}: {content}" for role, content in turns
+        ))
+    return '\n\n'.join(sections)
@@ -0,0 +1,190 @@
+# event_buffer.py
+#
+# In-process buffer for ai.usage.event rows. Requests append events
+# without touching the database; the buffer is written with multi-row
+# inserts once it reaches the flush size, when its oldest event is older
+# than the flush interval, or after the adding request commits.
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_MAX_SIZE = 10000
+
+
+class EventBuffer:
+    """Bounded buffer of event rows for one database
+
+    ``writer(rows)`` persists a list of rows. When the buffer is full the
+    producer flushes inline, so a slow database slows the request down
+    instead of growing memory; if that flush fails too, the event is
+    dropped and counted.
+
+    A failed write is retried later, unless the writer raised one of
+    ``row_errors``, meaning some row can never be written: the batch is
+    then split in halves until the bad rows are isolated, and those are
+    rejected and counted while the others are written.
+    """
+
+    def __init__(self, writer, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_size=DEFAULT_MAX_SIZE, row_errors=()):
+        self.writer = writer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.row_errors = tuple(row_errors)
+        self.flushed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed_flushes = 0
+        self._rows = deque()
+        self._oldest = None
+        self._lock = threading.Lock()
+        # One flush at a time: rows are taken out before writing, never written twice
+        self._flush_lock = threading.Lock()
+
+    def add(self, row):
+        """Queue one row; False if it had to be dropped"""
+        with self._lock:
+            full = len(self._rows) >= self.max_size
+        if full:
+            # Backpressure: the producer pays for the flush
+            self.flush()
+        with self._lock:
+            if len(self._rows) >= self.max_size:
+                self.dropped += 1
+                return False
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.append(row)
+            return True
+
+    def due(self):
+        """Whether the size or age threshold is reached"""
+        with self._lock:
+            if not self._rows:
+                return False
+            return len(self._rows) >= self.flush_size or time.monotonic() - self._oldest >= self.flush_interval
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._rows)
+                self._rows.clear()
+                self._oldest = None
+            if not rows:
+                return 0
+            written = self._write(rows)
+            self.flushed += written
+            return written
+
+    def _write(self, rows):
+        """Write ``rows``, isolating the ones the writer rejects; returns the number written"""
+        try:
+            self.writer(rows)
+            return len(rows)
+        except self.row_errors as e:
+            if len(rows) == 1:
+                self.rejected += 1
+                _logger.warning(f"Rejected an AI usage event that cannot be written: {str(e)}")
+                return 0
+        except Exception as e:
+            self.failed_flushes += 1
+            self._requeue(rows)
+            _logger.error(f"Error flushing {len(rows)} AI usage events: {str(e)}")
+            return 0
+        # Each half is written on its own, so the good rows of the batch get through
+        middle = len(rows) // 2
+        return self._write(rows[:middle]) + self._write(rows[middle:])
+
+    def _requeue(self, rows):
+        # Put the rows back in front for the next attempt, within the size bound
+        with self._lock:
+            room = self.max_size - len(self._rows)
+            kept = rows[-room:] if room > 0 else []
+            self.dropped += len(rows) - len(kept)
+            self._rows.extendleft(reversed(kept))
+            if self._rows:
+                self._oldest = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buffered': len(self._rows),
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'rejected': self.rejected,
+                'failed_flushes': self.failed_flushes,
+                'flush_size': self.flush_size,
+                'flush_interval': self.flush_interval,
+                'max_size': self.max_size,
+            }
+
+
+# One buffer per database in each worker process
+_buffers = {}
+_buffers_pid = None
+_buffers_lock = threading.Lock()
+_flusher_pid = None
+
+
+def get_event_buffer(dbname, writer, **settings):
+    """This process's buffer for ``dbname``, created on first use and updated with ``settings``"""
+    global _buffers_pid
+    with _buffers_lock:
+        if _buffers_pid != os.getpid():
+            # Rows buffered before a fork belong to the parent
+            _buffers.clear()
+            _buffers_pid = os.getpid()
+        buffer = _buffers.get(dbname)
+        if buffer is None:
+            buffer = _buffers[dbname] = EventBuffer(writer, **settings)
+        else:
+            # The writer may hold a newer registry after a reload
+            buffer.writer = writer
+            for name, value in settings.items():
+                setattr(buffer, name, value)
+    _ensure_flusher()
+    return buffer
+
+
+def flush_all():
+    """Flush every buffer of this process"""
+    with _buffers_lock:
+        buffers = list(_buffers.values())
+    return sum(buffer.flush() for buffer in buffers)
+
+
+def _ensure_flusher():
+    """Background thread flushing idle buffers whose oldest event passed the interval"""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _buffers_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name='ai_assistant.usage_events', daemon=True).start()
+
+
+def _flush_loop():
+    while True:
+        with _buffers_lock:
+            buffers = list(_buffers.values())
+        interval = min([buffer.flush_interval for buffer in buffers] or [DEFAULT_FLUSH_INTERVAL])
+        time.sleep(max(interval / 2, 0.5))
+        for buffer in buffers:
+            if buffer.due():
+                buffer.flush()
+
+
+# Best effort on worker shutdown; rows still buffered when a worker is killed are lost
+atexit.register(flush_all)
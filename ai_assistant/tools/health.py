@@ -0,0 +1,94 @@
+# health.py
+#
+# Readiness status kept fresh by a background prober. Each worker process
+# probes the database and the provider on an interval and keeps the last
+# result in memory, so the health routes answer without any I/O.
+
+import logging
+import os
+import threading
+import time
+
+import odoo
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 30.0
+
+# A status older than this many intervals means the prober is stuck
+STALE_INTERVALS = 3
+
+_started = time.time()
+_statuses = {}
+_lock = threading.Lock()
+_prober_pid = None
+_interval = DEFAULT_INTERVAL
+
+
+def liveness():
+    """This process is up and serving requests; no database or network access"""
+    prober_alive = _prober_pid == os.getpid()
+    return {
+        'status': 'alive',
+        'pid': os.getpid(),
+        'uptime': round(time.time() - _started, 1),
+        'prober': 'running' if prober_alive else 'idle',
+    }
+
+
+def readiness(dbname):
+    """Last probe result for ``dbname``; probes inline only the first time"""
+    _ensure_prober()
+    with _lock:
+        status = _statuses.get(dbname)
+    if status is None:
+        status = _probe(dbname)
+    elif time.time() - status['checked_at'] > STALE_INTERVALS * _interval:
+        status = dict(status, ready=False, status='stale')
+    return status
+
+
+def _ensure_prober():
+    global _prober_pid
+    if _prober_pid == os.getpid():
+        return
+    with _lock:
+        if _prober_pid == os.getpid():
+            return
+        # Threads do not survive a fork: each worker runs its own prober
+        _prober_pid = os.getpid()
+        _statuses.clear()
+        threading.Thread(target=_probe_loop, name='ai_assistant.health', daemon=True).start()
+
+
+def _probe_loop():
+    while True:
+        time.sleep(_interval)
+        with _lock:
+            dbnames = list(_statuses)
+        for dbname in dbnames:
+            _probe(dbname)
+
+
+def _probe(dbname):
+    """Probe ``dbname`` and its provider, store and return the status"""
+    global _interval
+    started = time.perf_counter()
+    try:
+        registry = odoo.registry(dbname)
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            status = env['ai.assistant.config']._probe_health()
+    except Exception as e:
+        _logger.warning(f"AI Assistant health probe of {dbname} failed: {str(e)}")
+        status = {
+            'ready': False,
+            'status': 'database_error',
+            'database': {'ok': False, 'error': str(e)},
+        }
+    status['checked_at'] = time.time()
+    status['probe_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    _interval = max(float(status.pop('interval', _interval)), 1.0)
+    with _lock:
+        _statuses[dbname] = status
+    return status
@@ -0,0 +1,150 @@
+# invalidation.py
+#
+# Cross-worker invalidation of the module's process-local caches over
+# Postgres LISTEN/NOTIFY. Models publish (scope, keys) from their
+# transaction; once it commits every worker, this one included, calls the
+# handlers subscribed to that scope with the affected keys only.
+
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+
+import odoo
+
+_logger = logging.getLogger(__name__)
+
+CHANNEL = 'ai_assistant_invalidate'
+
+# Seconds between keep-alive checks of the listening connection, and before reconnecting
+POLL_TIMEOUT = 50
+RETRY_DELAY = 5
+
+# Above this many keys a notification invalidates the whole scope (NOTIFY payloads are capped at 8000 bytes)
+MAX_KEYS = 100
+
+_handlers = defaultdict(list)
+_generations = defaultdict(int)
+_lock = threading.Lock()
+_listener_pid = None
+
+
+def subscribe(scope, handler):
+    """Call ``handler(dbname, keys)`` on invalidations of ``scope``; None means every db / every key"""
+    with _lock:
+        if handler not in _handlers[scope]:
+            _handlers[scope].append(handler)
+
+
+def generation(dbname, scope):
+    """Counter bumped on every invalidation of ``scope`` in ``dbname``
+
+    Read it before loading a value and store the value only if it has not
+    moved, so an invalidation racing with the load is not lost.
+    """
+    with _lock:
+        return _generations[(dbname, scope)]
+
+
+def pending(cr, scope):
+    """Whether the transaction of ``cr`` has published an invalidation of ``scope``"""
+    return scope in cr.postcommit.data.get(CHANNEL, {})
+
+
+def publish(cr, scope, keys=None):
+    """Invalidate ``keys`` of ``scope`` (all of it when None) in every worker once ``cr`` commits"""
+    data = cr.postcommit.data
+    if CHANNEL not in data:
+        data[CHANNEL] = {}
+        dbname = cr.dbname
+
+        @cr.postcommit.add
+        def notify():
+            scopes = data.pop(CHANNEL, {})
+            messages = [
+                {'db': dbname, 'scope': scope, 'keys': None if scope_keys is None else sorted(scope_keys)}
+                for scope, scope_keys in scopes.items()
+            ]
+            # This worker first, without waiting for the round trip
+            for message in messages:
+                _dispatch(message)
+            try:
+                with odoo.sql_db.db_connect(_channel_db()).cursor() as notify_cr:
+                    for message in messages:
+                        notify_cr.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps(message)))
+            except Exception as e:
+                _logger.error(f"Error publishing AI cache invalidation: {str(e)}")
+
+    scopes = data[CHANNEL]
+    if keys is None or scopes.get(scope, set()) is None:
+        scopes[scope] = None
+    else:
+        scope_keys = scopes.setdefault(scope, set())
+        scope_keys.update(keys)
+        if len(scope_keys) > MAX_KEYS:
+            scopes[scope] = None
+
+
+def ensure_listening():
+    """Start this process's listener thread if it is not running (call before filling a cache)"""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        # Forked workers do not inherit the parent's thread: each process starts its own
+        _listener_pid = os.getpid()
+        thread = threading.Thread(target=_listen, name='ai_assistant.invalidation', daemon=True)
+        thread.start()
+
+
+def _channel_db():
+    # Notifications are sent and received on one database, like the bus does; the payload names the target db
+    return 'postgres'
+
+
+def _listen():
+    while True:
+        try:
+            with odoo.sql_db.db_connect(_channel_db()).cursor() as cr:
+                conn = cr._cnx
+                cr.execute(f"LISTEN {CHANNEL}")
+                cr.commit()
+                # Anything could have changed while nobody was listening
+                _dispatch({'db': None, 'scope': None, 'keys': None})
+                _logger.info("Listening for AI cache invalidations")
+                while True:
+                    if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        try:
+                            _dispatch(json.loads(notification.payload))
+                        except ValueError:
+                            _logger.warning(f"Ignoring malformed AI cache invalidation: {notification.payload!r}")
+        except Exception as e:
+            _logger.warning(f"AI cache invalidation listener lost its connection, retrying: {str(e)}")
+            time.sleep(RETRY_DELAY)
+
+
+def _dispatch(message):
+    dbname, scope, keys = message.get('db'), message.get('scope'), message.get('keys')
+    with _lock:
+        scopes = list(_handlers) if scope is None else [scope]
+        for name in scopes:
+            if dbname is None:
+                for key in [key for key in _generations if key[1] == name]:
+                    _generations[key] += 1
+            else:
+                _generations[(dbname, name)] += 1
+        handlers = [(name, handler) for name in scopes for handler in _handlers.get(name, [])]
+    for name, handler in handlers:
+        try:
+            handler(dbname, keys)
+        except Exception as e:
+            _logger.error(f"Error invalidating AI cache {name}: {str(e)}")
@@ -0,0 +1,51 @@
+# keyset.py
+
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(record, field_name):
+    """Opaque continuation token for the position just after ``record``"""
+    # Full precision: create_date carries microseconds, and truncating them would skip rows
+    value = record[field_name].isoformat(sep=' ')
+    raw = json.dumps([value, record.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(datetime, id) from a token made by ``encode_cursor``; ValueError if it is not one"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, record_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(value)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid pagination cursor: {token!r}") from e
+    if not isinstance(record_id, int):
+        raise ValueError(f"Invalid pagination cursor: {token!r}")
+    return value, record_id
+
+
+def keyset_search(model, domain, field_name, limit, cursor=None, descending=True):
+    """One page of ``model`` ordered by (datetime field, id), starting after ``cursor``
+
+    Each page is an index range scan from the cursor position, so deep
+    pages cost the same as the first one. Returns ``(records, next_cursor)``,
+    ``next_cursor`` being None on the last page.
+    """
+    direction = 'desc' if descending else 'asc'
+    query = model._search(domain, limit=limit + 1, order=f"{field_name} {direction}, id {direction}")
+    if cursor:
+        value, record_id = decode_cursor(cursor)
+        # Row comparison, so Postgres seeks straight to the cursor in the (field, id) index
+        query.add_where(
+            f'("{model._table}"."{field_name}", "{model._table}"."id") {"<" if descending else ">"} (%s, %s)',
+            [value, record_id],
+        )
+
+    # One extra row tells whether another page exists without counting
+    records = model.browse(query)
+    if len(records) > limit:
+        records = records[:limit]
+        return records, encode_cursor(records[-1], field_name)
+    return records, None
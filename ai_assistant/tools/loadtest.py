@@ -0,0 +1,348 @@
+# loadtest.py
+#
+# Drive many simulated chatters against a running Odoo server and report
+# throughput, latency percentiles, saturation and credit-ledger consistency.
+# The provider is the local stub, started here with tunable latency, error
+# rate and reply size:
+#
+#   python -m odoo.addons.ai_assistant.tools.loadtest -c odoo.conf -d bench \
+#       --server-url http://localhost:8069 --concurrency 50 --duration 120 \
+#       --latency 1.5 --error-rate 0.02 --payload-size 2000
+#
+# Simulated users are the benchmark users (see benchmark.py), seeded on
+# first use. A share of them (--low-balance-share) starts the run with a
+# few credits and two chatters each, so the ledger check also covers
+# debits racing for the end of a balance.
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from .benchmark import Benchmark, JsonRpcClient, summarize
+from .provider_stub import StubProvider
+
+_logger = logging.getLogger(__name__)
+
+# Weighted mix of what a chatter does between think times: (name, weight)
+ACTIONS = [
+    ('send_message', 6),
+    ('conversations', 2),
+    ('user_credits', 2),
+]
+
+
+class SimulatedUser(threading.Thread):
+
+    def __init__(self, harness, login):
+        super().__init__(daemon=True)
+        self.harness = harness
+        self.login = login
+
+    def run(self):
+        args = self.harness.args
+        try:
+            client = JsonRpcClient(args.server_url, args.database, self.login, args.password)
+            # Chat in the user's seeded conversation
+            listing = client.call('GET', '/ai_assistant/conversations', {'limit': 1})
+            conversation_id = listing['conversations'][0]['id']
+        except Exception as e:
+            self.harness.record('login', 0.0, str(e))
+            return
+
+        names = [name for name, _weight in ACTIONS]
+        weights = [weight for _name, weight in ACTIONS]
+        sent = 0
+        while not self.harness.stopping.is_set():
+            action = random.choices(names, weights)[0]
+            if action == 'send_message':
+                sent += 1
+                method, path, params = 'POST', '/ai_assistant/chat/send_message', {
+                    'conversation_id': conversation_id,
+                    'message': f"Load test question {self.login} {sent}",
+                }
+            elif action == 'conversations':
+                method, path, params = 'GET', '/ai_assistant/conversations', {'limit': 20}
+            else:
+                method, path, params = 'GET', '/ai_assistant/user/credits', {}
+
+            started = time.perf_counter()
+            error = None
+            try:
+                result = client.call(method, path, params)
+                if isinstance(result, dict) and result.get('error'):
+                    error = result.get('message') or 'error'
+            except Exception as e:
+                error = str(e)
+            self.harness.record(action, time.perf_counter() - started, error)
+
+            if args.think_time:
+                time.sleep(random.uniform(0, 2 * args.think_time))
+
+
+class LoadTest:
+
+    def __init__(self, env, args):
+        self.env = env
+        self.cr = env.cr
+        self.args = args
+        self.stopping = threading.Event()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.activity = []
+        self.low_balance_ids = []
+        self._lock = threading.Lock()
+
+    def record(self, action, elapsed, error=None):
+        with self._lock:
+            if error:
+                self.errors[action][error[:120]] += 1
+            else:
+                self.samples[action].append(elapsed)
+
+    def ledger_snapshot(self, user_ids):
+        self.cr.execute("""
+            SELECT
+                uc.id,
+                uc.used_credits,
+                uc.remaining_credits,
+                uc.total_credits,
+                COALESCE((SELECT SUM(-t.amount) FROM ai_credit_transaction t
+                          WHERE t.user_credit_id = uc.id AND t.amount < 0), 0) AS debited,
+                COALESCE((SELECT SUM(-t.amount) FROM ai_credit_transaction t
+                          WHERE t.user_credit_id = uc.id AND t.transaction_type = 'usage'), 0) AS usage_debited,
+                -- Credit cost of the replies in the user's conversations, counted from the
+                -- messages themselves so that a reply saved without a debit shows up
+                COALESCE((SELECT SUM(m.credit_cost) FROM ai_message m
+                          JOIN ai_conversation c ON c.id = m.conversation_id
+                          WHERE c.user_id = uc.user_id AND m.role = 'assistant'), 0) AS charged
+            FROM ai_user_credit uc
+            WHERE uc.user_id IN %s
+        """, (tuple(user_ids),))
+        return {row['id']: row for row in self.cr.dictfetchall()}
+
+    def check_ledger(self, before, after):
+        """Each account's balance must move exactly as much as its transaction rows say
+
+        Replies must actually be charged: the run has to debit something,
+        and each account's usage rows must add up to the credit cost of the
+        replies stored for it during the run.
+        """
+        problems = []
+        debited_total = 0.0
+        for credit_id, row in after.items():
+            previous = before.get(credit_id)
+            if abs(row['total_credits'] - row['used_credits'] - row['remaining_credits']) > 1e-6:
+                problems.append({'credit_id': credit_id, 'issue': 'remaining != total - used'})
+            if previous is None:
+                continue
+            used = row['used_credits'] - previous['used_credits']
+            debited = row['debited'] - previous['debited']
+            debited_total += debited
+            if abs(used - debited) > 1e-6:
+                problems.append({
+                    'credit_id': credit_id,
+                    'issue': 'used credits do not match transactions',
+                    'used_delta': round(used, 6),
+                    'transaction_delta': round(debited, 6),
+                })
+            charged = row['charged'] - previous['charged']
+            usage_debited = row['usage_debited'] - previous['usage_debited']
+            if abs(charged - usage_debited) > 1e-6:
+                problems.append({
+                    'credit_id': credit_id,
+                    'issue': 'reply credit cost does not match usage transactions',
+                    'reply_cost': round(charged, 6),
+                    'transaction_delta': round(usage_debited, 6),
+                })
+            if row['remaining_credits'] < -1e-6:
+                problems.append({'credit_id': credit_id, 'issue': 'negative balance'})
+        if self.samples['send_message'] and debited_total <= 1e-6:
+            problems.append({'issue': 'messages were answered but no credits were debited'})
+        return {
+            'accounts': len(after),
+            'low_balance_accounts': len(self.low_balance_ids),
+            'debited_total': round(debited_total, 6),
+            'consistent': not problems,
+            'problems': problems,
+        }
+
+    def sample_activity(self):
+        """Busy database connections, as a proxy for how many Odoo workers are occupied"""
+        registry = self.env.registry
+        while not self.stopping.wait(1.0):
+            with registry.cursor() as cr:
+                cr.execute("""
+                    SELECT
+                        COUNT(*) FILTER (WHERE state = 'active'),
+                        COUNT(*) FILTER (WHERE wait_event_type = 'Lock')
+                    FROM pg_stat_activity
+                    WHERE datname = current_database() AND pid <> pg_backend_pid()
+                """)
+                active, waiting = cr.fetchone()
+            self.activity.append((active, waiting))
+
+    def drain_accounts(self, users):
+        """Leave a few credits on a share of the accounts, so debits race for the last of a balance"""
+        # At most half: each of these accounts also takes over the chatter of another user
+        count = min(int(len(users) * self.args.low_balance_share), len(users) // 2)
+        if not count:
+            return
+        self.low_balance_ids = users[:count].ids
+        self.cr.execute("""
+            UPDATE ai_user_credit
+            SET total_credits = used_credits + %(credits)s, remaining_credits = %(credits)s
+            WHERE user_id IN %(users)s
+        """, {'credits': self.args.low_balance, 'users': tuple(self.low_balance_ids)})
+
+    def refill_accounts(self):
+        """Large balances again, as benchmark.py seeds them"""
+        if not self.low_balance_ids:
+            return
+        self.cr.execute("""
+            UPDATE ai_user_credit
+            SET total_credits = 1e9, remaining_credits = 1e9 - used_credits
+            WHERE user_id IN %s
+        """, (tuple(self.low_balance_ids),))
+
+    def run(self, users, stub):
+        args = self.args
+        self.drain_accounts(users)
+        before = self.ledger_snapshot(users.ids)
+        self.cr.commit()
+
+        sampler = threading.Thread(target=self.sample_activity, daemon=True)
+        sampler.start()
+        threads = []
+        started = time.perf_counter()
+        logins = [users[i % len(users)].login for i in range(args.concurrency)]
+        # Two chatters on each low-balance account, so concurrent debits compete for its last credits
+        low_logins = [user.login for user in users if user.id in self.low_balance_ids]
+        if low_logins and len(logins) >= 2 * len(low_logins):
+            logins[-len(low_logins):] = low_logins
+        for login in logins:
+            thread = SimulatedUser(self, login)
+            thread.start()
+            threads.append(thread)
+            if args.ramp_up:
+                time.sleep(args.ramp_up / args.concurrency)
+
+        time.sleep(max(0.0, args.duration - (time.perf_counter() - started)))
+        self.stopping.set()
+        for thread in threads:
+            thread.join(timeout=args.read_timeout)
+        elapsed = time.perf_counter() - started
+        sampler.join(timeout=5)
+
+        self.cr.rollback()
+        after = self.ledger_snapshot(users.ids)
+        ledger = self.check_ledger(before, after)
+        self.refill_accounts()
+        self.cr.commit()
+        return self.report(elapsed, stub, ledger)
+
+    def report(self, elapsed, stub, ledger):
+        completed = sum(len(samples) for samples in self.samples.values())
+        failed = sum(sum(errors.values()) for errors in self.errors.values())
+        latencies = {
+            action: dict(summarize(samples), errors=sum(self.errors[action].values()))
+            for action, samples in self.samples.items()
+        }
+        busy = [active for active, _waiting in self.activity]
+        waiting = [waiting for _active, waiting in self.activity]
+        return {
+            'meta': {
+                'date': datetime.utcnow().isoformat(),
+                'database': self.cr.dbname,
+                'server_url': self.args.server_url,
+                'concurrency': self.args.concurrency,
+                'duration_s': round(elapsed, 1),
+                'think_time_s': self.args.think_time,
+                'provider': {
+                    'latency_s': self.args.latency,
+                    'error_rate': self.args.error_rate,
+                    'payload_size': self.args.payload_size,
+                },
+            },
+            'throughput': {
+                'requests': completed + failed,
+                'completed': completed,
+                'failed': failed,
+                'requests_per_s': round((completed + failed) / elapsed, 2),
+                'messages_per_s': round(len(self.samples['send_message']) / elapsed, 2),
+            },
+            'latency': latencies,
+            'errors': {action: dict(errors) for action, errors in self.errors.items()},
+            'saturation': {
+                'db_active_max': max(busy, default=0),
+                'db_active_mean': round(sum(busy) / len(busy), 1) if busy else 0,
+                'db_lock_waits_max': max(waiting, default=0),
+                'provider': stub.stats(),
+            },
+            'ledger': ledger,
+        }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='AI Assistant load test')
+    parser.add_argument('-c', '--config', help='Odoo configuration file')
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--server-url', required=True)
+    parser.add_argument('--password', default='bench')
+    parser.add_argument('--concurrency', type=int, default=20, help='Simulated users')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run')
+    parser.add_argument('--ramp-up', type=float, default=10, help='Seconds to start all users')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Mean pause between actions')
+    parser.add_argument('--read-timeout', type=float, default=60)
+    parser.add_argument('--latency', type=float, default=1.0, help='Stub provider latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of provider calls failing with 503')
+    parser.add_argument('--payload-size', type=int, default=0, help='Minimum reply size in characters')
+    parser.add_argument('--low-balance-share', type=float, default=0.25,
+                        help='Fraction of the users starting with a low balance')
+    parser.add_argument('--low-balance', type=float, default=2.0, help='Credits left on those accounts')
+    parser.add_argument('--output', default='ai_assistant_loadtest.json')
+    args = parser.parse_args()
+
+    import odoo
+    from odoo import api, SUPERUSER_ID
+
+    odoo.tools.config.parse_config(['-c', args.config] if args.config else [])
+    registry = odoo.registry(args.database)
+
+    # Benchmark seeding defaults, with one account per simulated user
+    seed_args = argparse.Namespace(
+        users=args.concurrency, conversations=args.concurrency, messages_per_conversation=2,
+        transactions=args.concurrency, days=30, reseed=False, password=args.password,
+    )
+
+    with StubProvider(latency=args.latency, error_rate=args.error_rate,
+                      payload_size=args.payload_size) as stub, registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        users = Benchmark(env, seed_args).seed()
+
+        get_param = env['ir.config_parameter'].sudo().get_param
+        set_param = env['ir.config_parameter'].sudo().set_param
+        previous_url = get_param('ai_assistant.provider_url')
+        set_param('ai_assistant.provider_url', stub.url)
+        cr.commit()
+        try:
+            report = LoadTest(env, args).run(users, stub)
+        finally:
+            cr.rollback()
+            set_param('ai_assistant.provider_url', previous_url or False)
+            cr.commit()
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Load test report written to {os.path.abspath(args.output)}")
+    print(json.dumps(report['throughput']), json.dumps({'ledger_consistent': report['ledger']['consistent']}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+# metrics.py
+#
+# Counters and histograms for the AI pipeline, exposed in the Prometheus
+# text format. Each thread increments its own dict, so recording a sample
+# takes no lock; a background thread publishes the process's totals to the
+# database every few seconds, where the metrics route sums all workers.
+
+import functools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+import odoo
+
+from .request_trace import start_trace, end_trace
+
+_logger = logging.getLogger(__name__)
+
+# Seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name: (type, help, buckets)
+METRICS = {
+    'ai_provider_request_duration_seconds': (
+        'histogram', 'Duration of calls to the AI provider, retries included', LATENCY_BUCKETS),
+    'ai_send_message_duration_seconds': (
+        'histogram', 'Time to answer a chat message, from the user message to the stored reply', LATENCY_BUCKETS),
+    'ai_route_duration_seconds': (
+        'histogram', 'Time spent in AI Assistant controller routes', LATENCY_BUCKETS),
+    'ai_route_db_duration_seconds': (
+        'histogram', 'Time spent in SQL queries by AI Assistant controller routes', LATENCY_BUCKETS),
+    'ai_route_phase_duration_seconds': (
+        'histogram', 'Time spent in each phase of AI Assistant controller routes', LATENCY_BUCKETS),
+    'ai_rate_limit_rejections_total': (
+        'counter', 'Messages rejected by the rate limiter', None),
+    'ai_credit_rejections_total': (
+        'counter', 'Messages rejected for insufficient credits', None),
+    'ai_tokens_consumed_total': (
+        'counter', 'Tokens sent to and received from the AI provider', None),
+    'ai_credits_consumed_total': (
+        'counter', 'Credits debited from user accounts', None),
+    'ai_provider_failovers_total': (
+        'counter', 'Provider calls retried on a backup configuration after a failure', None),
+    'ai_circuit_opened_total': (
+        'counter', 'Times a provider circuit breaker opened', None),
+    'ai_provider_hedged_requests_total': (
+        'counter', 'Provider calls hedged on a backup after running past the p95, by winner', None),
+}
+
+# Seconds between two publications of this process's totals
+PUBLISH_INTERVAL = 15
+
+_local = threading.local()
+# (thread, samples) of each thread that recorded something, and the totals of finished threads
+_shards = []
+_retired = {}
+_shards_lock = threading.Lock()
+_databases = set()
+_publisher_pid = None
+_worker_id = None
+# (name, labels) -> sample keys, built once per series
+_series = {}
+
+
+def inc(name, value=1, **labels):
+    """Add ``value`` to a counter"""
+    shard = _shard()
+    key = _series.get((name, tuple(sorted(labels.items()))))
+    if key is None:
+        key = _series[(name, tuple(sorted(labels.items())))] = _format(name, labels)
+    shard[key] = shard.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram"""
+    shard = _shard()
+    keys = _series.get((name, tuple(sorted(labels.items()))))
+    if keys is None:
+        keys = _series[(name, tuple(sorted(labels.items())))] = _histogram_keys(name, labels)
+    buckets, sum_key, count_key = keys
+    # Buckets are stored cumulative, so totals of several workers simply add up; empty ones are kept
+    for bound, key in buckets:
+        shard[key] = shard.get(key, 0) + (value <= bound)
+    shard[sum_key] = shard.get(sum_key, 0) + value
+    shard[count_key] = shard.get(count_key, 0) + 1
+
+
+class timer:
+    """Context manager observing its duration in a histogram, with an ``outcome`` label"""
+
+    __slots__ = ('name', 'labels', 'started')
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        outcome = 'error' if exc_type is not None and issubclass(exc_type, Exception) else 'ok'
+        observe(self.name, time.perf_counter() - self.started, outcome=outcome, **self.labels)
+        return False
+
+
+def observe_route(route):
+    """Decorator for controller methods: wall time, SQL time and phase times of each call
+
+    Goes below ``@http.route``. SQL time comes from the counters Odoo keeps
+    on the request thread; phases from the request trace the call runs in.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            thread = threading.current_thread()
+            db_started = getattr(thread, 'query_time', 0.0)
+            trace = start_trace(route)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                end_trace(trace)
+                observe('ai_route_duration_seconds', trace.elapsed(), route=route)
+                observe('ai_route_db_duration_seconds', getattr(thread, 'query_time', 0.0) - db_started, route=route)
+                for name, seconds in trace.phases.items():
+                    observe('ai_route_phase_duration_seconds', seconds, route=route, phase=name)
+        return wrapper
+    return decorator
+
+
+def collect():
+    """This process's totals: {sample key: value}"""
+    with _shards_lock:
+        totals = dict(_retired)
+        for thread, shard in list(_shards):
+            # dict.copy is atomic under the GIL, even while the owning thread writes
+            for key, value in shard.copy().items():
+                totals[key] = totals.get(key, 0) + value
+            if not thread.is_alive():
+                # Threads of the threaded server live for one request: fold them in once done
+                _shards.remove((thread, shard))
+                for key, value in shard.items():
+                    _retired[key] = _retired.get(key, 0) + value
+    return totals
+
+
+def watch(dbname):
+    """Publish this process's totals to ``dbname`` (a database with the module installed)"""
+    _databases.add(dbname)
+
+
+def render(samples, extra=()):
+    """Prometheus text exposition of summed samples
+
+    ``extra`` holds additional ``(name, type, help, value)`` single-value metrics.
+    """
+    families = {name: [] for name in METRICS}
+    for key, value in samples.items():
+        sample = key.split('{', 1)[0]
+        family = sample if sample in families else sample.rsplit('_', 1)[0]
+        if family in families:
+            families[family].append((key, value))
+
+    lines = []
+    for name, (metric_type, help_text, _buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for key, value in sorted(families[name], key=lambda item: _sort_key(item[0])):
+            lines.append(f"{key} {_format_value(value)}")
+    for name, metric_type, help_text, value in extra:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard))
+        _ensure_publisher()
+    return shard
+
+
+def _format(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in sorted(labels.items())) + '}'
+
+
+def _histogram_keys(name, labels):
+    buckets = METRICS[name][2]
+    base = ''.join(f'{label}="{_escape(value)}",' for label, value in sorted(labels.items()))
+    keys = [(bound, f'{name}_bucket{{{base}le="{bound!r}"}}') for bound in buckets]
+    keys.append((float('inf'), f'{name}_bucket{{{base}le="+Inf"}}'))
+    return keys, _format(f'{name}_sum', labels), _format(f'{name}_count', labels)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sort_key(key):
+    # Buckets in numeric order of their bound
+    head, found, bound = key.partition('le="')
+    return (head, float(bound.split('"', 1)[0]) if found else 0.0)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _ensure_publisher():
+    global _publisher_pid
+    if _publisher_pid == os.getpid():
+        return
+    with _shards_lock:
+        if _publisher_pid == os.getpid():
+            return
+        _publisher_pid = os.getpid()
+        threading.Thread(target=_publish_loop, name='ai_assistant.metrics', daemon=True).start()
+
+
+def _publish_loop():
+    while True:
+        time.sleep(PUBLISH_INTERVAL)
+        samples = collect()
+        if not samples:
+            continue
+        for dbname in list(_databases):
+            try:
+                with odoo.sql_db.db_connect(dbname).cursor() as cr:
+                    publish(cr, samples)
+            except Exception as e:
+                _logger.warning(f"Error publishing AI metrics to {dbname}: {str(e)}")
+
+
+def publish(cr, samples):
+    """Store this process's totals in the shared table"""
+    cr.execute("""
+        INSERT INTO ai_metrics_worker (worker, samples, updated_at)
+        VALUES (%s, %s, now() at time zone 'UTC')
+        ON CONFLICT (worker) DO UPDATE SET samples = EXCLUDED.samples, updated_at = EXCLUDED.updated_at
+    """, (_worker_id, json.dumps(samples)))
+
+
+def _reset():
+    """Start from scratch in a forked worker: the parent's samples are its own"""
+    global _local, _shards, _retired, _shards_lock, _publisher_pid, _worker_id
+    _local = threading.local()
+    _shards = []
+    _retired = {}
+    _shards_lock = threading.Lock()
+    _publisher_pid = None
+    _worker_id = f"{socket.gethostname()}:{os.getpid()}:{int(time.time())}"
+
+
+_reset()
+os.register_at_fork(after_in_child=_reset)
@@ -0,0 +1,198 @@
+# provider_client.py
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER_URL = "https://bot.chatwhisperer.ai/api/1.1/wf/chat"
+
+# Statuses where the provider tells us it did not process the request
+RETRY_STATUSES = (429, 502, 503)
+
+
+class ProviderError(Exception):
+    """Raised when the provider cannot be reached or returns an error"""
+
+
+class ProviderClient:
+    """Keep-alive HTTP client for the ChatWhisperer gateway, one per worker process"""
+
+    def __init__(self, url=DEFAULT_PROVIDER_URL, pool_size=10, connect_timeout=3.05,
+                 read_timeout=15.0, max_retries=2, backoff_factor=0.3, backoff_max=5.0):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        # Retries are handled in _post so that backoff can be jittered
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def post_chat(self, payload):
+        """Send a chat payload and return the decoded JSON body"""
+        with metrics.timer('ai_provider_request_duration_seconds', operation='chat'):
+            response = self._post(payload)
+            try:
+                return response.json()
+            except ValueError as e:
+                raise ProviderError(f"Invalid JSON from provider: {str(e)}")
+
+    def stream_chat(self, payload):
+        """Yield reply text fragments as the provider produces them
+
+        Server-sent events are relayed fragment by fragment; a provider that
+        answers with a plain JSON body is yielded as a single fragment.
+        """
+        # Timed until the last fragment: the stream is one provider call
+        with metrics.timer('ai_provider_request_duration_seconds', operation='stream'):
+            response = self._post(dict(payload, stream=True), stream=True,
+                                  headers={'Accept': 'text/event-stream'})
+            with response:
+                if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                    try:
+                        data = response.json()
+                    except ValueError as e:
+                        raise ProviderError(f"Invalid JSON from provider: {str(e)}")
+                    yield data.get("response", {}).get("text", "")
+                    return
+
+                try:
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith('data:'):
+                            continue
+                        data = line[5:].strip()
+                        if data == '[DONE]':
+                            break
+                        yield _parse_event_text(data)
+                except requests.exceptions.RequestException as e:
+                    raise ProviderError(f"Provider stream interrupted: {str(e)}")
+
+    def probe(self):
+        """Round trip of a HEAD request to the provider, in seconds; nothing is generated or billed"""
+        started = time.perf_counter()
+        try:
+            response = self.session.head(self.url, timeout=self.timeout, allow_redirects=False)
+        except requests.exceptions.RequestException as e:
+            raise ProviderError(f"Could not reach provider: {str(e)}")
+        response.close()
+        # Any answer below 500 means the gateway is up, even if it only accepts POST
+        if response.status_code >= 500:
+            raise ProviderError(f"Provider answered {response.status_code}")
+        return time.perf_counter() - started
+
+    def _post(self, payload, **kwargs):
+        """POST with retry on failures where the provider never handled the request"""
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout, **kwargs)
+            except requests.exceptions.ReadTimeout as e:
+                # The request reached the provider; replaying it could answer (and bill) twice
+                raise ProviderError(f"Provider timed out after {self.read_timeout}s: {str(e)}")
+            except requests.exceptions.ConnectionError as e:
+                # Connect failures and stale keep-alive sockets are safe to replay
+                if attempt >= self.max_retries:
+                    raise ProviderError(f"Could not connect to provider: {str(e)}")
+                self._sleep(attempt)
+                attempt += 1
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+                self._sleep(attempt, retry_after)
+                attempt += 1
+                continue
+
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                raise ProviderError(str(e))
+            return response
+
+    def _sleep(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_max))
+        _logger.debug(f"Retrying provider call in {delay:.2f}s (attempt {attempt + 1})")
+        time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+def _parse_event_text(data):
+    """Extract the text delta from one server-sent event payload"""
+    try:
+        event = json.loads(data)
+    except ValueError:
+        return data
+    if isinstance(event, dict):
+        return event.get('text') or event.get('delta') or event.get('response', {}).get('text', '')
+    return str(event)
+
+
+# Clients are per process: pooled sockets must not be shared across a fork
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def get_client_settings(env):
+    """Read the client settings from the cached module parameters"""
+    get_param = env['ai.assistant.config'].get_config_snapshot().get_param
+    return {
+        'url': get_param('ai_assistant.provider_url', DEFAULT_PROVIDER_URL),
+        'pool_size': int(get_param('ai_assistant.provider_pool_size', '10')),
+        'connect_timeout': float(get_param('ai_assistant.provider_connect_timeout', '3.05')),
+        'read_timeout': float(get_param('ai_assistant.provider_read_timeout', '15')),
+        'max_retries': int(get_param('ai_assistant.provider_max_retries', '2')),
+    }
+
+
+def get_provider_client(env=None, **settings):
+    """Return the shared client for this worker, building it on first use"""
+    global _clients_pid
+
+    if env is not None:
+        settings = dict(get_client_settings(env), **settings)
+    key = tuple(sorted(settings.items()))
+
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+
+        client = _clients.get(key)
+        if client is None:
+            client = ProviderClient(**settings)
+            _clients[key] = client
+        return client
+
+
+def reset_clients():
+    """Drop all pooled clients, e.g. after the provider settings change"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,363 @@
+# provider_router.py
+#
+# Routes provider calls across the active configuration and its backups.
+# Every target has a circuit breaker fed by the outcome and duration of its
+# calls: once too many fail or run slow, the target is skipped for a while
+# and then tried again with a few half-open probe calls. Calls go to the
+# primary when its circuit allows, otherwise to the backups in weighted
+# random order, and can be hedged on a backup when the primary runs past
+# its recent p95. Breakers are per worker process, like the HTTP clients.
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from . import metrics
+from .provider_client import DEFAULT_PROVIDER_URL, ProviderError, get_provider_client
+
+_logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Successful call durations kept per target for the p95
+LATENCY_SAMPLES = 200
+# Default number of hedged calls (primary and backup alike) in flight per process
+DEFAULT_HEDGE_MAX_CALLS = 32
+# Below this many samples the p95 is not trusted and calls are not hedged
+MIN_HEDGE_SAMPLES = 20
+
+Target = namedtuple('Target', ['key', 'name', 'chatbot_id', 'url', 'weight', 'primary'])
+
+
+class CircuitBreaker:
+    """Failure-rate and slow-call-rate breaker over the last ``window`` calls"""
+
+    def __init__(self, window=20, min_calls=10, failure_rate=0.5, slow_call_seconds=8.0,
+                 slow_call_rate=0.5, open_seconds=30.0, half_open_calls=1):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.opened_at = None
+        self.half_opened_at = None
+        self._calls = deque(maxlen=window)
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Whether a call could go to this target now, without taking a probe slot"""
+        with self._lock:
+            self._refresh()
+            return self.state == CLOSED or (self.state == HALF_OPEN and self._probes < self.half_open_calls)
+
+    def allow(self):
+        """Whether a call may go to this target now; in half-open, takes one probe slot"""
+        with self._lock:
+            self._refresh()
+            if self.state == OPEN:
+                return False
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self.half_opened_at = now
+            self._probes = self._probe_successes = 0
+        elif self.state == HALF_OPEN and now - self.half_opened_at >= self.open_seconds:
+            # Probes that never reported back (e.g. a killed request) free their slots
+            self.half_opened_at = now
+            self._probes = self._probe_successes = 0
+
+    def record(self, ok, duration):
+        """Feed the outcome of a call; returns the new state if it changed"""
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            previous = self.state
+            if ok:
+                self._latencies.append(duration)
+            if self.state == HALF_OPEN:
+                if not ok or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self.state = CLOSED
+                        self._calls.clear()
+            elif self.state == CLOSED:
+                if self._calls.maxlen != self.window:
+                    self._calls = deque(self._calls, maxlen=self.window)
+                self._calls.append((ok, slow))
+                if len(self._calls) >= self.min_calls:
+                    failures = sum(1 for call_ok, _slow in self._calls if not call_ok)
+                    slow_calls = sum(1 for _ok, call_slow in self._calls if call_slow)
+                    if (failures >= self.failure_rate * len(self._calls)
+                            or slow_calls >= self.slow_call_rate * len(self._calls)):
+                        self._open()
+            return self.state if self.state != previous else None
+
+    def p95(self):
+        """95th percentile of recent successful call durations, None without enough samples"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._calls.clear()
+
+    def info(self):
+        with self._lock:
+            return {'state': self.state, 'calls': len(self._calls)}
+
+
+# Breakers by target key, and the pool running hedged calls with its free slots, per process
+_breakers = {}
+_breakers_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_executor_slots = None
+_executor_size = None
+
+
+def get_breaker(key, **settings):
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(**settings)
+        else:
+            for name, value in settings.items():
+                setattr(breaker, name, value)
+        return breaker
+
+
+def circuit_states():
+    """State of every breaker of this process, by target key"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {key: breaker.info() for key, breaker in breakers.items()}
+
+
+def _get_executor(max_calls):
+    """The hedging pool of this process and a semaphore of its free threads"""
+    global _executor, _executor_pid, _executor_slots, _executor_size
+    with _breakers_lock:
+        if _executor_pid != os.getpid() or _executor_size != max_calls:
+            if _executor_pid == os.getpid():
+                # Resized: calls in flight finish on the old pool and release the old semaphore
+                _executor.shutdown(wait=False)
+            # Pool threads do not survive a fork
+            _executor = ThreadPoolExecutor(max_workers=max_calls, thread_name_prefix='ai_hedge')
+            _executor_slots = threading.BoundedSemaphore(max_calls)
+            _executor_size = max_calls
+            _executor_pid = os.getpid()
+        return _executor, _executor_slots
+
+
+class ProviderRouter:
+    """Drop-in for ProviderClient.post_chat / stream_chat over several configurations"""
+
+    def __init__(self, env, targets, hedge=False, hedge_min_delay=1.0, max_attempts=3, breaker_settings=None,
+                 hedge_max_calls=DEFAULT_HEDGE_MAX_CALLS):
+        self.targets = targets
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_calls = max(hedge_max_calls, 1)
+        self.max_attempts = max_attempts
+        self.breaker_settings = breaker_settings or {}
+        # Clients are resolved up front: the hedging threads must not touch the environment
+        self.clients = {target.key: get_provider_client(env, url=target.url) for target in targets}
+
+    def post_chat(self, payload):
+        """Send the payload to the first target that answers; ProviderError when none does"""
+        candidates = self._candidates()
+        if not candidates:
+            raise ProviderError("All AI providers are unavailable (circuits open)")
+
+        errors = []
+        while candidates and len(errors) < self.max_attempts:
+            target = candidates.pop(0)
+            try:
+                if self.hedge and candidates:
+                    return self._hedged_call(target, candidates, payload)
+                return self._call(target, payload)
+            except ProviderError as e:
+                errors.append(f"{target.name}: {str(e)}")
+                if candidates:
+                    metrics.inc('ai_provider_failovers_total', source=target.name, target=candidates[0].name)
+                    _logger.warning(f"AI provider {target.name} failed, failing over to {candidates[0].name}: {str(e)}")
+        raise ProviderError('; '.join(errors))
+
+    def stream_chat(self, payload):
+        """Stream from the first target that starts answering; no failover once text has been sent"""
+        candidates = self._candidates()
+        if not candidates:
+            raise ProviderError("All AI providers are unavailable (circuits open)")
+
+        errors = []
+        while candidates and len(errors) < self.max_attempts:
+            target = candidates.pop(0)
+            breaker = self._breaker(target)
+            if not breaker.allow():
+                errors.append(f"{target.name}: Circuit open")
+                continue
+            started = time.perf_counter()
+            streamed = False
+            try:
+                for chunk in self.clients[target.key].stream_chat(self._payload(target, payload)):
+                    streamed = True
+                    yield chunk
+            except ProviderError as e:
+                self._record(target, breaker, False, time.perf_counter() - started)
+                if streamed:
+                    raise
+                errors.append(f"{target.name}: {str(e)}")
+                if candidates:
+                    metrics.inc('ai_provider_failovers_total', source=target.name, target=candidates[0].name)
+                continue
+            self._record(target, breaker, True, time.perf_counter() - started)
+            return
+        raise ProviderError('; '.join(errors))
+
+    def _candidates(self):
+        """Targets whose circuit lets a call through: the primary first, then backups by weighted draw"""
+        primary = [target for target in self.targets if target.primary]
+        backups = [target for target in self.targets if not target.primary]
+        ordered = primary + _weighted_order(backups)
+        return [target for target in ordered if self._breaker(target).available()]
+
+    def _breaker(self, target):
+        return get_breaker(target.key, **self.breaker_settings)
+
+    def _payload(self, target, payload):
+        return dict(payload, chatbotId=target.chatbot_id)
+
+    def _call(self, target, payload):
+        breaker = self._breaker(target)
+        if not breaker.allow():
+            raise ProviderError("Circuit open")
+        started = time.perf_counter()
+        try:
+            data = self.clients[target.key].post_chat(self._payload(target, payload))
+        except ProviderError:
+            self._record(target, breaker, False, time.perf_counter() - started)
+            raise
+        self._record(target, breaker, True, time.perf_counter() - started)
+        return data
+
+    def _record(self, target, breaker, ok, duration):
+        state = breaker.record(ok, duration)
+        if state == OPEN:
+            metrics.inc('ai_circuit_opened_total', target=target.name)
+            _logger.warning(f"AI provider circuit for {target.name} opened")
+        elif state == CLOSED:
+            _logger.info(f"AI provider circuit for {target.name} closed")
+
+    def _hedged_call(self, target, candidates, payload):
+        """Call ``target``; past its p95, also call the next candidate and keep the first answer"""
+        p95 = self._breaker(target).p95()
+        if p95 is None:
+            return self._call(target, payload)
+
+        primary = self._submit(target, payload)
+        if primary is None:
+            # Every pool thread is busy: call unhedged rather than queue behind other calls
+            return self._call(target, payload)
+        done, _pending = wait([primary], timeout=max(p95, self.hedge_min_delay))
+        if done:
+            return primary.result()
+
+        backup_target = candidates[0]
+        if not self._breaker(backup_target).available():
+            return primary.result()
+        backup = self._submit(backup_target, payload)
+        if backup is None:
+            return primary.result()
+        candidates.pop(0)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except ProviderError as e:
+                    error = e
+                    continue
+                metrics.inc('ai_provider_hedged_requests_total', winner='backup' if future is backup else 'primary')
+                # The slower call runs to completion in the pool; its outcome still feeds its breaker
+                return result
+        raise error
+
+    def _submit(self, target, payload):
+        """Start ``_call`` in the hedging pool; None if no thread is free"""
+        executor, slots = _get_executor(self.hedge_max_calls)
+        if not slots.acquire(blocking=False):
+            return None
+
+        def call():
+            try:
+                return self._call(target, payload)
+            finally:
+                slots.release()
+        try:
+            return executor.submit(call)
+        except RuntimeError:
+            # The pool was just resized and shut down
+            slots.release()
+            return None
+
+
+def _weighted_order(targets):
+    """Targets in random order, heavier weights tending to come first"""
+    # Efraimidis-Spirakis: sort by u ** (1 / weight)
+    return sorted(targets, key=lambda target: random.random() ** (1.0 / max(target.weight, 1)), reverse=True)
+
+
+def get_provider_router(env, hedge=None):
+    """Router over the active configuration and the backups of the cached snapshot"""
+    snapshot = env['ai.assistant.config'].get_config_snapshot()
+    get_param = snapshot.get_param
+    default_url = get_param('ai_assistant.provider_url', DEFAULT_PROVIDER_URL)
+    targets = [
+        Target(f"{route['id']}:{route['chatbot_id']}@{route['url'] or default_url}", route['name'],
+               route['chatbot_id'], route['url'] or default_url, route['weight'], route['primary'])
+        for route in snapshot.routes
+    ]
+    if hedge is None:
+        hedge = get_param('ai_assistant.hedge_requests', 'False') == 'True'
+    return ProviderRouter(
+        env, targets,
+        hedge=hedge,
+        hedge_min_delay=float(get_param('ai_assistant.hedge_min_delay', '1.0')),
+        hedge_max_calls=int(get_param('ai_assistant.hedge_max_calls', str(DEFAULT_HEDGE_MAX_CALLS))),
+        max_attempts=int(get_param('ai_assistant.failover_max_attempts', '3')),
+        breaker_settings={
+            'window': int(get_param('ai_assistant.breaker_window', '20')),
+            'min_calls': int(get_param('ai_assistant.breaker_min_calls', '10')),
+            'failure_rate': float(get_param('ai_assistant.breaker_failure_rate', '0.5')),
+            'slow_call_seconds': float(get_param('ai_assistant.breaker_slow_call_seconds', '8')),
+            'slow_call_rate': float(get_param('ai_assistant.breaker_slow_call_rate', '0.5')),
+            'open_seconds': float(get_param('ai_assistant.breaker_open_seconds', '30')),
+            'half_open_calls': int(get_param('ai_assistant.breaker_half_open_calls', '1')),
+        },
+    )
@@ -0,0 +1,159 @@
+# provider_stub.py
+#
+# Minimal stand-in for the ChatWhisperer chat endpoint. Point
+# ai_assistant.provider_url at it to run without network access:
+#
+#   python -m odoo.addons.ai_assistant.tools.provider_stub --port 8899 --latency 0.5
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            payload = {}
+
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            self._reply(payload)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _reply(self, payload):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            with self.server.lock:
+                self.server.error_count += 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        text = f"Stub reply to: {payload.get('message', '')}"
+        if len(text) < self.server.payload_size:
+            text += ' ' + 'lorem ' * ((self.server.payload_size - len(text)) // 6)
+        if payload.get('stream'):
+            self._stream_reply(text)
+            return
+
+        body = json.dumps({
+            'response': {
+                'text': text,
+            }
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_reply(self, text):
+        """Send the reply word by word as server-sent events"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+            fragment = word if i == len(words) - 1 else word + ' '
+            self._write_chunk(f"data: {json.dumps({'text': fragment})}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data):
+        data = data.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubProvider:
+    """Run the stub in a background thread; usable as a context manager"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, token_delay=0.0, error_rate=0.0, payload_size=0):
+        self.server = ThreadingHTTPServer((host, port), StubProviderHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.token_delay = token_delay
+        self.server.error_rate = error_rate
+        self.server.payload_size = payload_size
+        self.server.lock = threading.Lock()
+        self.server.request_count = 0
+        self.server.error_count = 0
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/1.1/wf/chat"
+
+    @property
+    def request_count(self):
+        return self.server.request_count
+
+    def stats(self):
+        with self.server.lock:
+            return {
+                'requests': self.server.request_count,
+                'errors': self.server.error_count,
+                'max_in_flight': self.server.max_in_flight,
+            }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local ChatWhisperer stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before replying')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Seconds between streamed tokens')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--payload-size', type=int, default=0, help='Pad replies to at least this many characters')
+    args = parser.parse_args()
+
+    stub = StubProvider(args.host, args.port, args.latency, args.token_delay, args.error_rate, args.payload_size)
+    print(f"Stub provider listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# report_export.py
+#
+# Writers for the business report. Sections are (title, header, rows)
+# with ``rows`` any iterable, consumed once: rows are written as they are
+# produced so memory does not grow with the report period.
+
+import csv
+import io
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+REPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+# Bytes buffered before a CSV chunk is handed to the response
+CSV_FLUSH_SIZE = 64 * 1024
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv(sections):
+    """Yield the report as CSV byte chunks, one block per section"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for title, header, rows in sections:
+        writer.writerow([title])
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= CSV_FLUSH_SIZE:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        writer.writerow([])
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def csv_error_marker(message):
+    """Trailing CSV rows flagging a report cut short by an error"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([[], ['ERROR', message]])
+    return buffer.getvalue().encode()
+
+
+def write_xlsx(sections, fileobj):
+    """Write the report to ``fileobj`` as a workbook with one sheet per section
+
+    constant_memory mode flushes each row to a temporary file as soon as
+    the next one starts, instead of keeping the sheets in memory.
+    """
+    if xlsxwriter is None:
+        raise RuntimeError("XLSX export needs the xlsxwriter package")
+    workbook = xlsxwriter.Workbook(fileobj, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'remove_timezone': True,
+    })
+    bold = workbook.add_format({'bold': True})
+    for title, header, rows in sections:
+        sheet = workbook.add_worksheet(title[:31])
+        sheet.write_row(0, 0, header, bold)
+        for row_index, row in enumerate(rows, 1):
+            sheet.write_row(row_index, 0, row)
+    workbook.close()
+
+
+def write_report(sections, file_format, fileobj):
+    """Write the report to a binary file object in ``file_format``"""
+    if file_format == 'csv':
+        for chunk in iter_csv(sections):
+            fileobj.write(chunk)
+    elif file_format == 'xlsx':
+        write_xlsx(sections, fileobj)
+    else:
+        raise ValueError(f"Unsupported report format: {file_format}")
+
+
+def iter_file(fileobj, chunk_size=FILE_CHUNK_SIZE):
+    """Yield a file's content in chunks from the start"""
+    fileobj.seek(0)
+    return iter(lambda: fileobj.read(chunk_size), b'')
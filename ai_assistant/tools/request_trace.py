@@ -0,0 +1,70 @@
+# request_trace.py
+#
+# Per-request phase timings. A route opens a trace on its thread; code
+# along the way wraps its steps in ``phase(name)``, which adds to the
+# current trace and does nothing when there is none (crons, shell).
+
+import threading
+import time
+
+_local = threading.local()
+
+
+class RequestTrace:
+    """Seconds spent per phase since the trace started"""
+
+    __slots__ = ('name', 'started', 'phases')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def timings(self):
+        """Milliseconds per phase, with the total and the time outside any phase"""
+        total = self.elapsed()
+        timings = {phase: round(seconds * 1000, 2) for phase, seconds in self.phases.items()}
+        timings['other'] = round(max(total - sum(self.phases.values()), 0.0) * 1000, 2)
+        timings['total'] = round(total * 1000, 2)
+        return timings
+
+
+class phase:
+    """Context manager adding its duration to ``name`` in the current trace"""
+
+    __slots__ = ('name', 'trace', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = getattr(_local, 'trace', None)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.trace is not None:
+            self.trace.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def start_trace(name):
+    """Open a trace on this thread, replacing any previous one"""
+    trace = _local.trace = RequestTrace(name)
+    return trace
+
+
+def end_trace(trace):
+    """Close ``trace`` if it is still the current one"""
+    if getattr(_local, 'trace', None) is trace:
+        _local.trace = None
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
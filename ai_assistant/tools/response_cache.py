@@ -0,0 +1,122 @@
+# response_cache.py
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from . import invalidation
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt):
+    """Case- and whitespace-insensitive form of a prompt, used for cache keys"""
+    return _WHITESPACE.sub(' ', (prompt or '').strip().lower()).rstrip(' ?!.')
+
+
+def make_cache_key(prompt, chatbot_id, context_fingerprint=None):
+    raw = '\x1f'.join([normalize_prompt(prompt), chatbot_id or '', context_fingerprint or ''])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU cache of provider replies with a per-entry TTL"""
+
+    def __init__(self, max_size=1000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate_percent': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            }
+
+
+# One cache per database in each worker process: the keys do not name the
+# database, and the same prompt to the same chatbot can get different
+# replies in two databases
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(env):
+    """Return this worker's cache for the database of ``env``, or None when caching is disabled"""
+    get_param = env['ai.assistant.config'].get_config_snapshot().get_param
+    if get_param('ai_assistant.response_cache_enabled', 'True') != 'True':
+        return None
+
+    max_size = int(get_param('ai_assistant.response_cache_size', '1000'))
+    ttl = int(get_param('ai_assistant.response_cache_ttl', '3600'))
+
+    dbname = env.cr.dbname
+    with _caches_lock:
+        cache = _caches.get(dbname)
+        if cache is None:
+            invalidation.ensure_listening()
+            cache = _caches[dbname] = ResponseCache(max_size, ttl)
+        else:
+            # Pick up parameter changes without dropping warm entries
+            cache.max_size = max_size
+            cache.ttl = ttl
+        return cache
+
+
+def _on_invalidation(dbname, keys):
+    with _caches_lock:
+        if dbname is None:
+            caches = list(_caches.values())
+        else:
+            caches = [_caches[dbname]] if dbname in _caches else []
+    for cache in caches:
+        if keys is None:
+            cache.clear()
+        else:
+            for key in keys:
+                cache.invalidate(key)
+
+
+invalidation.subscribe('response_cache', _on_invalidation)
@@ -0,0 +1,81 @@
+# tokenizer.py
+#
+# Offline token counting for pre-flight credit estimates. Uses tiktoken
+# when it is installed, otherwise a per-family characters-per-token ratio.
+
+import functools
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Model name prefix -> (tiktoken encoding, fallback characters per token); longest prefix wins
+MODEL_FAMILIES = {
+    'gpt-4o': ('o200k_base', 4.0),
+    'gpt-4': ('cl100k_base', 4.0),
+    'gpt-3.5': ('cl100k_base', 4.0),
+    'claude': (None, 3.5),
+}
+DEFAULT_FAMILY = (None, 4.0)
+
+# Prompts are counted in chunks on these boundaries so that a conversation
+# prefix repeated across messages is only tokenized once
+CHUNK_SIZE = 512
+_BOUNDARY = re.compile(r'\n|(?<=[.!?])\s')
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def get_family(model_name):
+    model_name = (model_name or '').lower()
+    matches = [prefix for prefix in MODEL_FAMILIES if model_name.startswith(prefix)]
+    return MODEL_FAMILIES[max(matches, key=len)] if matches else DEFAULT_FAMILY
+
+
+def _get_encoding(name):
+    if tiktoken is None or name is None:
+        return None
+    with _encodings_lock:
+        if name not in _encodings:
+            try:
+                _encodings[name] = tiktoken.get_encoding(name)
+            except Exception:
+                # Encoding files unavailable offline: fall back to the ratio
+                _encodings[name] = None
+        return _encodings[name]
+
+
+@functools.lru_cache(maxsize=4096)
+def _count_chunk(chunk, encoding_name, chars_per_token):
+    encoding = _get_encoding(encoding_name)
+    if encoding is not None:
+        return len(encoding.encode(chunk, disallowed_special=()))
+    return int(len(chunk) / chars_per_token + 0.999)
+
+
+def _chunks(text):
+    """Split on sentence/line boundaries into pieces of about CHUNK_SIZE characters"""
+    start = 0
+    while start < len(text):
+        end = start + CHUNK_SIZE
+        if end < len(text):
+            boundary = _BOUNDARY.search(text, end)
+            end = boundary.end() if boundary and boundary.end() - end < CHUNK_SIZE else end
+        yield text[start:end]
+        start = end
+
+
+def count_tokens(text, model_name=None):
+    """Number of tokens ``text`` takes for ``model_name``, memoized per chunk"""
+    if not text:
+        return 0
+    encoding_name, chars_per_token = get_family(model_name)
+    return sum(_count_chunk(chunk, encoding_name, chars_per_token) for chunk in _chunks(text))
+
+
+def cache_info():
+    return _count_chunk.cache_info()._asdict()